@@ -0,0 +1,68 @@
+"""
+Académies : rattachement des départements à leur académie.
+
+Aucune des sources ne donne l'académie d'un établissement : elle est déduite
+du code de département (carte académique en vigueur depuis 2020, Caen et
+Rouen réunies en académie de Normandie). Les codes sont acceptés sur deux ou
+trois caractères (« 01 », « 001 », « 02A », « 971 »).
+"""
+
+from functools import lru_cache
+
+ACADEMIES = {
+    'Aix-Marseille': ['04', '05', '13', '84'],
+    'Amiens': ['02', '60', '80'],
+    'Besançon': ['25', '39', '70', '90'],
+    'Bordeaux': ['24', '33', '40', '47', '64'],
+    'Clermont-Ferrand': ['03', '15', '43', '63'],
+    'Corse': ['2A', '2B'],
+    'Créteil': ['77', '93', '94'],
+    'Dijon': ['21', '58', '71', '89'],
+    'Grenoble': ['07', '26', '38', '73', '74'],
+    'Guadeloupe': ['971'],
+    'Guyane': ['973'],
+    'La Réunion': ['974'],
+    'Lille': ['59', '62'],
+    'Limoges': ['19', '23', '87'],
+    'Lyon': ['01', '42', '69'],
+    'Martinique': ['972'],
+    'Mayotte': ['976'],
+    'Montpellier': ['11', '30', '34', '48', '66'],
+    'Nancy-Metz': ['54', '55', '57', '88'],
+    'Nantes': ['44', '49', '53', '72', '85'],
+    'Nice': ['06', '83'],
+    'Normandie': ['14', '27', '50', '61', '76'],
+    'Orléans-Tours': ['18', '28', '36', '37', '41', '45'],
+    'Paris': ['75'],
+    'Poitiers': ['16', '17', '79', '86'],
+    'Reims': ['08', '10', '51', '52'],
+    'Rennes': ['22', '29', '35', '56'],
+    'Strasbourg': ['67', '68'],
+    'Toulouse': ['09', '12', '31', '32', '46', '65', '81', '82'],
+    'Versailles': ['78', '91', '92', '95']
+}
+
+# Index inverse : {code de département (deux caractères, trois outre-mer): académie}
+BY_DEPARTEMENT = {code: academie for academie, codes in ACADEMIES.items() for code in codes}
+
+
+@lru_cache(maxsize=None)
+def normalize_code(code_departement):
+    """Ramène un code de département à sa forme courte (« 001 » -> « 01 », « 02A » -> « 2A », « 1 » -> « 01 »).
+
+    Les codes d'outre-mer gardent leurs trois chiffres (« 971 ») ; un code vide reste vide.
+    """
+    code = (code_departement or '').strip().upper()
+    if not code:
+        return code
+    if code.isdigit():
+        code = code.lstrip('0')
+    elif len(code) == 3 and code.startswith('0'):
+        code = code[1:]
+    return code.zfill(2)
+
+
+@lru_cache(maxsize=None)
+def academie_of(code_departement):
+    """Retourne l'académie d'un code de département, ou None s'il n'est rattaché à aucune."""
+    return BY_DEPARTEMENT.get(normalize_code(code_departement))
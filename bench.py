@@ -0,0 +1,341 @@
+#!/usr/bin/env python3
+"""
+Mesure des performances de la chaîne de construction (create_dataset.py et
+create_references.py) sur des fichiers sources synthétiques.
+
+Pour chaque facteur d'échelle (1 = taille nationale), des CSV reprenant les
+colonnes des schémas des sources (schemas.py) et de geocoding.py (annuaire,
+communes) sont générés, puis chaque étape est chronométrée : lecture en flux
+et traitement des CSV (dont le temps de lecture et de conversion), jointure
+des coordonnées, classement, écriture du JSON et calcul des références et
+des comparaisons. Les fichiers
+sont générés au fil de l'eau puis chaque échelle est mesurée dans un
+processus séparé, de sorte que le pic de mémoire lui soit propre.
+
+Les résultats sont enregistrés en JSON ; `--compare` les confronte à une
+exécution précédente et signale les régressions.
+
+    python bench.py --scales 1 10 100 -o bench_results.json
+    python bench.py --scales 1 --compare bench_results.json
+"""
+
+import argparse
+import contextlib
+import csv
+import io
+import json
+import platform
+import random
+import sys
+import tempfile
+import tracemalloc
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+from pathlib import Path
+
+import create_dataset
+import create_references
+import geocoding
+import instrumentation
+import ranking
+import records
+import schemas
+import serialization
+
+# Nombre d'établissements par an à l'échelle 1 (ordre de grandeur national)
+NATIONAL_SIZE = {
+    'ecoles': 45000,
+    'colleges': 7000,
+    'lycees': 2300
+}
+
+# Années présentes dans chaque fichier synthétique
+YEARS = {
+    'ecoles': ['2020-2021', '2021-2022', '2022-2023'],
+    'colleges': ['2021', '2022', '2023'],
+    'lycees': ['2021', '2022', '2023']
+}
+
+# Part des établissements géolocalisés dans l'annuaire synthétique
+COORDINATES_RATIO = 0.95
+
+# Nombre de communes par département dans les fichiers synthétiques
+COMMUNES_PER_DEPARTEMENT = 1000
+
+# Part des valeurs non renseignées (« NS ») dans les fichiers synthétiques
+MISSING_RATIO = 0.03
+
+# Étapes mesurées, dans l'ordre d'exécution
+STAGES = ('traitement', 'coordonnees', 'classement', 'json', 'references')
+
+# Durée en dessous de laquelle une étape n'est pas comparée (bruit de mesure)
+MIN_COMPARED_DURATION = 0.05
+
+
+def departements():
+    """Retourne la liste synthétique des départements : (code, nom, code région, région)."""
+    codes = [f'{i:02d}' for i in range(1, 96) if i != 20] + ['2A', '2B', '971', '972', '973', '974', '976']
+    return [(code, f'Département {code}', str(10 + i % 18), f'Région {10 + i % 18}')
+            for i, code in enumerate(codes)]
+
+
+def decimal(rng, low, high):
+    """Retourne une valeur décimale à la française, parfois non renseignée."""
+    if rng.random() < MISSING_RATIO:
+        return 'NS'
+    return f'{rng.uniform(low, high):.1f}'.replace('.', ',')
+
+
+def write_csv(filepath, header, rows):
+    """Écrit un fichier CSV au format des fichiers sources (séparateur « ; »).
+
+    Les lignes sont écrites au fil de l'itérateur `rows`. Retourne leur nombre.
+    """
+    count = 0
+    with open(filepath, 'w', encoding='utf-8', newline='') as f:
+        writer = csv.writer(f, delimiter=';')
+        writer.writerow(header)
+        for row in rows:
+            writer.writerow(row)
+            count += 1
+    return count
+
+
+def ecole_rows(rng, uais, depts):
+    """Retourne l'en-tête et un itérateur sur les lignes du fichier IPS des écoles."""
+    header = ['Rentrée scolaire', 'UAI', "Nom de l'établissement", 'Secteur', 'Code région', 'Région',
+              'Code du département', 'Département', 'Code INSEE de la commune', 'Nom de la commune',
+              'IPS', 'IPS national', 'IPS académique', 'IPS départemental']
+
+    def rows():
+        for year in YEARS['ecoles']:
+            for i, uai in enumerate(uais):
+                code, nom, code_region, region = depts[i % len(depts)]
+                yield [year, uai, f'École {i}', 'public' if i % 5 else 'privé sous contrat',
+                       code_region, region, code, nom, f'{code}{i % 1000:03d}', f'Commune {code}-{i % 1000}',
+                       decimal(rng, 60, 150), '103,2', decimal(rng, 95, 110), decimal(rng, 90, 115)]
+
+    return header, rows()
+
+
+def college_rows(rng, uais, depts):
+    """Retourne l'en-tête et un itérateur sur les lignes du fichier brevet."""
+    header = ['Session', 'UAI', "Nom de l'établissement", 'Secteur', 'Code région académique',
+              'Région académique', 'Code département', 'Département', 'Commune', 'Taux de réussite G',
+              'Nb mentions AB G', 'Nb mentions B G', 'Nb mentions TB G', 'Nb candidats G',
+              "Note à l'écrit G", 'Nb mentions global G']
+
+    def rows():
+        for year in YEARS['colleges']:
+            for i, uai in enumerate(uais):
+                code, nom, code_region, region = depts[i % len(depts)]
+                candidats = rng.randint(20, 250)
+                ab, b, tb = (rng.randint(0, candidats // 4) for _ in range(3))
+                yield [year, uai, f'Collège {i}', 'PU' if i % 4 else 'PR', code_region, region, code, nom,
+                       f'Commune {code}-{i % 1000}', decimal(rng, 60, 100), ab, b, tb, candidats,
+                       decimal(rng, 7, 16), ab + b + tb]
+
+    return header, rows()
+
+
+def lycee_rows(rng, uais, depts):
+    """Retourne l'en-tête et un itérateur sur les lignes du fichier bac."""
+    header = ['Année', 'UAI', 'Etablissement', 'Secteur', 'Code région', 'Region', 'Code departement',
+              'Département', 'Code commune', 'Commune', 'Taux de réussite - Gnle', 'Présents - Gnle',
+              'Nombre de mentions TB avec félicitations - G', 'Nombre de mentions TB sans félicitations - G',
+              'Nombre de mentions B - G', 'Nombre de mentions AB - G', 'Taux de réussite - Toutes séries',
+              'Taux de mentions - Toutes séries', "Taux d'accès 2nde-bac", 'Taux de mentions - Gnle']
+
+    def rows():
+        for year in YEARS['lycees']:
+            for i, uai in enumerate(uais):
+                code, nom, code_region, region = depts[i % len(depts)]
+                presents = rng.randint(30, 400)
+                yield [year, uai, f'Lycée {i}', 'public' if i % 3 else 'privé sous contrat', code_region,
+                       region, code, nom, f'{code}{i % 1000:03d}', f'Commune {code}-{i % 1000}',
+                       decimal(rng, 75, 100), presents, rng.randint(0, presents // 20),
+                       rng.randint(0, presents // 8), rng.randint(0, presents // 5),
+                       rng.randint(0, presents // 4), decimal(rng, 75, 100), decimal(rng, 30, 90),
+                       decimal(rng, 60, 98), decimal(rng, 30, 90)]
+
+    return header, rows()
+
+
+def generate_sources(directory, scale, seed=0):
+    """Génère les fichiers sources et l'annuaire à l'échelle `scale` dans `directory`.
+
+    Retourne le nombre de lignes de chaque fichier.
+    """
+    rng = random.Random(seed)
+    depts = departements()
+    generators = {'ecoles': ('E', ecole_rows), 'colleges': ('C', college_rows), 'lycees': ('L', lycee_rows)}
+
+    counts = {}
+    all_uais = []
+    for key, _, filename, _ in create_dataset.SOURCES:
+        suffix, rows_of = generators[key]
+        uais = [f'{i:07d}{suffix}' for i in range(max(1, round(NATIONAL_SIZE[key] * scale)))]
+        counts[key] = write_csv(directory / filename, *rows_of(rng, uais, depts))
+        all_uais.extend(uais)
+
+    rows = ([uai, f'{rng.uniform(41.5, 51):.6f}', f'{rng.uniform(-4.8, 8.2):.6f}']
+            for uai in all_uais if rng.random() < COORDINATES_RATIO)
+    counts['annuaire'] = write_csv(directory / geocoding.ANNUAIRE,
+                                   ['Identifiant_de_l_etablissement', 'latitude', 'longitude'], rows)
+
+    # Communes des fichiers synthétiques (voir `ecole_rows`), pour les établissements hors annuaire
+    rows = ([f'{code}{i:03d}', f'Commune {code}-{i}', code, f'{rng.uniform(41.5, 51):.6f}',
+             f'{rng.uniform(-4.8, 8.2):.6f}'] for code, _, _, _ in depts for i in range(COMMUNES_PER_DEPARTEMENT))
+    counts['communes'] = write_csv(directory / geocoding.COMMUNES, list(geocoding.COMMUNE_COLUMNS.values()), rows)
+    return counts
+
+
+class StageTimer:
+    """Chronomètre des étapes successives (voir instrumentation.RunReport).
+
+    Avec `trace_memory`, le pic d'allocations Python de chaque étape est aussi relevé.
+    """
+
+    def __init__(self, trace_memory=False):
+        self.trace_memory = trace_memory
+        self.report = instrumentation.RunReport('bench')
+
+    @contextlib.contextmanager
+    def stage(self, name):
+        if self.trace_memory:
+            tracemalloc.reset_peak()
+        with self.report.stage(name) as stage:
+            yield stage
+            if self.trace_memory:
+                stage.extra['pic_python_mo'] = round(tracemalloc.get_traced_memory()[1] / (1024 * 1024), 1)
+
+    @property
+    def results(self):
+        return {stage.name: {**stage.measures, **stage.extra} for stage in self.report.stages}
+
+
+def run_stages(directory, trace_memory=False):
+    """Mesure chaque étape de la construction sur les sources de `directory`."""
+    if trace_memory:
+        tracemalloc.start()
+    timer = StageTimer(trace_memory)
+
+    # Lecture et traitement sont entrelacés, comme dans create_dataset.py : les
+    # lots de lignes converties sont traités au fil de la lecture
+    with timer.stage('traitement') as stage, contextlib.redirect_stdout(io.StringIO()):
+        results = {key: create_dataset.process_source(directory / filename, schemas.SCHEMAS[key], process)
+                   for key, _, filename, process in create_dataset.SOURCES}
+        etablissements = records.RecordTable.concat(results[key][0] for key, _, _, _ in create_dataset.SOURCES)
+        stage.extra['duree_lecture'] = round(sum(stats['duree_lecture'] for _, stats, _ in results.values()), 4)
+
+    with timer.stage('coordonnees'):
+        coordinates = geocoding.load_coordinates(directory / geocoding.ANNUAIRE,
+                                                 set(etablissements.column('uai')))
+        communes = geocoding.CommuneIndex.from_file(directory / geocoding.COMMUNES)
+        geocoding.join(etablissements, coordinates, communes)
+
+    with timer.stage('classement'):
+        ranking.rank_etablissements(etablissements)
+
+    with timer.stage('json'):
+        serialization.write_json({'metadata': {}, 'etablissements': etablissements},
+                                 directory / create_dataset.OUTPUT_JSON, stream_key='etablissements')
+
+    with timer.stage('references'):
+        references = create_references.calculate_references(etablissements)
+        create_references.calculate_comparisons(etablissements, references)
+
+    if trace_memory:
+        tracemalloc.stop()
+
+    return {
+        'etablissements': len(etablissements),
+        'etapes': timer.results,
+        'duree_totale': round(sum(stage['duree'] for stage in timer.results.values()), 4),
+        'pic_memoire_mo': instrumentation.peak_memory_mb()
+    }
+
+
+def compare(results, previous, threshold):
+    """Compare deux exécutions ; retourne la liste des régressions (échelle, étape, ancien, nouveau)."""
+    regressions = []
+    for scale, result in results['echelles'].items():
+        before = previous.get('echelles', {}).get(scale)
+        if before is None:
+            continue
+        for name, stage in result['etapes'].items():
+            old = before['etapes'].get(name)
+            if old is None or old['duree'] < MIN_COMPARED_DURATION:
+                continue
+            ratio = stage['duree'] / old['duree']
+            marker = ''
+            if ratio > 1 + threshold:
+                regressions.append((scale, name, old['duree'], stage['duree']))
+                marker = '  <-- régression'
+            print(f"  ×{scale:<6} {name:<12} {old['duree']:8.3f} s -> {stage['duree']:8.3f} s "
+                  f"({ratio:.2f}×){marker}")
+    return regressions
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Mesure des performances de la construction du jeu de données.")
+    parser.add_argument('--scales', type=float, nargs='+', default=[1, 10, 100],
+                        help="facteurs d'échelle, 1 = taille nationale (défaut : 1 10 100)")
+    parser.add_argument('-o', '--output', type=Path, default=Path('bench_results.json'),
+                        help="fichier de résultats JSON (défaut : bench_results.json)")
+    parser.add_argument('--compare', type=Path, default=None,
+                        help="résultats d'une exécution précédente à comparer")
+    parser.add_argument('--threshold', type=float, default=0.2,
+                        help="hausse de durée signalée comme régression (défaut : 0.2, soit +20 %%)")
+    parser.add_argument('--workdir', type=Path, default=None,
+                        help="répertoire des fichiers synthétiques (défaut : répertoire temporaire du système)")
+    parser.add_argument('--trace-memory', action='store_true',
+                        help="mesurer aussi le pic d'allocations Python de chaque étape (tracemalloc, plus lent)")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+
+    results = {
+        'date': datetime.now().isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'plateforme': platform.platform(),
+        'echelles': {}
+    }
+
+    for scale in args.scales:
+        label = f'{scale:g}'
+        print(f"Échelle ×{label}...")
+        with tempfile.TemporaryDirectory(dir=args.workdir) as tmp:
+            directory = Path(tmp)
+            lignes = generate_sources(directory, scale)
+            # Un processus par échelle : le pic de mémoire mesuré lui est propre
+            with ProcessPoolExecutor(max_workers=1) as executor:
+                result = {'lignes': lignes, **executor.submit(run_stages, directory, args.trace_memory).result()}
+        results['echelles'][label] = result
+
+        print(f"  {result['etablissements']} établissements, {sum(result['lignes'].values())} lignes")
+        for name in STAGES:
+            stage = result['etapes'][name]
+            lecture = f", dont lecture {stage['duree_lecture']:.3f} s" if 'duree_lecture' in stage else ''
+            print(f"  - {name:<12} {stage['duree']:8.3f} s  (pic mémoire {stage['pic_memoire_mo']} Mo{lecture})")
+        print(f"  Total: {result['duree_totale']:.3f} s")
+
+    with open(args.output, 'w', encoding='utf-8') as f:
+        json.dump(results, f, ensure_ascii=False, indent=2)
+    print(f"\nRésultats enregistrés: {args.output}")
+
+    if args.compare is not None:
+        with open(args.compare, 'r', encoding='utf-8') as f:
+            previous = json.load(f)
+        print(f"\nComparaison avec {args.compare} ({previous.get('date', '?')}):")
+        regressions = compare(results, previous, args.threshold)
+        if regressions:
+            print(f"{len(regressions)} régression(s) au-delà de +{args.threshold:.0%}")
+            sys.exit(1)
+        print("Aucune régression")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,62 @@
+"""
+Cache disque des étapes de construction (create_dataset.py, create_references.py).
+
+Chaque entrée est un fichier pickle `<nom>.pickle` accompagné de l'empreinte
+de ses entrées : taille, date de modification et hash du contenu des fichiers
+sources, plus une version du code de traitement. Une entrée dont l'empreinte
+ne correspond plus est simplement recalculée puis écrasée.
+"""
+
+import hashlib
+import os
+import pickle
+from pathlib import Path
+
+CACHE_DIR = '.build_cache'
+
+
+def file_fingerprint(filepath):
+    """Retourne l'empreinte (taille, mtime, sha256) d'un fichier."""
+    stat = os.stat(filepath)
+    sha = hashlib.sha256()
+    with open(filepath, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            sha.update(chunk)
+    return (stat.st_size, stat.st_mtime_ns, sha.hexdigest())
+
+
+def code_version(*filepaths):
+    """Retourne une version du code de traitement (hash des fichiers Python donnés)."""
+    sha = hashlib.sha256()
+    for filepath in filepaths:
+        sha.update(Path(filepath).read_bytes())
+    return sha.hexdigest()[:16]
+
+
+def digest(*parts):
+    """Calcule la clé d'une entrée à partir de ses empreintes."""
+    return hashlib.sha256(repr(parts).encode('utf-8')).hexdigest()
+
+
+def load(cache_dir, name, key):
+    """Retourne la valeur en cache pour `name` si sa clé correspond, sinon None."""
+    path = Path(cache_dir) / f'{name}.pickle'
+    try:
+        with open(path, 'rb') as f:
+            entry = pickle.load(f)
+    except (OSError, pickle.UnpicklingError, EOFError):
+        return None
+    if entry.get('key') != key:
+        return None
+    return entry['value']
+
+
+def store(cache_dir, name, key, value):
+    """Enregistre `value` sous `name` (écriture atomique)."""
+    cache_dir = Path(cache_dir)
+    cache_dir.mkdir(parents=True, exist_ok=True)
+    path = cache_dir / f'{name}.pickle'
+    tmp_path = path.with_suffix('.tmp')
+    with open(tmp_path, 'wb') as f:
+        pickle.dump({'key': key, 'value': value}, f, protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(tmp_path, path)
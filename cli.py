@@ -0,0 +1,52 @@
+#!/usr/bin/env python3
+"""
+Point d'entrée unique des scripts du projet.
+
+    python cli.py build --sources data/ --dir out/       # create_dataset.py
+    python cli.py build --dir out/ --only lycees         # reconstruire un seul type
+    python cli.py references --dir out/                  # create_references.py
+    python cli.py serve --dir out/                       # server.py
+    python cli.py versions --dir out/                    # deltas.py
+
+Chaque sous-commande transmet ses arguments au `main` du script
+correspondant (`python cli.py <commande> --help` pour les détails). Le
+module n'est importé qu'une fois la commande choisie : l'aide et les
+commandes légères ne chargent pas la chaîne de construction.
+"""
+
+import argparse
+import importlib
+import sys
+
+# {commande: (module, description)}
+COMMANDS = {
+    'build': ('create_dataset', "construire le jeu de données à partir des sources"),
+    'references': ('create_references', "calculer les références statistiques"),
+    'bench': ('bench', "mesurer les performances de la construction"),
+    'serve': ('server', "servir les fichiers produits et les requêtes en HTTP"),
+    'load-test': ('load_test', "mesurer la tenue en charge du serveur"),
+    'versions': ('deltas', "afficher les versions du jeu de données et leurs changements"),
+    'history': ('history', "afficher l'historique d'un établissement"),
+    'search': ('search_index', "rechercher un établissement par nom ou commune"),
+    'nearby': ('spatial_index', "rechercher les établissements proches d'un point")
+}
+
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+    parser = argparse.ArgumentParser(
+        usage='%(prog)s [-h] commande [arguments...]',
+        description=__doc__.strip().splitlines()[0],
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+        epilog='commandes :\n' + '\n'.join(f'  {name:<12} {description}'
+                                           for name, (_, description) in COMMANDS.items()))
+    parser.add_argument('command', choices=COMMANDS, metavar='commande', help="commande à lancer")
+    args = parser.parse_args(argv[:1])
+
+    module, _ = COMMANDS[args.command]
+    sys.argv[0] = f'{sys.argv[0]} {args.command}'
+    return importlib.import_module(module).main(argv[1:])
+
+
+if __name__ == '__main__':
+    main()
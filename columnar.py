@@ -0,0 +1,201 @@
+"""
+Format colonnaire compact pour le jeu de données des établissements.
+
+Au lieu d'un objet JSON par établissement, le fichier contient un tableau par
+champ (les champs imbriqués comme `scores.ips` sont aplatis). Les champs
+textuels très répétés (type, secteur, région, département, commune...) sont
+encodés par dictionnaire : la colonne contient l'indice de la valeur dans
+`dictionaries[champ]`.
+
+Chaque établissement référence une « forme » (`shapes`) : la liste ordonnée
+des champs qu'il possède. Le décodage reconstruit ainsi exactement les objets
+d'origine, y compris l'ordre des clés et les champs absents (`mentions` pour
+les écoles, `rang` pour les établissements non classés).
+
+Une colonne ne contient que les valeurs des établissements dont la forme a
+ce champ, dans l'ordre des établissements : les champs propres à un type
+(`scores.*` des collèges et lycées, `mentions.*`, `classements.*`) ne sont pas
+complétés de null pour les autres. La position d'une valeur se déduit des
+formes (voir `column_rows`).
+"""
+
+import json
+from pathlib import Path
+
+import serialization
+
+FORMAT_VERSION = 2
+
+# Champs encodés par dictionnaire
+DICTIONARY_COLUMNS = (
+    'type', 'secteur', 'code_region', 'region', 'code_departement',
+    'departement', 'code_insee', 'commune', 'annee'
+)
+
+
+def flatten(record, prefix=''):
+    """Parcourt les champs d'un établissement, les sous-objets étant aplatis (`scores.ips`)."""
+    for key, value in record.items():
+        if isinstance(value, dict):
+            yield from flatten(value, f'{prefix}{key}.')
+        else:
+            yield f'{prefix}{key}', value
+
+
+def encode_table(table):
+    """Encode une `records.RecordTable` colonne par colonne : (formes, colonnes, dictionnaires).
+
+    Le résultat est celui du parcours établissement par établissement de
+    `encode` : formes, colonnes, dictionnaires et valeurs de chaque
+    dictionnaire dans l'ordre de leur première apparition.
+    """
+    shapes, shape_column = table.layout()
+    columns = {}
+    dictionaries = {}
+    first_seen = {}
+    for path in dict.fromkeys(path for shape in shapes for path in shape):
+        present = [path in shape for shape in shapes]
+        values = [value for value, shape in zip(table.column(path), shape_column) if present[shape]]
+        if path in DICTIONARY_COLUMNS:
+            dictionary = [value for value in dict.fromkeys(values) if value is not None]
+            if dictionary:
+                index = {value: code for code, value in enumerate(dictionary)}
+                values = [None if value is None else index[value] for value in values]
+                dictionaries[path] = dictionary
+                # Premier établissement renseigné, puis rang du champ dans sa forme
+                row = column_rows(shapes, shape_column, path)[values.index(0)]
+                first_seen[path] = (row, shapes[shape_column[row]].index(path))
+        columns[path] = values
+
+    dictionaries = {path: dictionaries[path] for path in sorted(dictionaries, key=first_seen.__getitem__)}
+    return shapes, {'_shape': shape_column, **columns}, dictionaries
+
+
+def encode(dataset):
+    """Convertit un dataset (`metadata` + `etablissements`) au format colonnaire.
+
+    Une `records.RecordTable` est encodée directement par colonnes (voir `encode_table`).
+    """
+    etablissements = dataset['etablissements']
+
+    if hasattr(etablissements, 'layout'):
+        shapes, columns, dictionaries = encode_table(etablissements)
+    else:
+        columns = {}
+        dictionaries = {}
+        dictionary_index = {}
+        shapes = []
+        shape_index = {}
+        shape_column = []
+
+        for etab in etablissements:
+            fields = list(flatten(etab))
+
+            shape = tuple(name for name, _ in fields)
+            if shape not in shape_index:
+                shape_index[shape] = len(shapes)
+                shapes.append(list(shape))
+            shape_column.append(shape_index[shape])
+
+            for name, value in fields:
+                if name in DICTIONARY_COLUMNS and value is not None:
+                    index = dictionary_index.setdefault(name, {})
+                    if value not in index:
+                        index[value] = len(index)
+                        dictionaries.setdefault(name, []).append(value)
+                    value = index[value]
+                columns.setdefault(name, []).append(value)
+        columns = {'_shape': shape_column, **columns}
+
+    return {
+        'format': 'columnar',
+        'version': FORMAT_VERSION,
+        'metadata': dataset.get('metadata', {}),
+        'count': len(etablissements),
+        'shapes': shapes,
+        'dictionaries': dictionaries,
+        'columns': columns
+    }
+
+
+def check_format(data):
+    """Lève ValueError si `data` n'est pas au format colonnaire de cette version."""
+    if data.get('format') != 'columnar' or data.get('version') != FORMAT_VERSION:
+        raise ValueError(f"Format colonnaire non supporté: {data.get('format')} v{data.get('version')}")
+
+
+def column_rows(shapes, shape_column, name):
+    """Retourne les positions des établissements dont la forme a le champ `name`.
+
+    La valeur `k` de la colonne `name` est celle de l'établissement `column_rows(...)[k]`.
+    """
+    present = [name in shape for shape in shapes]
+    return [i for i, shape in enumerate(shape_column) if present[shape]]
+
+
+def full_column(data, name):
+    """Retourne la colonne `name` complétée de None pour les établissements qui n'ont pas ce champ.
+
+    Les champs encodés par dictionnaire gardent leurs indices.
+    """
+    columns = data['columns']
+    values = [None] * len(columns['_shape'])
+    for row, value in zip(column_rows(data['shapes'], columns['_shape'], name), columns.get(name, ())):
+        values[row] = value
+    return values
+
+
+def decode(data):
+    """Reconstruit le dataset d'origine à partir du format colonnaire."""
+    check_format(data)
+
+    columns = data['columns']
+    dictionaries = data['dictionaries']
+    shapes = data['shapes']
+
+    # Pré-calculer, pour chaque forme, le chemin de chaque champ
+    paths = [[(name, name.split('.')) for name in shape] for shape in shapes]
+    # Prochaine valeur à lire dans chaque colonne
+    cursors = dict.fromkeys(columns, 0)
+
+    etablissements = []
+    for shape_id in columns['_shape']:
+        etab = {}
+        for name, path in paths[shape_id]:
+            position = cursors[name]
+            cursors[name] = position + 1
+            value = columns[name][position]
+            if value is not None and name in dictionaries:
+                value = dictionaries[name][value]
+            target = etab
+            for key in path[:-1]:
+                target = target.setdefault(key, {})
+            target[path[-1]] = value
+        etablissements.append(etab)
+
+    return {'metadata': data['metadata'], 'etablissements': etablissements}
+
+
+def write(dataset, filepath, compress=()):
+    """Écrit un dataset au format colonnaire (JSON compact, voir serialization.write_json)."""
+    return serialization.write_json(encode(dataset), filepath, compress=compress)
+
+
+def read(filepath):
+    """Lit un fichier au format colonnaire et retourne le dataset reconstruit."""
+    with open(filepath, 'r', encoding='utf-8') as f:
+        return decode(json.load(f))
+
+
+def columnar_path(filepath):
+    """Retourne le fichier colonnaire d'un jeu de données JSON (`x.json` -> `x.columns.json`)."""
+    return Path(filepath).with_suffix('.columns.json')
+
+
+def read_dataset(filepath):
+    """Lit un jeu de données JSON, ou à défaut sa version colonnaire (create_dataset.py --format columnar)."""
+    filepath = Path(filepath)
+    if not filepath.exists() and columnar_path(filepath).exists():
+        return read(columnar_path(filepath))
+    with open(filepath, 'r', encoding='utf-8') as f:
+        return json.load(f)
@@ -2,322 +2,532 @@
 """
 Script pour créer un jeu de données unifié des établissements scolaires français.
 Fusionne les données d'écoles (IPS), collèges (brevet) et lycées (bac).
+
+Les modules des sorties facultatives (tuiles, index, départements, historique,
+delta) ne sont importés que si l'option correspondante est demandée.
 """
 
-import csv
+import argparse
 import json
+import time
 from pathlib import Path
 
-
-def load_csv(filepath, delimiter=';'):
-    """Charge un fichier CSV et retourne une liste de dictionnaires."""
-    with open(filepath, 'r', encoding='utf-8-sig') as f:
-        reader = csv.DictReader(f, delimiter=delimiter)
-        return list(reader)
-
-
-def parse_float(value):
-    """Convertit une valeur en float, retourne None si impossible."""
-    if value is None or value == '' or value == 'NS' or value == 'ND':
-        return None
-    try:
-        return float(value.replace(',', '.'))
-    except (ValueError, AttributeError):
-        return None
-
-
-def parse_int(value):
-    """Convertit une valeur en int, retourne None si impossible."""
-    if value is None or value == '' or value == 'NS' or value == 'ND':
-        return None
-    try:
-        return int(float(value))
-    except (ValueError, AttributeError):
-        return None
-
-
-def process_ecoles(data):
-    """Traite les données des écoles (score IPS)."""
-    etablissements = []
-
-    # Trouver l'année la plus récente
-    annees = set(row.get('Rentrée scolaire', '') for row in data if row.get('Rentrée scolaire'))
-    annee_recente = max(annees) if annees else None
+import academies
+import build_cache
+import columnar
+import geocoding
+import instrumentation
+import ranking
+import records
+import schemas
+import serialization
+
+
+def keep_latest(batches, schema, history=None):
+    """Ne conserve, en une seule passe, que les lignes de la période la plus récente.
+
+    `batches` sont les lots de lignes converties d'un fichier (voir
+    `schemas.SourceSchema.read`) : la période de chaque ligne est lue dans le
+    champ `schema.periode` et les lignes sans `schema.required` sont ignorées.
+    Les établissements déjà retenus sont abandonnés dès qu'une période plus
+    récente apparaît : la mémoire utilisée dépend de la taille de la période
+    retenue, pas du nombre total de lignes.
+
+    Les lignes retenues d'un lot sont ajoutées colonne par colonne, sans
+    construire de dictionnaire par établissement.
+
+    Avec `history` (un `history.HistoryBuilder`), les établissements de toutes
+    les périodes lui sont aussi transmis, dans la même passe.
+
+    Retourne le couple (période retenue, établissements), ces derniers dans une
+    `records.RecordTable` (stockage par colonnes, voir records.py).
+    """
+    periode_recente = None
+    etablissements = records.RecordTable()
+
+    for batch in batches:
+        selection = []
+        for i, (periode, requis) in enumerate(zip(batch[schema.periode], batch[schema.required])):
+            if periode is None:
+                continue
+            ancienne = False
+            if periode_recente is None or periode > periode_recente:
+                periode_recente = periode
+                etablissements = records.RecordTable()
+                selection = []
+            elif periode < periode_recente:
+                if history is None:
+                    continue
+                ancienne = True
+
+            if requis is None:
+                continue
+            if history is not None:
+                history.add(periode, schema.build(batch, i))
+            if not ancienne:
+                selection.append(i)
+
+        if selection:
+            etablissements.extend_columns(
+                schema.paths, [list(map(batch[field].__getitem__, selection)) for field in schema.record_fields])
+
+    return periode_recente, etablissements
+
+
+def process_ecoles(data, history=None):
+    """Traite les données des écoles (score IPS).
+
+    `data` est un itérable de lots de lignes converties (voir `schemas.ECOLES`) ;
+    `history` reçoit toutes les années (voir `keep_latest`).
+    """
+    # Ne garder que l'année la plus récente
+    annee_recente, etablissements = keep_latest(data, schemas.ECOLES, history)
     print(f"    Écoles: année retenue = {annee_recente}")
-
-    for row in data:
-        # Ne garder que l'année la plus récente
-        if row.get('Rentrée scolaire') != annee_recente:
-            continue
-
-        ips = parse_float(row.get('IPS'))
-        if ips is None:
-            continue
-
-        etablissement = {
-            'uai': row.get('UAI', '').strip(),
-            'nom': row.get("Nom de l'établissement", '').strip(),
-            'type': 'ecole',
-            'secteur': 'public' if 'public' in row.get('Secteur', '').lower() else 'prive',
-            'code_region': row.get('Code région', '').strip(),
-            'region': row.get('Région', '').strip(),
-            'code_departement': row.get('Code du département', '').strip(),
-            'departement': row.get('Département', '').strip(),
-            'code_insee': row.get('Code INSEE de la commune', '').strip(),
-            'commune': row.get('Nom de la commune', '').strip(),
-            'annee': row.get('Rentrée scolaire', '').strip(),
-            'scores': {
-                'ips': ips,
-                'ips_national': parse_float(row.get('IPS national')),
-                'ips_academique': parse_float(row.get('IPS académique')),
-                'ips_departemental': parse_float(row.get('IPS départemental'))
-            }
-        }
-        etablissements.append(etablissement)
-
     return etablissements
 
 
-def process_colleges(data):
-    """Traite les données des collèges (brevet)."""
-    etablissements = []
-
-    # Trouver la session la plus récente
-    sessions = set(parse_int(row.get('Session')) for row in data if row.get('Session'))
-    sessions = {s for s in sessions if s is not None}
-    session_recente = max(sessions) if sessions else None
-    print(f"    Collèges: session retenue = {session_recente}")
+def process_colleges(data, history=None):
+    """Traite les données des collèges (brevet).
 
+    `data` est un itérable de lots de lignes converties (voir `schemas.COLLEGES`) ;
+    `history` reçoit toutes les années (voir `keep_latest`).
+    """
     # Garder uniquement la session la plus récente
-    for row in data:
-        session = parse_int(row.get('Session'))
-        if session != session_recente:
-            continue
-
-        uai = row.get('UAI', '').strip()
-        taux_reussite = parse_float(row.get('Taux de réussite G'))
-        if taux_reussite is None:
-            continue
-
-        secteur_raw = row.get('Secteur', '').strip()
-        secteur = 'public' if secteur_raw == 'PU' else 'prive'
-
-        nb_mentions_ab = parse_int(row.get('Nb mentions AB G'))
-        nb_mentions_b = parse_int(row.get('Nb mentions B G'))
-        nb_mentions_tb = parse_int(row.get('Nb mentions TB G'))
-        nb_candidats = parse_int(row.get('Nb candidats G'))
-
-        # Calculer le taux de mentions TB
-        taux_mentions_tb = None
-        if nb_candidats and nb_candidats > 0 and nb_mentions_tb is not None:
-            taux_mentions_tb = round((nb_mentions_tb / nb_candidats) * 100, 2)
-
-        # Score composite pour le classement = taux de réussite × note à l'écrit
-        note_ecrit = parse_float(row.get('Note à l\'écrit G'))
-        score_composite = None
-        if taux_reussite and note_ecrit:
-            score_composite = round(taux_reussite * note_ecrit, 2)
-
-        etablissement = {
-            'uai': uai,
-            'nom': row.get("Nom de l'établissement", '').strip(),
-            'type': 'college',
-            'secteur': secteur,
-            'code_region': row.get('Code région académique', '').strip(),
-            'region': row.get('Région académique', '').strip(),
-            'code_departement': row.get('Code département', '').strip(),
-            'departement': row.get('Département', '').strip(),
-            'code_insee': '',  # Non disponible dans ce fichier
-            'commune': row.get('Commune', '').strip(),
-            'annee': str(session_recente),
-            'scores': {
-                'taux_reussite_brevet': taux_reussite,
-                'taux_mentions_tb': taux_mentions_tb,
-                'score_composite': score_composite,
-                'nb_candidats': nb_candidats,
-                'note_ecrit': note_ecrit
-            },
-            'mentions': {
-                'nb_mentions_ab': nb_mentions_ab,
-                'nb_mentions_b': nb_mentions_b,
-                'nb_mentions_tb': nb_mentions_tb,
-                'nb_mentions_total': parse_int(row.get('Nb mentions global G'))
-            }
-        }
-        etablissements.append(etablissement)
-
+    session_recente, etablissements = keep_latest(data, schemas.COLLEGES, history)
+    print(f"    Collèges: session retenue = {session_recente}")
     return etablissements
 
 
-def process_lycees(data):
-    """Traite les données des lycées (bac)."""
-    etablissements = []
-
-    # Trouver l'année la plus récente
-    annees = set(parse_int(row.get('Année')) for row in data if row.get('Année'))
-    annees = {a for a in annees if a is not None}
-    annee_recente = max(annees) if annees else None
-    print(f"    Lycées: année retenue = {annee_recente}")
+def process_lycees(data, history=None):
+    """Traite les données des lycées (bac).
 
+    `data` est un itérable de lots de lignes converties (voir `schemas.LYCEES`) ;
+    `history` reçoit toutes les années (voir `keep_latest`).
+    """
     # Garder uniquement l'année la plus récente
-    for row in data:
-        annee = parse_int(row.get('Année'))
-        if annee != annee_recente:
-            continue
-
-        uai = row.get('UAI', '').strip()
-        # Utiliser uniquement les données du bac général
-        taux_reussite = parse_float(row.get('Taux de réussite - Gnle'))
-        if taux_reussite is None:
-            continue
-
-        secteur_raw = row.get('Secteur', '').strip().lower()
-        secteur = 'public' if 'public' in secteur_raw else 'prive'
-
-        # Mentions détaillées pour le bac général
-        nb_presents = parse_int(row.get('Présents - Gnle'))
-        nb_tb_fel = parse_int(row.get('Nombre de mentions TB avec félicitations - G'))
-        nb_tb = parse_int(row.get('Nombre de mentions TB sans félicitations - G'))
-        nb_b = parse_int(row.get('Nombre de mentions B - G'))
-        nb_ab = parse_int(row.get('Nombre de mentions AB - G'))
-
-        # Calculer le taux de mentions TB (bac général)
-        taux_mentions_tb = None
-        nb_mentions_tb_total = (nb_tb_fel or 0) + (nb_tb or 0)
-        if nb_presents and nb_presents > 0 and nb_mentions_tb_total > 0:
-            taux_mentions_tb = round((nb_mentions_tb_total / nb_presents) * 100, 2)
-
-        # Score composite pour le classement = taux réussite toutes séries × taux mentions toutes séries
-        taux_reussite_toutes = parse_float(row.get('Taux de réussite - Toutes séries'))
-        taux_mentions_toutes = parse_float(row.get('Taux de mentions - Toutes séries'))
-        score_composite = None
-        if taux_reussite_toutes and taux_mentions_toutes:
-            score_composite = round((taux_reussite_toutes * taux_mentions_toutes) / 100, 2)
-
-        etablissement = {
-            'uai': uai,
-            'nom': row.get('Etablissement', '').strip(),
-            'type': 'lycee',
-            'secteur': secteur,
-            'code_region': row.get('Code région', '').strip(),
-            'region': row.get('Region', '').strip(),
-            'code_departement': row.get('Code departement', '').strip(),
-            'departement': row.get('Département', '').strip(),
-            'code_insee': row.get('Code commune', '').strip(),
-            'commune': row.get('Commune', '').strip(),
-            'annee': str(annee_recente),
-            'scores': {
-                'taux_reussite_bac': taux_reussite,
-                'taux_mentions_tb': taux_mentions_tb,
-                'score_composite': score_composite,
-                'taux_acces_2nde_bac': parse_float(row.get('Taux d\'accès 2nde-bac')),
-                'nb_presents': nb_presents
-            },
-            'mentions': {
-                'taux_mentions': parse_float(row.get('Taux de mentions - Gnle')),
-                'nb_mentions_tb_fel': nb_tb_fel,
-                'nb_mentions_tb': nb_tb,
-                'nb_mentions_b': nb_b,
-                'nb_mentions_ab': nb_ab
-            }
-        }
-        etablissements.append(etablissement)
-
+    annee_recente, etablissements = keep_latest(data, schemas.LYCEES, history)
+    print(f"    Lycées: année retenue = {annee_recente}")
     return etablissements
 
 
-def load_coordinates(filepath):
-    """Charge les coordonnées GPS depuis l'annuaire de l'éducation."""
-    coords = {}
-    with open(filepath, 'r', encoding='utf-8-sig') as f:
-        reader = csv.DictReader(f, delimiter=';')
-        for row in reader:
-            uai = row.get('Identifiant_de_l_etablissement', '').strip()
-            lat = parse_float(row.get('latitude'))
-            lon = parse_float(row.get('longitude'))
-            if uai and lat is not None and lon is not None:
-                coords[uai] = {'latitude': lat, 'longitude': lon}
-    return coords
-
-
-def main():
-    base_path = Path(__file__).parent
-
-    print("Chargement des fichiers...")
+def process_source(filepath, schema, process, with_history=False):
+    """Traite un fichier source en flux et mesure le débit et la mémoire.
+
+    Les lignes sont lues et converties par lots selon `schema` (voir
+    schemas.py ; SchemaError si le fichier n'y correspond plus), puis passées
+    à `process` (une des fonctions `process_*`) : seul l'état de la période
+    retenue reste en mémoire, plus, avec `with_history`, les séries de toutes
+    les années.
+
+    Retourne le triplet (établissements, statistiques de lecture, historique),
+    l'historique ({type: séries}, voir history.py) valant None sans `with_history`.
+    Les statistiques distinguent le temps passé à lire et convertir le CSV (`duree_lecture`).
+
+    Le pic de mémoire du processus ne redescend jamais : `pic_memoire_cumule_mo`
+    couvre aussi les sources traitées avant celle-ci dans le même processus, et
+    `hausse_pic_memoire_mo` est ce que cette source y a ajouté (0 si elle est
+    restée sous le pic précédent).
+    """
+    nb_lignes = 0
+    duree_lecture = 0.0
+
+    def lots():
+        nonlocal nb_lignes, duree_lecture
+        batches = schema.read(filepath)
+        while True:
+            debut = time.perf_counter()
+            batch = next(batches, None)
+            duree_lecture += time.perf_counter() - debut
+            if batch is None:
+                return
+            nb_lignes += len(batch[schema.periode])
+            yield batch
+
+    builder = None
+    if with_history:
+        import history
+        builder = history.HistoryBuilder()
+    pic_avant = instrumentation.peak_memory_mb()
+    debut = time.perf_counter()
+    etablissements = process(lots(), builder)
+    duree = time.perf_counter() - debut
+
+    stats = {
+        'lignes': nb_lignes,
+        'retenus': len(etablissements),
+        'duree': round(duree, 3),
+        'duree_lecture': round(duree_lecture, 3),
+        'lignes_par_seconde': round(nb_lignes / duree) if duree > 0 else None,
+        'pic_memoire_cumule_mo': instrumentation.peak_memory_mb(),
+        'hausse_pic_memoire_mo': None
+    }
+    if pic_avant is not None:
+        stats['hausse_pic_memoire_mo'] = round(stats['pic_memoire_cumule_mo'] - pic_avant, 1)
+    return etablissements, stats, builder.to_dict() if builder is not None else None
+
+
+def record_source_stages(report, name, stage_name, result, measures):
+    """Ajoute au rapport les étapes d'un fichier source (mesures None : lu depuis le cache)."""
+    if measures is None:
+        report.record(stage_name, 0, 0, rows_out=result[1]['retenus'], cache=True)
+        return
+
+    stats = result[1]
+    # Lecture et traitement sont entrelacés (flux) : le temps CPU couvre les deux
+    report.record(f'load_csv/{name}', stats['duree_lecture'], None, rows_out=stats['lignes'])
+    report.record(stage_name, round(measures['duree'] - stats['duree_lecture'], 4), measures['cpu'],
+                  rows_in=stats['lignes'], rows_out=stats['retenus'], pic_memoire_mo=measures['pic_memoire_mo'],
+                  hausse_pic_memoire_mo=stats['hausse_pic_memoire_mo'])
+
+
+def print_source_stats(label, stats, cached=False):
+    """Affiche les statistiques de lecture d'un fichier source."""
+    if cached:
+        print(f"  - {label}: {stats['retenus']} retenues (cache, fichier inchangé)")
+        return
+    memoire = 'pic mémoire n/d'
+    if stats['pic_memoire_cumule_mo'] is not None:
+        memoire = (f"pic mémoire cumulé {stats['pic_memoire_cumule_mo']} Mo, "
+                   f"+{stats['hausse_pic_memoire_mo']} Mo pour ce fichier")
+    print(f"  - {label}: {stats['lignes']} lignes, {stats['retenus']} retenues "
+          f"({stats['lignes_par_seconde']} lignes/s, {memoire})")
+
+
+# Fichiers sources : (clé, libellé, fichier, fonction de traitement)
+SOURCES = [
+    ('ecoles', 'Écoles', 'fr-en-ips-ecoles-ap2022.csv', process_ecoles),
+    ('colleges', 'Collèges', 'fr-en-indicateurs-valeur-ajoutee-colleges.csv', process_colleges),
+    ('lycees', 'Lycées', 'fr-en-indicateurs-de-resultat-des-lycees-gt_v2.csv', process_lycees),
+]
+
+# Libellés des types d'établissement
+TYPE_LABELS = {'ecole': 'Écoles', 'college': 'Collèges', 'lycee': 'Lycées'}
+
+# Type d'établissement de chaque source
+SOURCE_TYPES = {key: schemas.SCHEMAS[key].constants['type'] for key, _, _, _ in SOURCES}
+
+# Fichiers produits
+OUTPUT_JSON = 'etablissements_france.json'
+OUTPUT_COLUMNAR = 'etablissements_france.columns.json'
+OUTPUT_TILES = 'tiles'
+OUTPUT_SPATIAL_INDEX = 'etablissements_france.spatial.json'
+OUTPUT_SEARCH_INDEX = 'etablissements_france.search.json'
+OUTPUT_SHARDS = 'shards'
+OUTPUT_HISTORY = 'etablissements_france.history.json'
+
+# Répertoire des profils cProfile (option --profile)
+PROFILE_DIR = 'profiles'
+
+
+def load_sources(base_path, jobs=1, cache_dir=None, with_history=False, keys=None,
+                 report=instrumentation.NO_REPORT):
+    """Lit et traite les fichiers de résultats (ceux de `keys`, tous par défaut).
+
+    Avec `jobs` > 1, chaque fichier est traité dans un processus séparé et les
+    résultats sont rassemblés dans l'ordre de SOURCES : le dataset produit est
+    identique à celui d'une exécution séquentielle.
+
+    Avec `cache_dir`, le résultat de chaque fichier est mis en cache sur disque
+    (voir build_cache) et seuls les fichiers modifiés depuis le dernier passage
+    sont relus.
+
+    Avec `with_history`, l'historique de toutes les années est extrait dans la
+    même passe (voir `process_source`).
+
+    Chaque fichier est mesuré (étapes `load_csv/<clé>` et `process_<clé>` de
+    `report`), y compris dans les processus de travail.
+
+    Retourne le couple ({clé: (établissements, statistiques, historique)},
+    noms des sources lues depuis le cache).
+    """
+    tasks = {key: (process_source, base_path / filename, schemas.SCHEMAS[key], process, with_history)
+             for key, _, filename, process in SOURCES if keys is None or key in keys}
+
+    results = {}
+    cache_keys = {}
+    if cache_dir is not None:
+        code = [__file__, records.__file__, schemas.__file__]
+        if with_history:
+            import history
+            # L'historique mis en cache est classé par history.py et ranking.py
+            code += [history.__file__, ranking.__file__]
+        version = build_cache.code_version(*code)
+        for name, (_, filepath, *_) in tasks.items():
+            cache_keys[name] = build_cache.digest(version, name, with_history,
+                                                  build_cache.file_fingerprint(filepath))
+            cached = build_cache.load(cache_dir, name, cache_keys[name])
+            if cached is not None:
+                results[name] = cached
+    from_cache = set(results)
+
+    stage_names = {key: f'process_{key}' for key, _, _, _ in SOURCES}
+
+    pending = {name: task for name, task in tasks.items() if name not in results}
+    measures = {}
+    if jobs <= 1 or len(pending) <= 1:
+        for name, (func, *args) in pending.items():
+            results[name], measures[name] = instrumentation.measured(
+                func, *args, profile_path=report.profile_path(stage_names[name]))
+    else:
+        from concurrent.futures import ProcessPoolExecutor
+        with ProcessPoolExecutor(max_workers=min(jobs, len(pending))) as executor:
+            futures = {name: executor.submit(instrumentation.measured, func, *args,
+                                             profile_path=report.profile_path(stage_names[name]))
+                       for name, (func, *args) in pending.items()}
+            for name, future in futures.items():
+                results[name], measures[name] = future.result()
+
+    for name in tasks:
+        record_source_stages(report, name, stage_names[name], results[name], measures.get(name))
+
+    if cache_dir is not None:
+        for name in pending:
+            build_cache.store(cache_dir, name, cache_keys[name], results[name])
+
+    return results, from_cache
+
+
+def load_geocoding(base_path, uais, cache_dir=None, report=instrumentation.NO_REPORT):
+    """Charge les coordonnées de l'annuaire (établissements `uais` seulement) et l'index des communes.
+
+    L'annuaire est lu après les fichiers de résultats, pour n'en garder que les
+    UAI utiles (voir geocoding.py). Avec `cache_dir`, les deux sont mis en
+    cache ; la clé de l'annuaire tient compte des UAI recherchés.
+
+    Retourne le triplet (coordonnées, index des communes, noms lus depuis le
+    cache), les deux premiers valant None si le fichier correspondant est absent.
+    """
+    # L'index des communes normalise les codes département avec academies.py
+    version = build_cache.code_version(__file__, geocoding.__file__, academies.__file__)
+    uais_digest = build_cache.digest(*sorted(uais))
+    tasks = {
+        'annuaire': ('load_coordinates', base_path / geocoding.ANNUAIRE,
+                     lambda path: geocoding.load_coordinates(path, uais), uais_digest),
+        'communes': ('load_communes', base_path / geocoding.COMMUNES,
+                     geocoding.CommuneIndex.from_file, None)
+    }
 
-    # Charger les données
-    ecoles_data = load_csv(base_path / 'fr-en-ips-ecoles-ap2022.csv')
-    colleges_data = load_csv(base_path / 'fr-en-indicateurs-valeur-ajoutee-colleges.csv')
-    lycees_data = load_csv(base_path / 'fr-en-indicateurs-de-resultat-des-lycees-gt_v2.csv')
+    loaded = {}
+    from_cache = set()
+    for name, (stage_name, filepath, load, extra_key) in tasks.items():
+        if not filepath.exists():
+            loaded[name] = None
+            continue
+        key = None
+        if cache_dir is not None:
+            key = build_cache.digest(version, name, extra_key, build_cache.file_fingerprint(filepath))
+            loaded[name] = build_cache.load(cache_dir, name, key)
+            if loaded[name] is not None:
+                from_cache.add(name)
+                report.record(stage_name, 0, 0, rows_out=len(loaded[name]), cache=True)
+                continue
+        with report.stage(stage_name) as stage:
+            loaded[name] = load(filepath)
+            stage.rows_out = len(loaded[name])
+        if cache_dir is not None:
+            build_cache.store(cache_dir, name, key, loaded[name])
+
+    return loaded['annuaire'], loaded['communes'], from_cache
+
+
+def load_previous(output_dir):
+    """Relit la construction précédente : {clé de source: table des établissements de son type}, ou None.
+
+    Le plus récent de OUTPUT_JSON et OUTPUT_COLUMNAR est relu (le JSON si le
+    fichier colonnaire est d'une version antérieure du format). Le format
+    colonnaire est repris colonne par colonne (voir
+    `records.RecordTable.from_columnar`), sans dictionnaire par établissement.
+    Les établissements repris gardent leurs coordonnées et leurs classements.
+    """
+    existing = [output_dir / name for name in (OUTPUT_JSON, OUTPUT_COLUMNAR) if (output_dir / name).exists()]
+    if not existing:
+        return None
+    existing.sort(key=lambda path: path.stat().st_mtime, reverse=True)
+    for filepath in existing:
+        with open(filepath, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+        # Un fichier colonnaire d'une version antérieure est ignoré au profit du JSON
+        if data.get('format') != 'columnar' or data.get('version') == columnar.FORMAT_VERSION:
+            break
+    else:
+        columnar.check_format(data)
+
+    keys = {type_: key for key, type_ in SOURCE_TYPES.items()}
+    if data.get('format') != 'columnar':
+        tables = {key: records.RecordTable() for key in SOURCE_TYPES}
+        for etab in data['etablissements']:
+            key = keys.get(etab.get('type'))
+            if key is not None:
+                tables[key].append(etab)
+        return tables
+
+    types = data['dictionaries'].get('type', [])
+    rows = {key: [] for key in SOURCE_TYPES}
+    for i, code in enumerate(columnar.full_column(data, 'type')):
+        key = keys.get(types[code]) if code is not None else None
+        if key is not None:
+            rows[key].append(i)
+    return {key: records.RecordTable.from_columnar(data, rows[key]) for key in SOURCE_TYPES}
+
+
+def zoom_range(value):
+    """Lit l'option --tiles-zoom (voir tiles.parse_zoom_range)."""
+    import tiles
+    return tiles.parse_zoom_range(value)
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip())
+    parser.add_argument('--sources', type=Path, default=None,
+                        help="répertoire des fichiers sources CSV (défaut : celui du script)")
+    parser.add_argument('--dir', type=Path, default=None,
+                        help="répertoire des fichiers produits (défaut : celui du script)")
+    parser.add_argument('--only', choices=[key for key, _, _, _ in SOURCES], default=None,
+                        help="ne reconstruire qu'un type d'établissement, les autres étant repris "
+                             f"de la construction précédente ({OUTPUT_JSON} ou {OUTPUT_COLUMNAR})")
+    parser.add_argument('-j', '--jobs', type=int, default=1,
+                        help="nombre de processus pour lire les fichiers sources (défaut : 1)")
+    parser.add_argument('--cache-dir', type=Path, default=None,
+                        help=f"répertoire du cache des sources (défaut : {build_cache.CACHE_DIR} "
+                             "dans le répertoire des fichiers produits)")
+    parser.add_argument('--no-cache', action='store_true',
+                        help="relire tous les fichiers sources sans utiliser le cache")
+    parser.add_argument('--format', choices=['json', 'columnar', 'all'], default='all',
+                        help=f"format de sortie : {OUTPUT_JSON} (json), "
+                             f"{OUTPUT_COLUMNAR} (columnar) ou les deux (défaut)")
+    parser.add_argument('--indent', action='store_true',
+                        help=f"indenter {OUTPUT_JSON} (lisible mais plus volumineux et plus lent à écrire)")
+    parser.add_argument('--compress', nargs='+', choices=serialization.COMPRESSIONS, default=[],
+                        help="écrire aussi des copies pré-compressées (.json.gz, .json.br) "
+                             "du jeu de données, du format colonnaire, des index et de l'historique")
+    parser.add_argument('--tiles', action='store_true',
+                        help=f"générer aussi les tuiles de la carte dans {OUTPUT_TILES}/")
+    parser.add_argument('--tiles-zoom', type=zoom_range, default=None,
+                        help="niveaux de zoom des tuiles, « min-max » (défaut : "
+                             "plage DEFAULT_MIN_ZOOM-DEFAULT_MAX_ZOOM de tiles.py) ; "
+                             "agrégats jusqu'à max-1, établissements au niveau max")
+    parser.add_argument('--spatial-index', action='store_true',
+                        help=f"générer aussi l'index spatial {OUTPUT_SPATIAL_INDEX}")
+    parser.add_argument('--search-index', action='store_true',
+                        help=f"générer aussi l'index de recherche {OUTPUT_SEARCH_INDEX}")
+    parser.add_argument('--shards', action='store_true',
+                        help=f"générer aussi un fichier par département dans {OUTPUT_SHARDS}/")
+    parser.add_argument('--ranking', choices=ranking.METHODS, default='competition',
+                        help="attribution des rangs aux ex æquo : 1, 2, 2, 4 (competition, défaut) "
+                             "ou 1, 2, 2, 3 (dense)")
+    parser.add_argument('--history', action='store_true',
+                        help=f"conserver toutes les années dans l'historique {OUTPUT_HISTORY}")
+    parser.add_argument('--delta', action='store_true',
+                        help="comparer à la construction précédente et écrire le delta et le manifeste "
+                             "des versions (voir deltas.py)")
+    parser.add_argument('--report', type=Path, default=None,
+                        help="écrire le rapport d'exécution (durée, CPU, lignes, mémoire par étape) en JSON")
+    parser.add_argument('--profile', metavar='ETAPE', default=None,
+                        help="profiler une étape avec cProfile (ex. process_ecoles, ranking, json.dump)")
+    parser.add_argument('--profile-dir', type=Path, default=Path(PROFILE_DIR),
+                        help=f"répertoire des fichiers pstats (défaut : {PROFILE_DIR})")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    source_dir = args.sources or Path(__file__).parent
+    output_dir = args.dir or Path(__file__).parent
+    output_dir.mkdir(parents=True, exist_ok=True)
+    for compression in serialization.missing_compressions(args.compress):
+        print(f"Compression {compression} indisponible (module non installé), ignorée")
+    report = instrumentation.NO_REPORT
+    if args.report or args.profile:
+        report = instrumentation.RunReport('create_dataset', args.profile, args.profile_dir)
+
+    # Construction précédente : types repris (--only) et delta (--delta)
+    previous = None
+    if args.only or args.delta:
+        with report.stage('load_previous') as stage:
+            previous = load_previous(output_dir)
+            stage.rows_out = sum(map(len, previous.values())) if previous is not None else 0
+        if previous is None and args.only:
+            raise SystemExit(f"--only : aucune construction précédente dans {output_dir} "
+                             f"({OUTPUT_JSON} ou {OUTPUT_COLUMNAR})")
+    previous_history = {}
+    if args.only and args.history:
+        import history
+        if (output_dir / OUTPUT_HISTORY).exists():
+            previous_history = history.read(output_dir / OUTPUT_HISTORY).types
+        else:
+            print(f"{OUTPUT_HISTORY} introuvable : l'historique ne contiendra que le type reconstruit")
 
-    print(f"  - Écoles: {len(ecoles_data)} lignes")
-    print(f"  - Collèges: {len(colleges_data)} lignes")
-    print(f"  - Lycées: {len(lycees_data)} lignes")
+    print("Chargement et traitement des fichiers (lecture en flux)...")
 
-    print("\nTraitement des données...")
+    # Lire et traiter chaque type d'établissement en une seule passe,
+    # éventuellement en parallèle (les sources sont indépendantes jusqu'à la jointure)
+    cache_dir = None if args.no_cache else (args.cache_dir or output_dir / build_cache.CACHE_DIR)
+    try:
+        results, from_cache = load_sources(source_dir, jobs=args.jobs, cache_dir=cache_dir,
+                                           with_history=args.history,
+                                           keys=[args.only] if args.only else None, report=report)
+    except schemas.SchemaError as error:
+        raise SystemExit(f"Fichier source non conforme à son schéma (schemas.py) : {error}")
 
-    # Traiter chaque type d'établissement
-    ecoles = process_ecoles(ecoles_data)
-    colleges = process_colleges(colleges_data)
-    lycees = process_lycees(lycees_data)
+    for key, label, _, _ in SOURCES:
+        if key in results:
+            print_source_stats(label, results[key][1], cached=key in from_cache)
 
-    print(f"  - Écoles traitées: {len(ecoles)}")
-    print(f"  - Collèges traités: {len(colleges)}")
-    print(f"  - Lycées traités: {len(lycees)}")
+    # Fusionner les données lues ; seules celles-ci sont géolocalisées et classées
+    fresh = records.RecordTable.concat([results[key][0] for key, _, _, _ in SOURCES if key in results])
 
-    # Charger les coordonnées GPS
+    # Coordonnées GPS : annuaire, à défaut centre de la commune
     print("\nChargement des coordonnées GPS...")
-    annuaire_path = base_path / 'annuaire_education.csv'
-    if annuaire_path.exists():
-        coordinates = load_coordinates(annuaire_path)
-        print(f"  - Coordonnées chargées: {len(coordinates)} établissements")
+    coordinates, communes, geo_cache = load_geocoding(
+        source_dir, set(fresh.column('uai')), cache_dir=cache_dir, report=report)
+    if coordinates is not None:
+        suffix = ' (cache, fichier inchangé)' if 'annuaire' in geo_cache else ''
+        print(f"  - Coordonnées chargées: {len(coordinates)} établissements{suffix}")
     else:
         coordinates = {}
         print("  - Fichier annuaire non trouvé, coordonnées non disponibles")
-
-    # Fusionner toutes les données
-    all_etablissements = ecoles + colleges + lycees
+    if communes is not None:
+        suffix = ' (cache, fichier inchangé)' if 'communes' in geo_cache else ''
+        print(f"  - Centres des communes chargés: {len(communes)} communes{suffix}")
+    else:
+        print(f"  - Fichier {geocoding.COMMUNES} non trouvé, pas de position approximative")
 
     # Ajouter les coordonnées GPS à chaque établissement
-    with_coords = 0
-    for etab in all_etablissements:
-        uai = etab.get('uai', '')
-        if uai in coordinates:
-            etab['latitude'] = coordinates[uai]['latitude']
-            etab['longitude'] = coordinates[uai]['longitude']
-            with_coords += 1
-        else:
-            etab['latitude'] = None
-            etab['longitude'] = None
-
+    with report.stage('join_coordinates', len(fresh)) as stage:
+        fresh_coverage = geocoding.join(fresh, coordinates, communes)
+        stage.rows_out = sum(counts['total'] - counts['sans_coordonnees'] for counts in fresh_coverage.values())
+
+    # Classements national, régional et départemental de chaque métrique
+    with report.stage('ranking', len(fresh)) as stage:
+        classes = ranking.rank_etablissements(fresh, method=args.ranking)
+        stage.rows_out = sum(classes.values())
+
+    # Avec --only, les autres types sont repris tels quels de la construction précédente
+    tables = {key: results[key][0] for key in results}
+    all_etablissements = fresh
+    coverage = fresh_coverage
+    if args.only:
+        tables.update({key: table for key, table in previous.items() if key != args.only})
+        all_etablissements = records.RecordTable.concat(
+            [fresh if key == args.only else tables[key] for key, _, _, _ in SOURCES])
+        reused_coverage = geocoding.coverage_of(
+            etab for key in tables if key != args.only for etab in tables[key].select('type', 'geolocalisation'))
+        coverage = {type_: fresh_coverage.get(type_) or reused_coverage[type_]
+                    for type_ in SOURCE_TYPES.values() if type_ in fresh_coverage or type_ in reused_coverage}
+        print(f"  - Repris de la construction précédente: {len(all_etablissements) - len(fresh)} établissements")
+
+    with_coords = sum(counts['total'] - counts['sans_coordonnees'] for counts in coverage.values())
+    for type_, counts in coverage.items():
+        located = counts['total'] - counts['sans_coordonnees']
+        print(f"  - {TYPE_LABELS.get(type_, type_)}: {located}/{counts['total']} géolocalisés "
+              f"(annuaire {counts['annuaire']}, centre de la commune {counts['commune']})")
     print(f"  - Établissements avec coordonnées: {with_coords}/{len(all_etablissements)} ({100*with_coords//len(all_etablissements)}%)")
 
-    # Calculer le rang pour chaque type d'établissement
     print("\nCalcul des classements...")
-
-    # Écoles : rang basé sur IPS
-    ecoles_with_score = [(e, e['scores']['ips']) for e in ecoles if e['scores'].get('ips') is not None]
-    ecoles_with_score.sort(key=lambda x: x[1], reverse=True)  # Tri décroissant
-    for rank, (etab, _) in enumerate(ecoles_with_score, 1):
-        etab['rang'] = rank
-        etab['total_type'] = len(ecoles_with_score)
-    print(f"  - Écoles classées: {len(ecoles_with_score)}")
-
-    # Collèges : rang basé sur score_composite (réussite × note écrit)
-    colleges_with_score = [(e, e['scores']['score_composite']) for e in colleges if e['scores'].get('score_composite') is not None]
-    colleges_with_score.sort(key=lambda x: x[1], reverse=True)
-    for rank, (etab, _) in enumerate(colleges_with_score, 1):
-        etab['rang'] = rank
-        etab['total_type'] = len(colleges_with_score)
-    print(f"  - Collèges classés: {len(colleges_with_score)}")
-
-    # Lycées : rang basé sur score_composite (réussite toutes séries × mentions toutes séries)
-    lycees_with_score = [(e, e['scores']['score_composite']) for e in lycees if e['scores'].get('score_composite') is not None]
-    lycees_with_score.sort(key=lambda x: x[1], reverse=True)
-    for rank, (etab, _) in enumerate(lycees_with_score, 1):
-        etab['rang'] = rank
-        etab['total_type'] = len(lycees_with_score)
-    print(f"  - Lycées classés: {len(lycees_with_score)}")
+    ranked = {SOURCE_TYPES[key] for key in results}
+    for type_, label in (('ecole', 'Écoles classées'), ('college', 'Collèges classés'), ('lycee', 'Lycées classés')):
+        if type_ in ranked:
+            print(f"  - {label}: {classes.get(type_, 0)}")
 
     # Créer le dataset final
     dataset = {
@@ -328,26 +538,129 @@ def main():
                 'fr-en-indicateurs-valeur-ajoutee-colleges.csv (Résultats brevet)',
                 'fr-en-indicateurs-de-resultat-des-lycees-gt_v2.csv (Résultats bac)',
                 'annuaire_education.csv (Coordonnées GPS)'
-            ],
+            ] + ([f'{geocoding.COMMUNES} (Centres des communes)'] if communes is not None else []),
             'total_etablissements': len(all_etablissements),
             'etablissements_avec_coordonnees': with_coords,
+            'couverture_coordonnees': coverage,
             'par_type': {
-                'ecoles': len(ecoles),
-                'colleges': len(colleges),
-                'lycees': len(lycees)
+                'ecoles': len(tables['ecoles']),
+                'colleges': len(tables['colleges']),
+                'lycees': len(tables['lycees'])
             }
         },
         'etablissements': all_etablissements
     }
 
+    print()
+
+    # Différences avec la construction précédente, relue avant d'être écrasée
+    delta = None
+    if args.delta:
+        import deltas
+        with report.stage('delta', len(all_etablissements)) as stage:
+            delta = deltas.diff(records.RecordTable.concat(previous.values()) if previous else None,
+                                all_etablissements)
+            del previous
+            stage.rows_out = delta['resume']['ajouts'] + delta['resume']['modifications']
+        dataset['metadata']['version'] = delta['vers']
+
     # Sauvegarder en JSON
-    output_path = base_path / 'etablissements_france.json'
-    with open(output_path, 'w', encoding='utf-8') as f:
-        json.dump(dataset, f, ensure_ascii=False, indent=2)
+    if args.format in ('json', 'all'):
+        output_path = output_dir / OUTPUT_JSON
+        with report.stage('json.dump', len(all_etablissements)):
+            written = serialization.write_json(dataset, output_path, indent=2 if args.indent else None,
+                                               stream_key='etablissements', compress=args.compress)
+        print(f"Fichier créé: {', '.join(map(str, written))}")
+
+    # Sauvegarder au format colonnaire compact (chargé en priorité par le front-end)
+    if args.format in ('columnar', 'all'):
+        output_path = output_dir / OUTPUT_COLUMNAR
+        with report.stage('columnar.write', len(all_etablissements)):
+            written = columnar.write(dataset, output_path, compress=args.compress)
+        print(f"Fichier créé: {', '.join(map(str, written))}")
+
+    # Découper en tuiles pour la carte
+    if args.tiles:
+        import tiles
+        min_zoom, max_zoom = args.tiles_zoom or (tiles.DEFAULT_MIN_ZOOM, tiles.DEFAULT_MAX_ZOOM)
+        output_path = output_dir / OUTPUT_TILES
+        with report.stage('tiles', len(all_etablissements)) as stage:
+            nb_tiles = tiles.write_tiles(tiles.build_tiles(all_etablissements, min_zoom, max_zoom),
+                                         output_path, min_zoom, max_zoom, compress=args.compress)
+            stage.rows_out = nb_tiles
+        print(f"Tuiles créées: {nb_tiles} (zoom {min_zoom}-{max_zoom}) dans {output_path}")
+
+    # Index spatial (plus proches voisins, recherche par rayon)
+    if args.spatial_index:
+        import spatial_index
+        output_path = output_dir / OUTPUT_SPATIAL_INDEX
+        with report.stage('spatial_index', len(all_etablissements)) as stage:
+            index = spatial_index.SpatialIndex(
+                all_etablissements.select('uai', 'type', 'secteur', 'latitude', 'longitude'))
+            spatial_index.write_index(index, output_path, compress=args.compress)
+            stage.rows_out = len(index)
+        print(f"Index spatial créé: {output_path} ({len(index)} établissements)")
+
+    # Index de recherche (noms et communes)
+    if args.search_index:
+        import search_index
+        output_path = output_dir / OUTPUT_SEARCH_INDEX
+        with report.stage('search_index', len(all_etablissements)) as stage:
+            index = search_index.build_index(all_etablissements.select('uai', 'type', 'nom', 'commune'))
+            search_index.write_index(index, output_path, compress=args.compress)
+            stage.rows_out = len(index['grams'])
+        print(f"Index de recherche créé: {output_path} ({len(index['grams'])} trigrammes)")
+
+    # Un fichier par département, chargé à la demande par le front-end
+    if args.shards:
+        import shards
+        output_path = output_dir / OUTPUT_SHARDS
+        with report.stage('shards', len(all_etablissements)) as stage:
+            nb_shards = shards.write_shards(all_etablissements, output_path, dataset['metadata'],
+                                            compress=args.compress)
+            stage.rows_out = nb_shards
+        print(f"Départements créés: {nb_shards} fichiers dans {output_path}")
+
+    # Historique de toutes les années (séries par établissement)
+    if args.history:
+        import history
+        output_path = output_dir / OUTPUT_HISTORY
+        with report.stage('history') as stage:
+            parts = []
+            for key, _, _, _ in SOURCES:
+                if key in results:
+                    parts.append(results[key][2])
+                elif SOURCE_TYPES[key] in previous_history:
+                    # Type repris (--only) : séries de l'historique précédent
+                    parts.append({SOURCE_TYPES[key]: previous_history[SOURCE_TYPES[key]]})
+            series = history.merge(*parts)
+            history.write(series, output_path, compress=args.compress)
+            stage.rows_out = sum(len(entry['uai']) for entry in series['types'].values())
+        annees = ', '.join(f"{type_} : {entry['annees'][0]} à {entry['annees'][-1]}"
+                           for type_, entry in series['types'].items() if entry['annees'])
+        print(f"Historique créé: {output_path} ({annees})")
+
+    # Manifeste des versions et delta depuis la construction précédente
+    if delta is not None:
+        written = deltas.write(output_dir, delta, compress=args.compress)
+        resume = delta['resume']
+        if not written:
+            print(f"Version {delta['vers']} inchangée")
+        elif delta['de'] in (None, delta['vers']):
+            print(f"Version {delta['vers']} enregistrée dans {deltas.MANIFEST}")
+        else:
+            print(f"Version {delta['vers']} depuis {delta['de']} : {resume['ajouts']} ajouts, "
+                  f"{resume['suppressions']} suppressions, {resume['modifications']} modifiés "
+                  f"({deltas.delta_name(delta)})")
 
-    print(f"\nFichier créé: {output_path}")
     print(f"Total: {len(all_etablissements)} établissements")
 
+    if args.report:
+        report.write(args.report)
+        print(f"Rapport d'exécution: {args.report}")
+    if args.profile:
+        print(f"Profil de l'étape {args.profile}: {report.profile_path(args.profile)}")
+
 
 if __name__ == '__main__':
     main()
@@ -2,21 +2,74 @@
 """
 Script pour créer un fichier de données de référence (moyennes nationales, régionales, etc.)
 pour permettre la comparaison des établissements.
+
+NumPy, l'historique et les fichiers par département ne sont chargés que
+lorsqu'ils servent (voir `load_numpy`, options --no-history et --no-shards).
 """
 
-import json
+import argparse
+import math
+from bisect import bisect_left, bisect_right
+from importlib.util import find_spec
+from operator import itemgetter
 from pathlib import Path
 from statistics import mean, median, stdev, quantiles
 
+import academies
+import build_cache
+import columnar
+import instrumentation
+import ranking
+import serialization
+
+# NumPy est facultatif, et importé au premier calcul qui l'utilise (voir `load_numpy`)
+np = None
+
 
 def load_dataset(filepath):
-    """Charge le dataset des établissements."""
-    with open(filepath, 'r', encoding='utf-8') as f:
-        return json.load(f)
+    """Charge le dataset des établissements (le format colonnaire sert à défaut du JSON)."""
+    return columnar.read_dataset(filepath)
+
+
+# Seuils de percentiles publiés pour chaque groupe : (clé, percentile 0-100)
+PERCENTILES = [
+    ('top_1', 99),      # Seuil pour être dans le top 1%
+    ('top_5', 95),      # Seuil pour être dans le top 5%
+    ('top_10', 90),     # Seuil pour être dans le top 10%
+    ('top_25', 75),     # Seuil pour être dans le top 25%
+    ('top_50', 50),     # Seuil pour être dans le top 50% (médiane)
+    ('bottom_50', 50),  # Seuil du bottom 50% (en dessous de la médiane)
+    ('bottom_25', 25),  # Seuil du bottom 25%
+    ('bottom_10', 10),  # Seuil du bottom 10%
+    ('bottom_5', 5)     # Seuil du bottom 5%
+]
+
+# En dessous de cette taille de groupe, le calcul en Python pur est plus rapide
+NUMPY_MIN_SIZE = 64
+
+# Utiliser NumPy quand il est installé (désactivable avec --no-numpy)
+USE_NUMPY = find_spec('numpy') is not None
+
+# Rangs de PERCENTILES en tableau NumPy (créé par `load_numpy`)
+PERCENTILE_RANKS = None
+
+
+def load_numpy():
+    """Importe NumPy à sa première utilisation ; retourne le module."""
+    global np, PERCENTILE_RANKS
+    if np is None:
+        import numpy
+        PERCENTILE_RANKS = numpy.array([p for _, p in PERCENTILES], dtype=numpy.int64)
+        np = numpy
+    return np
 
 
 def calculate_stats(values):
-    """Calcule les statistiques pour une liste de valeurs."""
+    """Calcule les statistiques pour une liste de valeurs.
+
+    Utilise NumPy pour les groupes importants quand il est disponible, avec
+    des résultats identiques à ceux du calcul en Python pur.
+    """
     if not values:
         return None
 
@@ -24,6 +77,13 @@ def calculate_stats(values):
     if not values:
         return None
 
+    if USE_NUMPY and len(values) >= NUMPY_MIN_SIZE:
+        return calculate_stats_numpy(values)
+    return calculate_stats_python(values)
+
+
+def calculate_stats_python(values):
+    """Calcule les statistiques d'une liste (non vide, sans None) en Python pur."""
     # Calculer les percentiles pour le classement
     sorted_values = sorted(values)
     n = len(sorted_values)
@@ -44,160 +104,641 @@ def calculate_stats(values):
         'max': round(max(values), 2),
         'ecart_type': round(stdev(values), 2) if len(values) > 1 else 0,
         'effectif': len(values),
-        'percentiles': {
-            'top_1': percentile(99),     # Seuil pour être dans le top 1%
-            'top_5': percentile(95),     # Seuil pour être dans le top 5%
-            'top_10': percentile(90),    # Seuil pour être dans le top 10%
-            'top_25': percentile(75),    # Seuil pour être dans le top 25%
-            'top_50': percentile(50),    # Seuil pour être dans le top 50% (médiane)
-            'bottom_50': percentile(50), # Seuil du bottom 50% (en dessous de la médiane)
-            'bottom_25': percentile(25), # Seuil du bottom 25%
-            'bottom_10': percentile(10), # Seuil du bottom 10%
-            'bottom_5': percentile(5)    # Seuil du bottom 5%
-        }
+        'percentiles': {key: percentile(p) for key, p in PERCENTILES}
     }
 
 
-def calculate_references(etablissements):
-    """Calcule toutes les références statistiques."""
-
-    # Séparer par type
-    ecoles = [e for e in etablissements if e['type'] == 'ecole']
-    colleges = [e for e in etablissements if e['type'] == 'college']
-    lycees = [e for e in etablissements if e['type'] == 'lycee']
+def near_rounding_tie(value, ndigits=2):
+    """Indique si `value` est trop proche d'un arrondi « à mi-chemin » pour être arrondie sans risque."""
+    scaled = abs(value) * 10 ** ndigits
+    return abs(scaled - math.floor(scaled) - 0.5) < 1e-6
+
+
+def calculate_stats_numpy(values):
+    """Calcule les statistiques d'une liste (non vide, sans None de flottants) avec NumPy.
+
+    Tri, moyenne, écart-type et les neuf percentiles sont calculés en quelques
+    appels vectorisés. Les percentiles reprennent exactement les opérations
+    flottantes de `calculate_stats_python`. Moyenne et écart-type NumPy peuvent
+    différer du calcul exact de `statistics` au dernier bit près : s'ils tombent
+    près d'une limite d'arrondi, ils sont recalculés avec `statistics`.
+    """
+    load_numpy()
+    sorted_values = np.sort(np.asarray(values, dtype=np.float64))
+    n = sorted_values.size
+
+    moyenne = float(sorted_values.mean())
+    if near_rounding_tie(moyenne):
+        moyenne = mean(values)
+
+    if n > 1:
+        ecart_type = float(sorted_values.std(ddof=1))
+        if near_rounding_tie(ecart_type):
+            ecart_type = stdev(values)
+        ecart_type = round(ecart_type, 2)
+    else:
+        ecart_type = 0
+
+    if n % 2:
+        mediane = float(sorted_values[n // 2])
+    else:
+        mediane = (float(sorted_values[n // 2 - 1]) + float(sorted_values[n // 2])) / 2
+
+    # Tous les percentiles en un seul appel (même interpolation que le calcul Python)
+    k = (n - 1) * PERCENTILE_RANKS / 100
+    f = k.astype(np.int64)
+    c = np.minimum(f + 1, n - 1)
+    seuils = (sorted_values[f] + (k - f) * (sorted_values[c] - sorted_values[f])).tolist()
 
-    references = {
-        'national': {},
-        'par_region': {},
-        'par_departement': {}
+    return {
+        'moyenne': round(moyenne, 2),
+        'mediane': round(mediane, 2),
+        'min': round(float(sorted_values[0]), 2),
+        'max': round(float(sorted_values[-1]), 2),
+        'ecart_type': ecart_type,
+        'effectif': n,
+        'percentiles': {key: round(seuil, 2) for (key, _), seuil in zip(PERCENTILES, seuils)}
     }
 
-    # === RÉFÉRENCES NATIONALES ===
-
-    # Écoles - IPS
-    ips_all = [e['scores']['ips'] for e in ecoles if e['scores'].get('ips')]
-    ips_public = [e['scores']['ips'] for e in ecoles if e['scores'].get('ips') and e['secteur'] == 'public']
-    ips_prive = [e['scores']['ips'] for e in ecoles if e['scores'].get('ips') and e['secteur'] == 'prive']
 
-    references['national']['ecoles'] = {
-        'ips': {
-            'tous': calculate_stats(ips_all),
-            'public': calculate_stats(ips_public),
-            'prive': calculate_stats(ips_prive)
-        }
+def cached_stats(previous=None):
+    """Retourne une version de calculate_stats mise en cache par groupe.
+
+    Chaque groupe est identifié par le hash de ses valeurs : un groupe dont les
+    valeurs n'ont pas changé depuis le passage précédent (`previous`) n'est pas
+    recalculé. La fonction retournée expose `entries` (le cache à sauvegarder)
+    et `reused` (le nombre de groupes réutilisés).
+    """
+    previous = previous or {}
+    entries = {}
+
+    def stats(values):
+        key = build_cache.digest(values)
+        if key not in entries:
+            if key in previous:
+                entries[key] = previous[key]
+                stats.reused += 1
+            else:
+                entries[key] = calculate_stats(values)
+        return entries[key]
+
+    stats.entries = entries
+    stats.reused = 0
+    return stats
+
+
+def taux_mentions_college(college):
+    """Calcule le taux de mentions (toutes mentions) d'un collège."""
+    mentions = college.get('mentions', {})
+    nb_total = mentions.get('nb_mentions_total')
+    nb_candidats = college['scores'].get('nb_candidats')
+    if nb_total and nb_candidats and nb_candidats > 0:
+        return (nb_total / nb_candidats) * 100
+    return None
+
+
+def field_getter(path):
+    """Retourne l'extracteur du champ `path` (`scores.ips`) d'un établissement."""
+    parent, _, name = path.rpartition('.')
+    if not parent:
+        return lambda e: e.get(name)
+    return lambda e: e[parent].get(name)
+
+
+# Métriques agrégées en plus de la métrique principale : {type: {métrique: extracteur}}
+EXTRA_METRICS = {
+    'college': {
+        'taux_mentions': taux_mentions_college
+    },
+    'lycee': {
+        'taux_mentions': lambda e: e.get('mentions', {}).get('taux_mentions')
     }
+}
 
-    # Collèges - Score composite (réussite × note écrit) - pour classement uniquement
-    score_colleges_all = [e['scores']['score_composite'] for e in colleges if e['scores'].get('score_composite')]
-    score_colleges_public = [e['scores']['score_composite'] for e in colleges if e['scores'].get('score_composite') and e['secteur'] == 'public']
-    score_colleges_prive = [e['scores']['score_composite'] for e in colleges if e['scores'].get('score_composite') and e['secteur'] == 'prive']
-
-    # Calculer le taux de mentions pour les collèges
-    def calcul_taux_mentions_college(college):
-        mentions = college.get('mentions', {})
-        nb_total = mentions.get('nb_mentions_total')
-        nb_candidats = college['scores'].get('nb_candidats')
-        if nb_total and nb_candidats and nb_candidats > 0:
-            return (nb_total / nb_candidats) * 100
-        return None
+# Métriques agrégées par type d'établissement : {type: {métrique: extracteur}}
+# La première est la métrique principale du classement (voir ranking.METRICS).
+METRICS = {
+    type_: {name: field_getter(path), **EXTRA_METRICS.get(type_, {})}
+    for type_, ((name, path), *_) in ranking.METRICS.items()
+}
 
-    taux_mentions_colleges = [calcul_taux_mentions_college(c) for c in colleges]
-    taux_mentions_colleges = [t for t in taux_mentions_colleges if t is not None]
 
-    references['national']['colleges'] = {
-        'score_composite': {
-            'tous': calculate_stats(score_colleges_all),
-            'public': calculate_stats(score_colleges_public),
-            'prive': calculate_stats(score_colleges_prive)
-        },
-        'taux_mentions': {
-            'tous': calculate_stats(taux_mentions_colleges)
-        }
-    }
+def commune_key(e):
+    """Clé de la commune d'un établissement : (code de département, nom en majuscules), ou None.
 
-    # Lycées - Score composite (réussite toutes séries × mentions toutes séries)
-    score_lycees_all = [e['scores']['score_composite'] for e in lycees if e['scores'].get('score_composite')]
-    score_lycees_public = [e['scores']['score_composite'] for e in lycees if e['scores'].get('score_composite') and e['secteur'] == 'public']
-    score_lycees_prive = [e['scores']['score_composite'] for e in lycees if e['scores'].get('score_composite') and e['secteur'] == 'prive']
+    Le nom sert de clé car le code INSEE manque dans certaines sources (collèges).
+    """
+    commune = (e.get('commune') or '').strip()
+    if not commune:
+        return None
+    return (academies.normalize_code(e.get('code_departement')), commune.upper())
 
-    taux_mentions_lycees = [e['mentions']['taux_mentions'] for e in lycees if e.get('mentions', {}).get('taux_mentions')]
 
-    references['national']['lycees'] = {
-        'score_composite': {
-            'tous': calculate_stats(score_lycees_all),
-            'public': calculate_stats(score_lycees_public),
-            'prive': calculate_stats(score_lycees_prive)
-        },
-        'taux_mentions': {
-            'tous': calculate_stats(taux_mentions_lycees)
-        }
-    }
+# Taille des carreaux de la grille de référence (km)
+GRID_SIZE_KM = 5
 
-    # === RÉFÉRENCES PAR RÉGION ===
+# Longueur d'un degré de latitude (km)
+KM_PER_DEGREE = 111.32
 
-    regions = set(e['region'] for e in etablissements if e.get('region'))
 
-    for region in regions:
-        if not region:
+def grid_cell(lat, lon, size_km=GRID_SIZE_KM):
+    """Retourne le carreau (ligne, colonne) contenant un point, ou None sans coordonnées.
+
+    Les lignes découpent la latitude en bandes de `size_km` ; chaque bande est
+    découpée en colonnes de `size_km` à la latitude de son centre, pour des
+    carreaux de surface à peu près constante.
+    """
+    if lat is None or lon is None:
+        return None
+    row = math.floor(lat * KM_PER_DEGREE / size_km)
+    scale = math.cos(math.radians((row + 0.5) * size_km / KM_PER_DEGREE))
+    return row, math.floor(lon * KM_PER_DEGREE * scale / size_km)
+
+
+def cell_center(cell, size_km=GRID_SIZE_KM):
+    """Retourne les coordonnées (latitude, longitude) du centre d'un carreau."""
+    row, col = cell
+    lat = (row + 0.5) * size_km / KM_PER_DEGREE
+    return round(lat, 5), round((col + 0.5) * size_km / (KM_PER_DEGREE * math.cos(math.radians(lat))), 5)
+
+
+# Niveaux d'agrégation emboîtés, du plus large au plus fin :
+# {niveau: fonction retournant la clé de groupe (ou None)}
+LEVELS = {
+    'national': lambda e: 'France',
+    'region': lambda e: e.get('region') or None,
+    'academie': lambda e: academies.academie_of(e.get('code_departement')),
+    'departement': lambda e: (e.get('code_departement'), e.get('departement')) if e.get('departement') else None,
+    'commune': commune_key
+}
+
+# Niveaux hors hiérarchie administrative (grille géographique)
+GRID_LEVELS = {
+    'carreau': lambda e: grid_cell(e.get('latitude'), e.get('longitude'))
+}
+
+# Niveaux publiés dans references.json (les autres vont dans references.local.json)
+MAIN_LEVELS = ('national', 'region', 'academie', 'departement')
+
+# Effectif minimal d'un groupe pour publier ses statistiques, aux niveaux
+# académie, commune et carreau (les niveaux national, régional et
+# départemental restent publiés quel que soit l'effectif)
+MIN_EFFECTIF = 5
+
+
+def merge_buckets(*buckets):
+    """Fusionne plusieurs groupes (listes de valeurs concaténées)."""
+    merged = {}
+    for bucket in buckets:
+        for key, values in bucket.items():
+            merged.setdefault(key, []).extend(values)
+    return merged
+
+
+def roll_up(buckets, parent_of):
+    """Fusionne des groupes dans leurs groupes parents : {clé parente: groupe}.
+
+    `parent_of` donne la clé parente d'une clé (groupe ignoré si elle est vide).
+    Un parent qui n'a qu'un enfant reprend son groupe tel quel, sans copie
+    (copié au deuxième enfant) : les groupes retournés ne doivent pas être
+    modifiés.
+    """
+    parents = {}
+    owned = set()
+    for key, bucket in buckets.items():
+        parent_key = parent_of(key)
+        if not parent_key:
             continue
+        parent = parents.get(parent_key)
+        if parent is None:
+            parents[parent_key] = bucket
+            continue
+        if parent_key not in owned:
+            parent = parents[parent_key] = {group: list(values) for group, values in parent.items()}
+            owned.add(parent_key)
+        for group, values in bucket.items():
+            merged = parent.get(group)
+            if merged is None:
+                parent[group] = list(values)
+            else:
+                merged.extend(values)
+    return parents
+
+
+def group_values(etablissements, levels=LEVELS, grid_levels=GRID_LEVELS):
+    """Répartit, en une seule passe, les valeurs de chaque métrique par groupe.
+
+    Chaque établissement est rangé dans un seul groupe élémentaire, identifié
+    par ses clés à tous les niveaux de `levels` (du plus large au plus fin), et
+    par (type, métrique, secteur). Les groupes élémentaires sont ensuite
+    fusionnés de proche en proche, du niveau le plus fin au plus large : chaque
+    niveau est obtenu à partir du précédent, sans reparcourir les
+    établissements. Les niveaux de `grid_levels`, qui ne s'emboîtent pas dans
+    les autres, sont remplis pendant la même passe.
+
+    Retourne {niveau: {clé: {(type, métrique, secteur): [valeurs]}}}.
+    """
+    names = list(levels)
+    key_functions = list(levels.values())
+    leaves = {}
+    grids = {level: {} for level in grid_levels}
+
+    for e in etablissements:
+        metrics = METRICS.get(e['type'], {})
+        values = [((e['type'], metric, e['secteur']), value)
+                  for metric, extract in metrics.items() if (value := extract(e))]
+
+        buckets = [leaves.setdefault(tuple([key_of(e) for key_of in key_functions]), {})]
+        for level, key_of in grid_levels.items():
+            key = key_of(e)
+            if key:
+                buckets.append(grids[level].setdefault(key, {}))
+        for bucket in buckets:
+            for group, value in values:
+                bucket.setdefault(group, []).append(value)
+
+    # Du plus fin au plus large : `partial` regroupe par clés des niveaux 0 à depth
+    groups = {}
+    partial = leaves
+    for depth in range(len(names) - 1, -1, -1):
+        groups[names[depth]] = roll_up(partial, itemgetter(depth))
+        if depth:
+            partial = roll_up(partial, lambda key: key[:depth])
+    return {**{name: groups[name] for name in names}, **grids}
+
+
+def bucket_values(bucket, type_, metric, secteur=None):
+    """Retourne les valeurs d'un groupe pour un type et une métrique, tous secteurs par défaut."""
+    return [value
+            for (t, m, s), values in bucket.items()
+            if t == type_ and m == metric and (secteur is None or s == secteur)
+            for value in values]
+
+
+def commune_labels(etablissements):
+    """Retourne, pour chaque commune (voir `commune_key`), son nom tel qu'écrit et son code INSEE s'il est connu."""
+    labels = {}
+    for e in etablissements:
+        key = commune_key(e)
+        if key and (key not in labels or not labels[key][1]):
+            labels[key] = (e['commune'].strip(), e.get('code_insee') or None)
+    return labels
+
+
+def calculate_references(etablissements, calculate_stats=calculate_stats, report=instrumentation.NO_REPORT,
+                         local=True, min_effectif=MIN_EFFECTIF):
+    """Calcule toutes les références statistiques.
+
+    Les établissements ne sont parcourus qu'une fois (voir `group_values`),
+    puis les statistiques sont calculées pour chaque groupe. Avec `local`, les
+    références par commune et par carreau de la grille sont ajoutées
+    (`par_commune`, `par_carreau`).
+
+    Aux niveaux académie, commune et carreau, les statistiques d'un type ne
+    sont publiées que pour les groupes d'au moins `min_effectif` valeurs (None
+    sinon) ; les groupes sans aucune statistique publiée sont omis.
+
+    `calculate_stats` peut être remplacée, par exemple par `cached_stats()`.
+    Chaque partie du calcul est une étape de `report` (voir instrumentation.py).
+    """
+    with report.stage('group_values', len(etablissements)) as stage:
+        if local:
+            groups = group_values(etablissements)
+        else:
+            groups = group_values(etablissements, {level: LEVELS[level] for level in MAIN_LEVELS}, {})
+        stage.rows_out = sum(len(keys) for keys in groups.values())
 
-        ecoles_region = [e for e in ecoles if e.get('region') == region]
-        colleges_region = [e for e in colleges if e.get('region') == region]
-        lycees_region = [e for e in lycees if e.get('region') == region]
+    references = {
+        'national': {},
+        'par_region': {},
+        'par_academie': {},
+        'par_departement': {}
+    }
 
-        references['par_region'][region] = {
-            'ecoles': {
-                'ips': calculate_stats([e['scores']['ips'] for e in ecoles_region if e['scores'].get('ips')])
-            },
-            'colleges': {
-                'score_composite': calculate_stats([e['scores']['score_composite'] for e in colleges_region if e['scores'].get('score_composite')])
-            },
-            'lycees': {
-                'score_composite': calculate_stats([e['scores']['score_composite'] for e in lycees_region if e['scores'].get('score_composite')])
+    def main_metrics(bucket, min_effectif=0):
+        """Statistiques de la métrique principale de chaque type pour un groupe."""
+        result = {}
+        for type_, metrics in METRICS.items():
+            metric = next(iter(metrics))
+            values = bucket_values(bucket, type_, metric)
+            result[f'{type_}s'] = {
+                metric: calculate_stats(values) if len(values) >= min_effectif else None
             }
-        }
+        return result
 
-    # === RÉFÉRENCES PAR DÉPARTEMENT ===
+    def published(bucket):
+        """Statistiques d'un groupe soumis à l'effectif minimal (None si aucune n'est publiée)."""
+        result = main_metrics(bucket, min_effectif)
+        if not any(stats for ref in result.values() for stats in ref.values()):
+            return None
+        return result
 
-    departements = set((e.get('code_departement'), e.get('departement')) for e in etablissements if e.get('departement'))
+    # === RÉFÉRENCES NATIONALES ===
 
-    for code_dept, nom_dept in departements:
-        if not nom_dept:
-            continue
+    national = groups['national'].get('France', {})
+    with report.stage('national') as stage:
+        for type_, metrics in METRICS.items():
+            references['national'][f'{type_}s'] = {}
+            for i, metric in enumerate(metrics):
+                stats = {'tous': calculate_stats(bucket_values(national, type_, metric))}
+                # Détail public / privé pour la métrique principale
+                if i == 0:
+                    stats['public'] = calculate_stats(bucket_values(national, type_, metric, 'public'))
+                    stats['prive'] = calculate_stats(bucket_values(national, type_, metric, 'prive'))
+                references['national'][f'{type_}s'][metric] = stats
+        stage.rows_out = 1
 
-        ecoles_dept = [e for e in ecoles if e.get('departement') == nom_dept]
-        colleges_dept = [e for e in colleges if e.get('departement') == nom_dept]
-        lycees_dept = [e for e in lycees if e.get('departement') == nom_dept]
+    # === RÉFÉRENCES PAR RÉGION ===
 
-        key = f"{code_dept}_{nom_dept}" if code_dept else nom_dept
+    with report.stage('par_region', len(groups['region'])) as stage:
+        for region in sorted(groups['region']):
+            references['par_region'][region] = main_metrics(groups['region'][region])
+        stage.rows_out = len(references['par_region'])
 
-        references['par_departement'][key] = {
-            'code': code_dept,
-            'nom': nom_dept,
-            'ecoles': {
-                'ips': calculate_stats([e['scores']['ips'] for e in ecoles_dept if e['scores'].get('ips')])
-            },
-            'colleges': {
-                'score_composite': calculate_stats([e['scores']['score_composite'] for e in colleges_dept if e['scores'].get('score_composite')])
-            },
-            'lycees': {
-                'score_composite': calculate_stats([e['scores']['score_composite'] for e in lycees_dept if e['scores'].get('score_composite')])
+    # === RÉFÉRENCES PAR ACADÉMIE ===
+
+    with report.stage('par_academie', len(groups['academie'])) as stage:
+        for academie in sorted(groups['academie']):
+            ref = published(groups['academie'][academie])
+            if ref is not None:
+                references['par_academie'][academie] = ref
+        stage.rows_out = len(references['par_academie'])
+
+    # === RÉFÉRENCES PAR DÉPARTEMENT ===
+
+    # Les départements sont identifiés par leur nom : un même nom peut apparaître
+    # avec plusieurs codes selon les sources, chaque entrée regroupe alors tous
+    # les établissements portant ce nom.
+    par_nom = {}
+    for (code_dept, nom_dept), bucket in groups['departement'].items():
+        par_nom.setdefault(nom_dept, []).append(bucket)
+
+    with report.stage('par_departement', len(groups['departement'])) as stage:
+        for code_dept, nom_dept in sorted(groups['departement'], key=lambda k: (k[0] or '', k[1])):
+            key = f"{code_dept}_{nom_dept}" if code_dept else nom_dept
+
+            references['par_departement'][key] = {
+                'code': code_dept,
+                'nom': nom_dept,
+                **main_metrics(merge_buckets(*par_nom[nom_dept]))
             }
-        }
+        stage.rows_out = len(references['par_departement'])
+
+    if not local:
+        return references
+
+    # === RÉFÉRENCES PAR COMMUNE ===
+
+    references['par_commune'] = {}
+    labels = commune_labels(etablissements)
+    with report.stage('par_commune', len(groups['commune'])) as stage:
+        for code_dept, commune in sorted(groups['commune']):
+            ref = published(groups['commune'][(code_dept, commune)])
+            if ref is not None:
+                nom, code_insee = labels[(code_dept, commune)]
+                references['par_commune'][f'{code_dept}_{commune}'] = {
+                    'code_departement': code_dept,
+                    'code_insee': code_insee,
+                    'nom': nom,
+                    **ref
+                }
+        stage.rows_out = len(references['par_commune'])
+
+    # === RÉFÉRENCES PAR CARREAU DE LA GRILLE ===
+
+    references['par_carreau'] = {}
+    with report.stage('par_carreau', len(groups['carreau'])) as stage:
+        for cell in sorted(groups['carreau']):
+            ref = published(groups['carreau'][cell])
+            if ref is not None:
+                latitude, longitude = cell_center(cell)
+                references['par_carreau'][f'{cell[0]}_{cell[1]}'] = {
+                    'latitude': latitude,
+                    'longitude': longitude,
+                    **ref
+                }
+        stage.rows_out = len(references['par_carreau'])
 
     return references
 
 
-def main():
-    base_path = Path(__file__).parent
+def references_of_type(references, type_):
+    """Extrait d'un résultat de `calculate_references` les références d'un seul type."""
+    key = f'{type_}s'
+    return {
+        'national': {key: references['national'][key]},
+        'par_region': {region: {key: ref[key]} for region, ref in references['par_region'].items()},
+        'par_departement': {dept: {'code': ref['code'], 'nom': ref['nom'], key: ref[key]}
+                            for dept, ref in references['par_departement'].items()}
+    }
+
+
+def calculate_history_references(hist, calculate_stats=calculate_stats):
+    """Calcule les références de chaque année de l'historique : {type: {année: références}}."""
+    result = {}
+    for type_, entry in hist.types.items():
+        if type_ not in METRICS:
+            continue
+        result[type_] = {
+            annee: references_of_type(
+                calculate_references(list(hist.etablissements(type_, annee)), calculate_stats, local=False), type_)
+            for annee in entry['annees']
+        }
+    return result
+
+
+# Classes de position dans un groupe, dans l'ordre (mêmes règles que Utils.classify, js/utils.js)
+BANDS = ['top_1', 'top_5', 'top_10', 'top_25', 'top_50', 'bottom_50', 'bottom_25', 'bottom_10']
+
+# Niveaux et champs de la table de comparaison : une ligne par établissement,
+# trois valeurs (rang centile, z-score, classe) par niveau
+COMPARISON_LEVELS = ('national', 'region', 'departement')
+COMPARISON_FIELDS = ('percentile', 'z', 'bande')
+
+
+def band_of(value, percentiles):
+    """Retourne l'indice dans BANDS de la classe d'une valeur, d'après les seuils de son groupe."""
+    for index, band in enumerate(BANDS[:5]):
+        if value >= percentiles[band]:
+            return index
+    if value <= percentiles['bottom_10']:
+        return BANDS.index('bottom_10')
+    if value <= percentiles['bottom_25']:
+        return BANDS.index('bottom_25')
+    return BANDS.index('bottom_50')
+
+
+def compare_group(values, percentiles):
+    """Positionne chaque valeur dans son groupe : [(rang centile, z-score, classe)].
+
+    Le groupe est trié une fois ; la position de chaque valeur est ensuite
+    obtenue par recherche dichotomique (en un appel vectorisé avec NumPy). Le
+    rang centile compte les ex æquo pour moitié, comme ranking.py.
+    """
+    n = len(values)
+    if USE_NUMPY and n >= NUMPY_MIN_SIZE:
+        load_numpy()
+        array = np.asarray(values, dtype=np.float64)
+        sorted_values = np.sort(array)
+        below = np.searchsorted(sorted_values, array, 'left').tolist()
+        not_above = np.searchsorted(sorted_values, array, 'right').tolist()
+    else:
+        sorted_values = sorted(values)
+        below = [bisect_left(sorted_values, value) for value in values]
+        not_above = [bisect_right(sorted_values, value) for value in values]
+
+    # Moyenne et écart-type exacts (math.fsum) : identiques avec ou sans NumPy
+    moyenne = math.fsum(values) / n
+    ecart_type = math.sqrt(math.fsum((v - moyenne) ** 2 for v in values) / (n - 1)) if n > 1 else 0
+
+    return [(round(100 * (lo + (hi - lo) / 2) / n, 1),
+             round((value - moyenne) / ecart_type, 2) if ecart_type else None,
+             band_of(value, percentiles))
+            for value, lo, hi in zip(values, below, not_above)]
+
+
+def calculate_comparisons(etablissements, references):
+    """Calcule la position de chaque établissement dans ses groupes de référence.
+
+    Pour la métrique principale de son type et pour chaque niveau de
+    COMPARISON_LEVELS : rang centile, z-score et classe (indice dans BANDS),
+    par rapport au même groupe que `references` (tous secteurs ; départements
+    regroupés par nom). Les établissements sont répartis en un parcours, puis
+    chaque groupe est traité d'un bloc (voir `compare_group`).
+
+    Retourne la table {type: {uai: [valeurs]}}, chaque ligne alignant
+    COMPARISON_FIELDS pour chaque niveau (None hors groupe).
+    """
+    departements = {ref['nom']: ref for ref in references['par_departement'].values()}
+
+    def group_stats(type_, metric, level, key):
+        """Statistiques de référence d'un groupe (None s'il n'en a pas)."""
+        type_key = f'{type_}s'
+        if level == 'national':
+            return references['national'][type_key][metric]['tous']
+        if level == 'region':
+            entry = references['par_region'].get(key)
+        else:
+            entry = departements.get(key)
+        return entry[type_key][metric] if entry else None
+
+    # Un parcours : {(type, niveau, clé): ([positions], [valeurs])}
+    groups = {}
+    table = {}
+    rows = []
+    for e in etablissements:
+        metrics = METRICS.get(e['type'])
+        value = next(iter(metrics.values()))(e) if metrics else None
+        if not value:
+            continue
+        row = [None] * (len(COMPARISON_LEVELS) * len(COMPARISON_FIELDS))
+        table.setdefault(e['type'], {})[e['uai']] = row
+        keys = ('France', e.get('region') or None, e.get('departement') or None)
+        for level, key in zip(COMPARISON_LEVELS, keys):
+            if key:
+                members = groups.setdefault((e['type'], level, key), ([], []))
+                members[0].append(len(rows))
+                members[1].append(value)
+        rows.append(row)
+
+    width = len(COMPARISON_FIELDS)
+    for (type_, level, key), (positions, values) in groups.items():
+        stats = group_stats(type_, next(iter(METRICS[type_])), level, key)
+        if not stats:
+            continue
+        offset = COMPARISON_LEVELS.index(level) * width
+        for position, comparison in zip(positions, compare_group(values, stats['percentiles'])):
+            rows[position][offset:offset + width] = comparison
+
+    return table
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip())
+    parser.add_argument('--dir', type=Path, default=Path(__file__).parent,
+                        help="répertoire du jeu de données (etablissements_france.json) "
+                             "et des références produites (défaut : celui du script)")
+    parser.add_argument('--cache-dir', type=Path, default=None,
+                        help=f"répertoire du cache des groupes (défaut : {build_cache.CACHE_DIR} "
+                             "dans le répertoire du jeu de données)")
+    parser.add_argument('--no-cache', action='store_true',
+                        help="recalculer tous les groupes sans utiliser le cache")
+    parser.add_argument('--no-numpy', action='store_true',
+                        help="calculer les statistiques en Python pur même si NumPy est installé")
+    parser.add_argument('--no-shards', action='store_true',
+                        help="ne pas ajouter les références aux fichiers par département (shards/)")
+    parser.add_argument('--no-history', action='store_true',
+                        help="ne pas calculer les références par année de l'historique "
+                             "(etablissements_france.history.json)")
+    parser.add_argument('--no-comparisons', action='store_true',
+                        help="ne pas calculer la position de chaque établissement dans ses groupes "
+                             "(references.comparaisons.json)")
+    parser.add_argument('--no-local', action='store_true',
+                        help="ne pas calculer les références par commune et par carreau (references.local.json)")
+    parser.add_argument('--min-effectif', type=int, default=MIN_EFFECTIF,
+                        help="effectif minimal d'un groupe pour publier ses statistiques aux niveaux académie, "
+                             f"commune et carreau (défaut : {MIN_EFFECTIF})")
+    parser.add_argument('--indent', action='store_true',
+                        help="indenter references.json (lisible mais plus volumineux)")
+    parser.add_argument('--compress', nargs='+', choices=serialization.COMPRESSIONS, default=[],
+                        help="écrire aussi des copies pré-compressées (.json.gz, .json.br) des références")
+    parser.add_argument('--report', type=Path, default=None,
+                        help="écrire le rapport d'exécution (durée, CPU, lignes, mémoire par étape) en JSON")
+    parser.add_argument('--profile', metavar='ETAPE', default=None,
+                        help="profiler une étape avec cProfile (ex. group_values, par_departement)")
+    parser.add_argument('--profile-dir', type=Path, default=Path('profiles'),
+                        help="répertoire des fichiers pstats (défaut : profiles)")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    global USE_NUMPY
+    args = parse_args(argv)
+    base_path = args.dir
+    if args.no_numpy:
+        USE_NUMPY = False
+    report = instrumentation.NO_REPORT
+    if args.report or args.profile:
+        report = instrumentation.RunReport('create_references', args.profile, args.profile_dir)
 
     print("Chargement du dataset...")
-    dataset = load_dataset(base_path / 'etablissements_france.json')
+    with report.stage('load_dataset') as stage:
+        dataset = load_dataset(base_path / 'etablissements_france.json')
+        stage.rows_out = len(dataset['etablissements'])
     etablissements = dataset['etablissements']
     print(f"  - {len(etablissements)} établissements chargés")
 
+    history_path = base_path / 'etablissements_france.history.json'
+    hist = None
+    if not args.no_history and history_path.exists():
+        import history
+        hist = history.read(history_path)
+
     print("\nCalcul des références...")
-    references = calculate_references(etablissements)
+    if args.no_cache:
+        references = calculate_references(etablissements, report=report, local=not args.no_local,
+                                          min_effectif=args.min_effectif)
+        if hist is not None:
+            with report.stage('history_references'):
+                history_references = calculate_history_references(hist)
+    else:
+        # Les groupes dont les valeurs n'ont pas changé sont repris du cache
+        cache_dir = args.cache_dir or base_path / build_cache.CACHE_DIR
+        # Les métriques principales sont celles de ranking.py
+        version = build_cache.code_version(__file__, ranking.__file__)
+        stats = cached_stats(build_cache.load(cache_dir, 'references', version))
+        references = calculate_references(etablissements, stats, report, local=not args.no_local,
+                                          min_effectif=args.min_effectif)
+        if hist is not None:
+            with report.stage('history_references'):
+                history_references = calculate_history_references(hist, stats)
+        build_cache.store(cache_dir, 'references', version, stats.entries)
+        print(f"  - Groupes: {len(stats.entries)} ({stats.reused} repris du cache)")
+
+    # Références par commune et par carreau : fichier séparé, references.json
+    # restant chargé en entier par l'interface
+    local_references = {level: references.pop(level) for level in ('par_commune', 'par_carreau')
+                        if level in references}
 
     # Ajouter les métadonnées
     output = {
@@ -211,10 +752,63 @@ def main():
 
     # Sauvegarder
     output_path = base_path / 'references.json'
-    with open(output_path, 'w', encoding='utf-8') as f:
-        json.dump(output, f, ensure_ascii=False, indent=2)
-
-    print(f"\nFichier créé: {output_path}")
+    with report.stage('json.dump'):
+        written = serialization.write_json(output, output_path, indent=2 if args.indent else None,
+                                           compress=args.compress)
+
+    print(f"\nFichier créé: {', '.join(map(str, written))}")
+
+    if local_references:
+        output_path = base_path / 'references.local.json'
+        written = serialization.write_json({
+            'metadata': {
+                'description': "Données de référence par commune et par carreau de la grille",
+                'source': 'Calculé à partir de etablissements_france.json',
+                'min_effectif': args.min_effectif,
+                'carreau_km': GRID_SIZE_KM
+            },
+            'references': local_references
+        }, output_path, compress=args.compress)
+        print(f"Fichier créé: {', '.join(map(str, written))}")
+
+    # Références par année, à partir de l'historique
+    if hist is not None:
+        output_path = base_path / 'references.history.json'
+        written = serialization.write_json({
+            'metadata': {
+                'description': "Données de référence par année (historique des établissements)",
+                'source': 'Calculé à partir de etablissements_france.history.json'
+            },
+            'par_type': history_references
+        }, output_path, compress=args.compress)
+        print(f"Fichier créé: {', '.join(map(str, written))}")
+
+    # Position de chaque établissement dans ses groupes (table indexée par UAI)
+    comparaisons = None
+    if not args.no_comparisons:
+        with report.stage('comparisons', len(etablissements)) as stage:
+            comparaisons = calculate_comparisons(etablissements, references)
+            stage.rows_out = sum(len(rows) for rows in comparaisons.values())
+        output_path = base_path / 'references.comparaisons.json'
+        written = serialization.write_json({
+            'version': 1,
+            'metriques': {type_: next(iter(metrics)) for type_, metrics in METRICS.items()},
+            'niveaux': list(COMPARISON_LEVELS),
+            'champs': list(COMPARISON_FIELDS),
+            'bandes': BANDS,
+            'par_type': comparaisons
+        }, output_path, compress=args.compress)
+        print(f"Fichier créé: {', '.join(map(str, written))}")
+
+    # Ajouter les références départementales (et les positions) aux fichiers par département
+    if not args.no_shards:
+        import shards
+        with report.stage('shards') as stage:
+            nb_shards = shards.add_references(base_path / 'shards', references['par_departement'], comparaisons,
+                                              compress=args.compress)
+            stage.rows_out = nb_shards
+        if nb_shards:
+            print(f"Références ajoutées à {nb_shards} fichiers de département")
 
     # Afficher un résumé
     print("\n=== RÉSUMÉ DES MOYENNES NATIONALES ===")
@@ -236,7 +830,17 @@ def main():
     print(f"  - Privé: {nat['lycees']['score_composite']['prive']['moyenne']}")
 
     print(f"\nNombre de régions: {len(references['par_region'])}")
+    print(f"Nombre d'académies: {len(references['par_academie'])}")
     print(f"Nombre de départements: {len(references['par_departement'])}")
+    if local_references:
+        print(f"Communes publiées: {len(local_references['par_commune'])}")
+        print(f"Carreaux de {GRID_SIZE_KM} km publiés: {len(local_references['par_carreau'])}")
+
+    if args.report:
+        report.write(args.report)
+        print(f"\nRapport d'exécution: {args.report}")
+    if args.profile:
+        print(f"Profil de l'étape {args.profile}: {report.profile_path(args.profile)}")
 
 
 if __name__ == '__main__':
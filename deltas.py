@@ -0,0 +1,284 @@
+#!/usr/bin/env python3
+"""
+Différences entre deux constructions du jeu de données (option --delta de create_dataset.py).
+
+Avant d'écraser `etablissements_france.json`, la construction précédente est
+relue (voir create_dataset.load_previous) et comparée à la nouvelle,
+établissement par établissement (clé : type et UAI, un collège et un lycée
+pouvant partager le même UAI). Le delta ne contient que :
+
+- `ajouts` : les établissements nouveaux, complets ;
+- `suppressions` : les clés des établissements disparus ;
+- `modifications` : pour chaque établissement modifié, les champs nouveaux
+  ou changés (`champs`, chemins aplatis comme `scores.ips`, voir
+  columnar.flatten) et les champs disparus (`retires`).
+
+Chaque construction est identifiée par l'empreinte de ses établissements
+(`version`). Le manifeste `etablissements_france.versions.json` liste les
+dernières versions, chacune avec le delta qui y mène depuis la précédente
+(`deltas/<de>_<vers>.json`) et un résumé des changements : un client qui
+connaît sa version applique les deltas successifs (voir `apply`) au lieu de
+tout retélécharger, et repart du fichier complet si sa version n'y figure
+plus.
+"""
+
+import argparse
+import hashlib
+import json
+from datetime import datetime
+from pathlib import Path
+
+import columnar
+import serialization
+
+MANIFEST = 'etablissements_france.versions.json'
+DELTA_DIR = 'deltas'
+FORMAT_VERSION = 1
+
+# Nombre de versions (et de deltas) conservées dans le manifeste
+MAX_VERSIONS = 20
+
+# Champs calculés par le classement (ranking.py) : ils changent pour de
+# nombreux établissements dès qu'un seul score change
+RANKING_FIELDS = ('rang', 'total_type', 'classements.')
+
+# Nombre de champs détaillés par `main`
+TOP_FIELDS = 15
+
+
+def record_keys(etablissements):
+    """Retourne la clé de chaque établissement : « type/UAI » (suffixée « #n » pour un doublon)."""
+    seen = {}
+    keys = []
+    for etab in etablissements:
+        key = f"{etab.get('type')}/{etab.get('uai')}"
+        count = seen[key] = seen.get(key, 0) + 1
+        keys.append(key if count == 1 else f'{key}#{count}')
+    return keys
+
+
+def _identity(key, etab):
+    """Identifie un établissement dans un delta : UAI et type, plus la clé en cas de doublon."""
+    entry = {'uai': etab.get('uai'), 'type': etab.get('type')}
+    if key != f"{entry['type']}/{entry['uai']}":
+        entry['cle'] = key
+    return entry
+
+
+def _key(entry):
+    return entry.get('cle') or f"{entry['type']}/{entry['uai']}"
+
+
+def diff(previous, etablissements):
+    """Compare deux constructions ; retourne le delta de `previous` vers `etablissements`.
+
+    `previous` peut valoir None (pas de construction précédente) : seule la
+    version de `etablissements` est alors calculée (`de` None, pas de changement).
+    Les établissements identiques sont reconnus à leur encodage JSON, sans
+    comparer leurs champs un à un.
+    """
+    before = {}
+    old_version = None
+    if previous is not None:
+        sha = hashlib.sha256()
+        for key, etab in zip(record_keys(previous), previous):
+            encoded = serialization.encode(etab)
+            sha.update(encoded)
+            before[key] = (etab, encoded)
+        old_version = sha.hexdigest()[:16]
+
+    sha = hashlib.sha256()
+    ajouts = []
+    modifications = []
+    champs = {}
+    hors_classements = 0
+    keys = record_keys(etablissements)
+    for key, etab in zip(keys, etablissements):
+        encoded = serialization.encode(etab)
+        sha.update(encoded)
+        if previous is None:
+            continue
+        old = before.pop(key, None)
+        if old is None:
+            ajouts.append(etab)
+            continue
+        if old[1] == encoded:
+            continue
+
+        old_fields = dict(columnar.flatten(old[0]))
+        new_fields = dict(columnar.flatten(etab))
+        changed = {path: value for path, value in new_fields.items()
+                   if path not in old_fields or old_fields[path] != value
+                   or type(old_fields[path]) is not type(value)}
+        retires = [path for path in old_fields if path not in new_fields]
+        if not changed and not retires:
+            continue
+        modification = {**_identity(key, etab), 'champs': changed}
+        if retires:
+            modification['retires'] = retires
+        modifications.append(modification)
+        for path in list(changed) + retires:
+            champs[path] = champs.get(path, 0) + 1
+        if any(not path.startswith(RANKING_FIELDS) for path in list(changed) + retires):
+            hors_classements += 1
+
+    suppressions = [_identity(key, etab) for key, (etab, _) in before.items()]
+
+    return {
+        'format': 'delta',
+        'version': FORMAT_VERSION,
+        'de': old_version,
+        'vers': sha.hexdigest()[:16],
+        'resume': {
+            'etablissements': len(etablissements),
+            'ajouts': len(ajouts),
+            'suppressions': len(suppressions),
+            'modifications': len(modifications),
+            'modifications_hors_classements': hors_classements,
+            'champs': dict(sorted(champs.items(), key=lambda item: (-item[1], item[0])))
+        },
+        'ajouts': ajouts,
+        'suppressions': suppressions,
+        'modifications': modifications
+    }
+
+
+def _set_path(record, path, value):
+    *parents, key = path.split('.')
+    for parent in parents:
+        child = record.get(parent)
+        if not isinstance(child, dict):
+            child = record[parent] = {}
+        record = child
+    record[key] = value
+
+
+def _remove_path(record, path):
+    *parents, key = path.split('.')
+    chain = [record]
+    for parent in parents:
+        record = record.get(parent)
+        if not isinstance(record, dict):
+            return
+        chain.append(record)
+    record.pop(key, None)
+    # Retirer les sous-objets devenus vides
+    for parent, container in zip(reversed(parents), reversed(chain[:-1])):
+        if container[parent]:
+            break
+        del container[parent]
+
+
+def apply(etablissements, delta):
+    """Applique un delta à une liste d'établissements ; retourne la nouvelle liste.
+
+    Les établissements conservés gardent leur ordre, les ajouts sont placés à
+    la fin. `etablissements` n'est pas modifiée.
+    """
+    keys = record_keys(etablissements)
+    removed = {_key(entry) for entry in delta['suppressions']}
+    modified = {_key(entry): entry for entry in delta['modifications']}
+
+    result = []
+    for key, etab in zip(keys, etablissements):
+        if key in removed:
+            continue
+        modification = modified.get(key)
+        if modification is not None:
+            etab = json.loads(json.dumps(etab))
+            for path in modification.get('retires', []):
+                _remove_path(etab, path)
+            for path, value in modification['champs'].items():
+                _set_path(etab, path, value)
+        result.append(etab)
+    result.extend(delta['ajouts'])
+    return result
+
+
+def delta_name(delta):
+    return f"{DELTA_DIR}/{delta['de']}_{delta['vers']}.json"
+
+
+def read_manifest(base_path):
+    """Lit le manifeste des versions ({} s'il n'existe pas)."""
+    filepath = Path(base_path) / MANIFEST
+    if not filepath.exists():
+        return {}
+    with open(filepath, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+def write(base_path, delta, compress=()):
+    """Enregistre une construction : fichier delta (s'il y a une version précédente) et manifeste.
+
+    Une construction identique à la dernière version enregistrée ne crée pas
+    de version.
+    Seules les MAX_VERSIONS dernières versions sont gardées ; les deltas qui
+    n'y mènent plus sont supprimés. Retourne la liste des fichiers écrits.
+    """
+    base_path = Path(base_path)
+    manifest = read_manifest(base_path)
+    versions = manifest.get('versions', [])
+    if versions and versions[-1]['version'] == delta['vers']:
+        return []
+
+    written = []
+    entry = {
+        'version': delta['vers'],
+        'date': datetime.now().isoformat(timespec='seconds'),
+        'etablissements': delta['resume']['etablissements'],
+        'precedente': delta['de'],
+        'delta': None,
+        'resume': None
+    }
+    if delta['de'] not in (None, delta['vers']):
+        (base_path / DELTA_DIR).mkdir(exist_ok=True)
+        entry['delta'] = delta_name(delta)
+        entry['resume'] = {key: value for key, value in delta['resume'].items() if key != 'etablissements'}
+        written.extend(serialization.write_json(delta, base_path / entry['delta'], compress=compress))
+
+    versions = (versions + [entry])[-MAX_VERSIONS:]
+    kept = {version['delta'] for version in versions if version['delta']}
+    if (base_path / DELTA_DIR).exists():
+        for filepath in (base_path / DELTA_DIR).iterdir():
+            name = f'{DELTA_DIR}/{filepath.name}'
+            if not any(name == delta_file or name.startswith(f'{delta_file}.') for delta_file in kept):
+                filepath.unlink()
+
+    written.extend(serialization.write_json({
+        'format': 'versions',
+        'version': FORMAT_VERSION,
+        'courante': delta['vers'],
+        'versions': versions
+    }, base_path / MANIFEST))
+    return written
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Affiche les versions du jeu de données et leurs changements.")
+    parser.add_argument('--dir', type=Path, default=Path(__file__).parent,
+                        help="répertoire des fichiers produits (défaut : celui du script)")
+    parser.add_argument('-n', '--fields', type=int, default=TOP_FIELDS,
+                        help=f"nombre de champs détaillés par version (défaut : {TOP_FIELDS})")
+    args = parser.parse_args(argv)
+
+    manifest = read_manifest(args.dir)
+    if not manifest:
+        raise SystemExit(f"{args.dir / MANIFEST} introuvable (lancer create_dataset.py --delta)")
+
+    for version in manifest['versions']:
+        current = ' (courante)' if version['version'] == manifest['courante'] else ''
+        print(f"{version['version']}{current} - {version['date']} - {version['etablissements']} établissements")
+        resume = version['resume']
+        if resume is None:
+            print("  première version enregistrée")
+            continue
+        print(f"  depuis {version['precedente']} : {resume['ajouts']} ajouts, {resume['suppressions']} suppressions, "
+              f"{resume['modifications']} modifiés dont {resume['modifications_hors_classements']} "
+              f"hors classements ({version['delta']})")
+        for path, count in list(resume['champs'].items())[:args.fields]:
+            print(f"    {path:<45} {count}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,193 @@
+"""
+Géolocalisation des établissements.
+
+1. Annuaire de l'éducation (`annuaire_education.csv`) : le fichier est lu en
+   flux et seules les lignes des UAI recherchés sont conservées.
+2. À défaut, centre de la commune, d'après un fichier de référence local
+   (`communes_france.csv`) : par code INSEE, ou par nom de commune normalisé
+   et code département (voir academies.normalize_code). Les deux index sont construits en une lecture du
+   fichier ; chaque recherche se fait ensuite en temps constant.
+
+Le fichier des communes (séparateur `;` ou `,`) contient au moins les colonnes
+`code_insee`, `nom_standard`, `dep_code`, `latitude_centre` et
+`longitude_centre`, comme l'export « Communes et villes de France » publié sur
+data.gouv.fr. Il est facultatif : sans lui, seul l'annuaire est utilisé.
+
+Chaque établissement reçoit `latitude`, `longitude` et `geolocalisation` :
+'annuaire', 'commune' (position approximative) ou None.
+"""
+
+import csv
+import re
+import unicodedata
+
+import academies
+
+ANNUAIRE = 'annuaire_education.csv'
+COMMUNES = 'communes_france.csv'
+
+# Colonnes du fichier des communes
+COMMUNE_COLUMNS = {
+    'code_insee': 'code_insee',
+    'nom': 'nom_standard',
+    'code_departement': 'dep_code',
+    'latitude': 'latitude_centre',
+    'longitude': 'longitude_centre'
+}
+
+# Origine des coordonnées (champ `geolocalisation`)
+SOURCE_ANNUAIRE = 'annuaire'
+SOURCE_COMMUNE = 'commune'
+
+# Abréviations courantes des noms de communes
+ABBREVIATIONS = {'st': 'saint', 'ste': 'sainte', 'sts': 'saints', 'stes': 'saintes'}
+
+# Article placé en fin de nom : « Havre (Le) »
+TRAILING_ARTICLE = re.compile(r"^(.*)\((le|la|les|l')\)$")
+
+
+def parse_coordinate(value):
+    """Convertit une latitude ou une longitude (virgule décimale acceptée), None si impossible."""
+    if not value:
+        return None
+    try:
+        return float(value.replace(',', '.'))
+    except ValueError:
+        return None
+
+
+def normalize_commune(name):
+    """Normalise un nom de commune : minuscules, sans accents ni ponctuation, abréviations développées.
+
+    « SAINT-ÉTIENNE », « St Etienne » et « Saint-Étienne » donnent tous « saint etienne ».
+    """
+    if not name:
+        return ''
+    text = unicodedata.normalize('NFD', name.strip().lower())
+    text = ''.join(c for c in text if not unicodedata.combining(c))
+    match = TRAILING_ARTICLE.match(text.strip())
+    if match:
+        text = f'{match.group(2)} {match.group(1)}'
+    words = re.sub(r'[^0-9a-z]+', ' ', text).split()
+    return ' '.join(ABBREVIATIONS.get(word, word) for word in words)
+
+
+def iter_rows(filepath):
+    """Parcourt un fichier CSV en flux, le séparateur (`;` ou `,`) étant déduit de l'en-tête."""
+    with open(filepath, 'r', encoding='utf-8-sig', newline='') as f:
+        header = f.readline()
+        f.seek(0)
+        yield from csv.DictReader(f, delimiter=';' if ';' in header else ',')
+
+
+def load_coordinates(filepath, uais=None):
+    """Lit l'annuaire en flux ; retourne {uai: (latitude, longitude)}.
+
+    Avec `uais` (un ensemble), seuls ces établissements sont conservés : la
+    mémoire dépend du nombre d'établissements recherchés, pas de la taille de
+    l'annuaire.
+    """
+    coords = {}
+    for row in iter_rows(filepath):
+        uai = row.get('Identifiant_de_l_etablissement', '').strip()
+        if not uai or (uais is not None and uai not in uais):
+            continue
+        lat = parse_coordinate(row.get('latitude'))
+        lon = parse_coordinate(row.get('longitude'))
+        if lat is not None and lon is not None:
+            coords[uai] = (lat, lon)
+    return coords
+
+
+class CommuneIndex:
+    """Centres des communes, indexés par code INSEE et par (nom normalisé, département)."""
+
+    def __init__(self, communes=()):
+        """`communes` : itérable de (code INSEE, nom, code département, latitude, longitude)."""
+        self.by_insee = {}
+        self.by_name = {}
+        ambiguous = set()
+        for code_insee, nom, code_departement, lat, lon in communes:
+            if lat is None or lon is None:
+                continue
+            position = (lat, lon)
+            if code_insee:
+                self.by_insee[code_insee.strip().upper()] = position
+            key = (normalize_commune(nom), academies.normalize_code(code_departement))
+            if not key[0]:
+                continue
+            # Deux communes homonymes du même département : le nom seul ne suffit pas
+            if key in self.by_name and self.by_name[key] != position:
+                ambiguous.add(key)
+            self.by_name[key] = position
+        for key in ambiguous:
+            del self.by_name[key]
+
+    def __len__(self):
+        return len(self.by_insee)
+
+    @classmethod
+    def from_file(cls, filepath):
+        """Construit l'index à partir du fichier des communes."""
+        columns = COMMUNE_COLUMNS
+        return cls((row.get(columns['code_insee'], ''), row.get(columns['nom'], ''),
+                    row.get(columns['code_departement'], ''),
+                    parse_coordinate(row.get(columns['latitude'])),
+                    parse_coordinate(row.get(columns['longitude'])))
+                   for row in iter_rows(filepath))
+
+    def locate(self, code_insee, commune, code_departement):
+        """Retourne le centre de la commune (latitude, longitude), ou None si elle est inconnue."""
+        if code_insee:
+            position = self.by_insee.get(code_insee.strip().upper())
+            if position is not None:
+                return position
+        return self.by_name.get((normalize_commune(commune), academies.normalize_code(code_departement)))
+
+
+def join(etablissements, coordinates, communes=None):
+    """Ajoute `latitude`, `longitude` et `geolocalisation` à chaque établissement.
+
+    `etablissements` est une `records.RecordTable`, `coordinates` le résultat de
+    `load_coordinates` et `communes` un `CommuneIndex` (ou None). Un seul
+    parcours, chaque recherche se faisant dans un dictionnaire.
+
+    Retourne la couverture par type :
+    {type: {'total', 'annuaire', 'commune', 'sans_coordonnees'}}.
+    """
+    columns = [etablissements.column(path)
+               for path in ('uai', 'type', 'code_insee', 'commune', 'code_departement')]
+    coverage = {}
+
+    for i, (uai, type_, code_insee, commune, code_departement) in enumerate(zip(*columns)):
+        source = SOURCE_ANNUAIRE
+        position = coordinates.get(uai or '')
+        if position is None and communes is not None:
+            source = SOURCE_COMMUNE
+            position = communes.locate(code_insee, commune, code_departement)
+        if position is None:
+            source = None
+            position = (None, None)
+
+        etablissements.set_fields(i, [('latitude', position[0]), ('longitude', position[1]),
+                                      ('geolocalisation', source)])
+        _count(coverage, type_, source)
+
+    return coverage
+
+
+def _count(coverage, type_, source):
+    counts = coverage.get(type_)
+    if counts is None:
+        counts = coverage[type_] = {'total': 0, SOURCE_ANNUAIRE: 0, SOURCE_COMMUNE: 0,
+                                    'sans_coordonnees': 0}
+    counts['total'] += 1
+    counts[source or 'sans_coordonnees'] += 1
+
+
+def coverage_of(etablissements):
+    """Retourne la couverture par type, comme `join`, d'établissements déjà géolocalisés (champ `geolocalisation`)."""
+    coverage = {}
+    for etab in etablissements:
+        _count(coverage, etab.get('type'), etab.get('geolocalisation'))
+    return coverage
@@ -0,0 +1,202 @@
+#!/usr/bin/env python3
+"""
+Historique pluriannuel des établissements (option --history de create_dataset.py).
+
+Les fichiers sources couvrent plusieurs années (rentrées, sessions) mais le
+jeu de données principal ne garde que la plus récente. L'historique conserve
+toutes les années, sous forme de séries par type d'établissement :
+
+- `annees` : les années présentes, triées ;
+- `uai`, `secteur`, `region`, `code_departement`, `departement` : une entrée
+  par établissement (dernière valeur connue) ;
+- `series` : pour chaque métrique (`scores.ips`, `mentions.nb_mentions_tb`...),
+  une liste par établissement, indexée comme `annees` (None si absente) ;
+- `rang` : le rang national de chaque année, même indexation.
+
+L'historique est alimenté pendant la lecture des sources (voir
+`create_dataset.keep_latest`), sans seconde passe sur les fichiers.
+"""
+
+import argparse
+import json
+from pathlib import Path
+
+import ranking
+import serialization
+
+# Champs regroupant les métriques d'un établissement
+METRIC_GROUPS = ('scores', 'mentions')
+
+# Champs descriptifs conservés pour chaque établissement (dernière année connue)
+INFO_FIELDS = ('secteur', 'region', 'code_departement', 'departement')
+
+
+class HistoryBuilder:
+    """Accumule, ligne à ligne, les établissements de toutes les années d'une source.
+
+    Les valeurs sont rangées par métrique puis par période ({ligne: valeur}) :
+    le nombre de dictionnaires dépend des métriques et des années, pas du
+    nombre d'établissements.
+    """
+
+    def __init__(self):
+        self.types = {}
+
+    def add(self, periode, etablissement):
+        """Enregistre un établissement construit pour la période `periode`."""
+        state = self.types.get(etablissement['type'])
+        if state is None:
+            state = self.types[etablissement['type']] = {
+                'rows': {}, 'uai': [], 'info': [], 'info_periode': [], 'values': {}
+            }
+
+        uai = etablissement['uai']
+        row = state['rows'].get(uai)
+        if row is None:
+            row = state['rows'][uai] = len(state['uai'])
+            state['uai'].append(uai)
+            state['info'].append(None)
+            state['info_periode'].append(None)
+        if state['info_periode'][row] is None or periode >= state['info_periode'][row]:
+            state['info'][row] = tuple(etablissement.get(field, '') for field in INFO_FIELDS)
+            state['info_periode'][row] = periode
+
+        for group in METRIC_GROUPS:
+            for key, value in etablissement.get(group, {}).items():
+                by_periode = state['values'].setdefault(f'{group}.{key}', {})
+                by_periode.setdefault(periode, {})[row] = value
+
+    def to_dict(self):
+        """Retourne l'historique sous forme de séries indexées par année."""
+        result = {}
+        for type_, state in self.types.items():
+            periodes = sorted({p for by_periode in state['values'].values() for p in by_periode})
+            series = {
+                metric: [[by_periode.get(p, {}).get(row) for p in periodes]
+                         for row in range(len(state['uai']))]
+                for metric, by_periode in state['values'].items()
+            }
+            entry = {'annees': [str(p) for p in periodes], 'uai': state['uai']}
+            for i, field in enumerate(INFO_FIELDS):
+                entry[field] = [info[i] for info in state['info']]
+            entry['series'] = series
+            _, metric = ranking.primary_metric(type_) or (None, None)
+            entry['rang'] = rank_series(state['values'].get(metric, {}), periodes, len(state['uai']))
+            result[type_] = entry
+        return result
+
+
+def rank_series(by_periode, periodes, nb_rows):
+    """Calcule le rang national de chaque établissement, année par année.
+
+    Les ex æquo partagent le même rang, comme dans le jeu de données principal
+    (voir ranking.py).
+    """
+    ranks = [[None] * len(periodes) for _ in range(nb_rows)]
+    for year, periode in enumerate(periodes):
+        scored = [(row, value) for row, value in by_periode.get(periode, {}).items() if value is not None]
+        positions = ranking.rank_values([value for _, value in scored], [['France']] * len(scored))
+        for (row, _), (position,) in zip(scored, positions):
+            ranks[row][year] = position[0]
+    return ranks
+
+
+def merge(*parts):
+    """Rassemble les historiques de plusieurs sources ({type: séries})."""
+    types = {}
+    for part in parts:
+        if part:
+            types.update(part)
+    return {'version': 1, 'types': types}
+
+
+class History:
+    """Consultation d'un historique produit par `merge`."""
+
+    def __init__(self, data):
+        self.types = data['types']
+        self.rows = {type_: {uai: row for row, uai in enumerate(entry['uai'])}
+                     for type_, entry in self.types.items()}
+
+    def series(self, uai, type_):
+        """Retourne l'historique d'un établissement : {'annees', 'rang', métrique: valeurs}, ou None."""
+        row = self.rows.get(type_, {}).get(uai)
+        if row is None:
+            return None
+        entry = self.types[type_]
+        result = {'annees': entry['annees'], 'rang': entry['rang'][row]}
+        for metric, values in entry['series'].items():
+            result[metric] = values[row]
+        return result
+
+    def rank_deltas(self, uai, type_):
+        """Retourne l'évolution du rang d'une année sur l'autre : [(année, écart)].
+
+        Un écart positif est une progression ; None si l'un des deux rangs manque.
+        """
+        series = self.series(uai, type_)
+        if series is None:
+            return []
+        ranks = series['rang']
+        return [(annee, ranks[i - 1] - ranks[i] if ranks[i - 1] is not None and ranks[i] is not None else None)
+                for i, annee in enumerate(series['annees']) if i > 0]
+
+    def etablissements(self, type_, annee):
+        """Reconstruit les établissements d'un type pour une année (champs de l'historique)."""
+        entry = self.types[type_]
+        year = entry['annees'].index(annee)
+        for row, uai in enumerate(entry['uai']):
+            etablissement = {'uai': uai, 'type': type_}
+            for field in INFO_FIELDS:
+                etablissement[field] = entry[field][row]
+            groups = {group: {} for group in METRIC_GROUPS}
+            present = False
+            for metric, values in entry['series'].items():
+                group, key = metric.split('.', 1)
+                value = values[row][year]
+                groups[group][key] = value
+                present = present or value is not None
+            if present:
+                etablissement.update(groups)
+                yield etablissement
+
+
+def write(history, filepath, compress=()):
+    """Écrit l'historique (JSON compact, voir serialization.write_json)."""
+    return serialization.write_json(history, filepath, compress=compress)
+
+
+def read(filepath):
+    """Lit un historique écrit par `write`."""
+    with open(filepath, 'r', encoding='utf-8') as f:
+        return History(json.load(f))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Affiche l'historique d'un établissement.")
+    parser.add_argument('uai')
+    parser.add_argument('--history', type=Path,
+                        default=Path(__file__).parent / 'etablissements_france.history.json')
+    args = parser.parse_args(argv)
+
+    history = read(args.history)
+    found = False
+    for type_ in history.types:
+        series = history.series(args.uai, type_)
+        if series is None:
+            continue
+        found = True
+        _, metric = ranking.primary_metric(type_) or (None, None)
+        deltas = dict(history.rank_deltas(args.uai, type_))
+        print(f"{args.uai} ({type_})")
+        for i, annee in enumerate(series['annees']):
+            delta = deltas.get(annee)
+            evolution = f" ({delta:+d})" if delta is not None else ''
+            print(f"  {annee:<10} {metric} = {series.get(metric, [None] * len(series['annees']))[i]}"
+                  f"  rang {series['rang'][i]}{evolution}")
+    if not found:
+        print(f"{args.uai} : aucun historique")
+
+
+if __name__ == '__main__':
+    main()
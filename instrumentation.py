@@ -0,0 +1,162 @@
+"""
+Mesure des étapes de construction : durée, temps CPU, lignes en entrée et en
+sortie, pic de mémoire.
+
+Chaque script crée un `RunReport` et entoure ses étapes de `report.stage()` ;
+le rapport est ensuite écrit en JSON (option --report). Une étape peut aussi
+être profilée avec cProfile (option --profile), le résultat étant enregistré
+au format pstats (`python -m pstats <fichier>`).
+
+Sans rapport, les fonctions instrumentées reçoivent `NO_REPORT`, dont les
+étapes ne mesurent rien.
+
+Le pic de mémoire (`pic_memoire_mo`) est celui du processus depuis son
+démarrage (ru_maxrss) : c'est un maximum cumulé, qui inclut les étapes
+précédentes exécutées dans le même processus.
+"""
+
+import contextlib
+import cProfile
+import json
+import platform
+import sys
+import time
+from datetime import datetime
+from pathlib import Path
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+
+def peak_memory_mb():
+    """Retourne le pic de mémoire résidente du processus (Mo), ou None."""
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss est en octets sous macOS, en kilo-octets ailleurs
+    if sys.platform == 'darwin':
+        return round(peak / (1024 * 1024), 1)
+    return round(peak / 1024, 1)
+
+
+@contextlib.contextmanager
+def profiled(filepath):
+    """Profile le bloc avec cProfile et enregistre le résultat dans `filepath` (rien si None)."""
+    if filepath is None:
+        yield
+        return
+    profiler = cProfile.Profile()
+    profiler.enable()
+    try:
+        yield
+    finally:
+        profiler.disable()
+        Path(filepath).parent.mkdir(parents=True, exist_ok=True)
+        profiler.dump_stats(filepath)
+
+
+def measured(func, *args, profile_path=None):
+    """Appelle `func(*args)` et retourne le couple (résultat, mesures).
+
+    Fonction de module, utilisable dans un processus de travail ; avec
+    `profile_path`, l'appel est profilé (voir `profiled`).
+    """
+    wall = time.perf_counter()
+    cpu = time.process_time()
+    with profiled(profile_path):
+        result = func(*args)
+    return result, {
+        'duree': round(time.perf_counter() - wall, 4),
+        'cpu': round(time.process_time() - cpu, 4),
+        'pic_memoire_mo': peak_memory_mb()
+    }
+
+
+class Stage:
+    """Mesures d'une étape ; `rows_out` (et `rows_in`) peuvent être renseignés dans le bloc."""
+
+    def __init__(self, name, rows_in=None):
+        self.name = name
+        self.rows_in = rows_in
+        self.rows_out = None
+        self.measures = {}
+        self.extra = {}
+
+    def to_dict(self):
+        return {'etape': self.name, **self.measures, 'lignes_entree': self.rows_in,
+                'lignes_sortie': self.rows_out, **self.extra}
+
+
+class RunReport:
+    """Rapport d'exécution d'un script : mesures de chaque étape, dans l'ordre."""
+
+    def __init__(self, script, profile_stage=None, profile_dir=None):
+        self.script = script
+        self.profile_stage = profile_stage
+        self.profile_dir = Path(profile_dir or '.')
+        self.started = datetime.now()
+        self.start = time.perf_counter()
+        self.stages = []
+
+    def profile_path(self, name):
+        """Retourne le fichier pstats de l'étape `name` si elle doit être profilée, sinon None."""
+        if self.profile_stage != name:
+            return None
+        return self.profile_dir / f"{name.replace('/', '_')}.pstats"
+
+    @contextlib.contextmanager
+    def stage(self, name, rows_in=None):
+        """Mesure le bloc comme une étape nommée `name`."""
+        stage = Stage(name, rows_in)
+        wall = time.perf_counter()
+        cpu = time.process_time()
+        with profiled(self.profile_path(name)):
+            yield stage
+        stage.measures = {
+            'duree': round(time.perf_counter() - wall, 4),
+            'cpu': round(time.process_time() - cpu, 4),
+            'pic_memoire_mo': peak_memory_mb()
+        }
+        self.stages.append(stage)
+
+    def record(self, name, duree, cpu, rows_in=None, rows_out=None, pic_memoire_mo=None, **extra):
+        """Ajoute une étape mesurée ailleurs (par exemple dans un processus de travail)."""
+        stage = Stage(name, rows_in)
+        stage.rows_out = rows_out
+        stage.measures = {'duree': duree, 'cpu': cpu, 'pic_memoire_mo': pic_memoire_mo}
+        stage.extra = extra
+        self.stages.append(stage)
+
+    def to_dict(self):
+        return {
+            'script': self.script,
+            'debut': self.started.isoformat(timespec='seconds'),
+            'duree_totale': round(time.perf_counter() - self.start, 4),
+            'pic_memoire_mo': peak_memory_mb(),
+            'python': platform.python_version(),
+            'etapes': [stage.to_dict() for stage in self.stages]
+        }
+
+    def write(self, filepath):
+        """Écrit le rapport en JSON."""
+        with open(filepath, 'w', encoding='utf-8') as f:
+            json.dump(self.to_dict(), f, ensure_ascii=False, indent=2)
+
+
+class NullReport:
+    """Rapport inactif : les étapes s'exécutent sans être mesurées."""
+
+    @contextlib.contextmanager
+    def stage(self, name, rows_in=None):
+        yield Stage(name, rows_in)
+
+    def record(self, *args, **kwargs):
+        pass
+
+    def profile_path(self, name):
+        return None
+
+
+NO_REPORT = NullReport()
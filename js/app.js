@@ -5,6 +5,8 @@
 const App = {
     etablissements: [],
     references: null,
+    // Chargement par département (shards/) au lieu du jeu de données complet
+    shardMode: false,
 
     /**
      * Initialise l'application
@@ -17,14 +19,34 @@ const App = {
             // Initialiser la carte
             MapManager.init();
 
+            // Premier affichage à partir des tuiles pré-calculées, si disponibles,
+            // pendant le chargement du jeu de données complet
+            if (await Tiles.init(MapManager.map)) {
+                this.showLoading(false);
+            }
+
             // Charger les données
             await this.loadData();
 
-            // Initialiser les filtres
-            Filters.init(this.etablissements, this.references);
+            if (this.shardMode) {
+                // Les tuiles restent affichées aux zooms où aucun département n'est chargé
+                Tiles.hideFromZoom = Shards.MIN_ZOOM;
+            } else {
+                // Le jeu de données complet remplace les tuiles
+                Tiles.destroy();
+
+                // Charger l'index spatial (établissements les plus proches), s'il existe
+                await SpatialIndex.load(this.etablissements);
+            }
 
-            // Initialiser la recherche
+            // Initialiser les filtres (à partir du manifeste en mode départements)
+            Filters.init(this.shardMode ? Shards.summaryEntries() : this.etablissements, this.references);
+
+            // Initialiser la recherche (avec l'index pré-calculé s'il existe)
             Search.init(this.etablissements);
+            if (!this.shardMode) {
+                await Search.loadIndex();
+            }
 
             // Initialiser le mobile
             this.initMobile();
@@ -35,6 +57,11 @@ const App = {
             // Appliquer les filtres initiaux
             Filters.applyFilters();
 
+            // Charger les départements au fil de la navigation
+            if (this.shardMode) {
+                this.initShards();
+            }
+
             // Cacher le loading
             this.showLoading(false);
 
@@ -50,14 +77,6 @@ const App = {
      * Charge les données JSON
      */
     async loadData() {
-        // Charger les établissements
-        const etablissementsResponse = await fetch('etablissements_france.json');
-        if (!etablissementsResponse.ok) {
-            throw new Error('Impossible de charger etablissements_france.json');
-        }
-        const etablissementsData = await etablissementsResponse.json();
-        this.etablissements = etablissementsData.etablissements;
-
         // Charger les références
         const referencesResponse = await fetch('references.json');
         if (!referencesResponse.ok) {
@@ -65,6 +84,55 @@ const App = {
         }
         const referencesData = await referencesResponse.json();
         this.references = referencesData.references;
+
+        // Mode départements : les établissements seront chargés à la demande,
+        // avec leurs positions dans les groupes de référence
+        if (await Shards.init()) {
+            this.shardMode = true;
+            this.etablissements = [];
+            return;
+        }
+
+        // Charger les établissements : format colonnaire compact si disponible,
+        // sinon le JSON complet
+        const columnarResponse = await fetch('etablissements_france.columns.json');
+        if (columnarResponse.ok) {
+            const columnarData = Utils.decodeColumnar(await columnarResponse.json());
+            this.etablissements = columnarData.etablissements;
+        } else {
+            const etablissementsResponse = await fetch('etablissements_france.json');
+            if (!etablissementsResponse.ok) {
+                throw new Error('Impossible de charger etablissements_france.json');
+            }
+            const etablissementsData = await etablissementsResponse.json();
+            this.etablissements = etablissementsData.etablissements;
+        }
+
+        // Positions pré-calculées dans les groupes de référence (facultatif)
+        await Comparisons.load();
+    },
+
+    /**
+     * Charge les départements visibles ou sélectionnés (mode départements)
+     */
+    initShards() {
+        // Charger le département sélectionné dans les filtres
+        ['filter-departement', 'mobile-filter-departement'].forEach(id => {
+            document.getElementById(id)?.addEventListener('change', (e) => {
+                if (e.target.value !== 'tous') {
+                    Shards.loadDepartement(e.target.value);
+                }
+            });
+        });
+
+        Shards.watch(MapManager.map, (shard) => {
+            // Le tableau est partagé avec la recherche : l'enrichir sur place
+            this.etablissements.push(...shard.etablissements);
+            Object.assign(this.references.par_departement, shard.references || {});
+            Comparisons.merge(shard.comparaisons);
+            MapManager.appendEtablissements(shard.etablissements, this.references);
+            Filters.applyFilters();
+        });
     },
 
     /**
@@ -172,10 +240,7 @@ const App = {
             return;
         }
 
-        const results = this.etablissements
-            .filter(e => e.nom.toLowerCase().includes(query) ||
-                        e.commune?.toLowerCase().includes(query))
-            .slice(0, 20);
+        const results = Search.find(query, 20);
 
         if (results.length === 0) {
             container.innerHTML = '<div class="mobile-search-empty">Aucun résultat</div>';
@@ -0,0 +1,67 @@
+/**
+ * Position pré-calculée de chaque établissement dans ses groupes de référence
+ * (references.comparaisons.json, voir create_references.py)
+ *
+ * Une ligne par établissement, indexée par type puis UAI : rang centile,
+ * z-score et classe (top 10 %...) aux niveaux national, régional et
+ * départemental. Ouvrir un popup ou filtrer par classement revient ainsi à une
+ * simple lecture, sans parcourir les seuils des références.
+ */
+
+const Comparisons = {
+    // Disposition des lignes (remplacée par celle du fichier chargé)
+    niveaux: ['national', 'region', 'departement'],
+    champs: ['percentile', 'z', 'bande'],
+    bandes: ['top_1', 'top_5', 'top_10', 'top_25', 'top_50', 'bottom_50', 'bottom_25', 'bottom_10'],
+
+    // { type: { uai: ligne } }
+    table: {},
+
+    /**
+     * Charge la table. Retourne false si elle n'est pas disponible.
+     */
+    async load() {
+        let response;
+        try {
+            response = await fetch('references.comparaisons.json');
+        } catch (error) {
+            return false;
+        }
+        if (!response.ok) return false;
+
+        const data = await response.json();
+        this.niveaux = data.niveaux;
+        this.champs = data.champs;
+        this.bandes = data.bandes;
+        this.table = data.par_type;
+        return true;
+    },
+
+    /**
+     * Ajoute les lignes d'un fichier de département (mode départements)
+     */
+    merge(rows) {
+        if (!rows) return;
+        for (const [type, byUai] of Object.entries(rows)) {
+            this.table[type] = Object.assign(this.table[type] || {}, byUai);
+        }
+    },
+
+    /**
+     * Retourne { percentile, z, bande } d'un établissement à un niveau
+     * ('national', 'region', 'departement'), ou null
+     */
+    get(etab, level = 'national') {
+        const row = this.table[etab.type]?.[etab.uai];
+        const index = this.niveaux.indexOf(level);
+        if (!row || index < 0) return null;
+
+        const offset = index * this.champs.length;
+        if (row[offset + 2] === null) return null;
+        return {
+            percentile: row[offset],
+            z: row[offset + 1],
+            bande: this.bandes[row[offset + 2]]
+        };
+    }
+};
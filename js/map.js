@@ -81,6 +81,12 @@ const MapManager = {
                         });
                         this.userLocationMarker = L.marker([lat, lon], { icon }).addTo(this.map);
                     }
+
+                    // Lister les établissements les plus proches (index spatial)
+                    const nearest = SpatialIndex.nearest(lat, lon, 5);
+                    if (nearest.length > 0) {
+                        this.userLocationMarker.bindPopup(this.createNearestContent(nearest)).openPopup();
+                    }
                 },
                 (error) => {
                     btn.classList.remove('loading');
@@ -105,6 +111,25 @@ const MapManager = {
     addEtablissements(etablissements, references) {
         this.allMarkers = [];
         this.references = references;
+        this.allMarkers = this.createMarkers(etablissements, references);
+        this.markers.addLayers(this.allMarkers);
+    },
+
+    /**
+     * Ajoute des établissements à ceux déjà présents (chargement par département)
+     */
+    appendEtablissements(etablissements, references) {
+        this.references = references;
+        const markers = this.createMarkers(etablissements, references);
+        this.allMarkers.push(...markers);
+        this.markers.addLayers(markers);
+    },
+
+    /**
+     * Crée les marqueurs des établissements (un marqueur par position)
+     */
+    createMarkers(etablissements, references) {
+        const markers = [];
 
         // Regrouper les établissements par coordonnées
         const groupedByLocation = new Map();
@@ -160,10 +185,10 @@ const MapManager = {
                 }
             });
 
-            this.allMarkers.push(marker);
+            markers.push(marker);
         });
 
-        this.markers.addLayers(this.allMarkers);
+        return markers;
     },
 
     /**
@@ -347,10 +372,13 @@ const MapManager = {
             </div>
             <div class="popup-location">
                 ${etab.commune}, ${etab.departement}
+                ${etab.geolocalisation === 'commune' ? '<span class="popup-location-approx" title="Établissement absent de l\'annuaire : placé au centre de sa commune">position approximative</span>' : ''}
             </div>
             <div class="popup-ranking-main ${rankingCategory}">
                 <div class="popup-ranking-label">${rankingLabel}</div>
                 ${etab.rang ? `<div class="popup-rang-main">${etab.rang}<sup>${this.getOrdinalSuffix(etab.rang)}</sup> <span class="popup-rang-total">/ ${etab.total_type.toLocaleString('fr-FR')}</span></div>` : ''}
+                ${this.createRankDetails(etab)}
+                ${this.createComparisonDetails(etab)}
             </div>
             ${showScore ? `
             <div class="popup-score" title="${scoreTooltip}">
@@ -370,6 +398,25 @@ const MapManager = {
         `;
     },
 
+    /**
+     * Crée le contenu du popup des établissements les plus proches
+     */
+    createNearestContent(nearest) {
+        const typeLabels = {
+            'ecole': 'École',
+            'college': 'Collège',
+            'lycee': 'Lycée'
+        };
+
+        const items = nearest.map(({ distance, etablissement }) => `
+            <div class="popup-location">
+                <strong>${etablissement.nom}</strong> (${typeLabels[etablissement.type]}) - ${Utils.formatNumber(distance)} km
+            </div>
+        `).join('');
+
+        return `<div class="popup-content"><div class="popup-name">À proximité</div>${items}</div>`;
+    },
+
     /**
      * Met à jour les marqueurs affichés selon les filtres
      */
@@ -414,6 +461,39 @@ const MapManager = {
         this.map.setView([46.603354, 1.888334], 6);
     },
 
+    /**
+     * Crée le détail des classements régional et départemental (pré-calculés, voir ranking.py)
+     */
+    createRankDetails(etab) {
+        const metric = Object.keys(etab.classements || {})[0];
+        if (!metric) return '';
+
+        const classement = etab.classements[metric];
+        const levels = [['region', 'Région'], ['departement', 'Département']];
+        const parts = levels
+            .filter(([level]) => classement[level])
+            .map(([level, label]) => {
+                const { rang, total } = classement[level];
+                return `${label} : ${rang}<sup>${this.getOrdinalSuffix(rang)}</sup> / ${total.toLocaleString('fr-FR')}`;
+            });
+        if (classement.national) {
+            parts.push(`Centile : ${Utils.formatNumber(classement.national.percentile)}`);
+        }
+        return parts.length ? `<div class="popup-rang">${parts.join(' · ')}</div>` : '';
+    },
+
+    /**
+     * Crée la ligne des classes régionale et départementale (table pré-calculée)
+     */
+    createComparisonDetails(etab) {
+        const levels = [['region', 'Région'], ['departement', 'Département']];
+        const parts = levels
+            .map(([level, label]) => [label, Comparisons.get(etab, level)])
+            .filter(([, comparison]) => comparison)
+            .map(([label, comparison]) => `${label} : ${Utils.getClassementLabel(comparison.bande)}`);
+        return parts.length ? `<div class="popup-rang">${parts.join(' · ')}</div>` : '';
+    },
+
     /**
      * Retourne le suffixe ordinal français (er, e, ème)
      */
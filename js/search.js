@@ -6,6 +6,7 @@ const Search = {
     etablissements: [],
     searchInput: null,
     resultsContainer: null,
+    index: null,
 
     /**
      * Initialise la recherche
@@ -51,19 +52,135 @@ const Search = {
             return;
         }
 
-        const normalizedQuery = this.normalizeString(query);
+        const results = this.find(query, 20); // Limiter à 20 résultats
 
-        // Rechercher dans les établissements
-        const results = this.etablissements
+        this.showResults(results);
+    },
+
+    /**
+     * Recherche les établissements dont le nom ou la commune contient la requête
+     */
+    find(query, limit = 20) {
+        const normalizedQuery = this.normalizeString(query.trim());
+        if (normalizedQuery.length < 2) return [];
+
+        if (this.index) {
+            return this.findWithIndex(normalizedQuery, limit);
+        }
+
+        // Sans index : parcourir tous les établissements
+        return this.etablissements
             .filter(etab => {
                 const normalizedName = this.normalizeString(etab.nom);
                 const normalizedCommune = this.normalizeString(etab.commune);
                 return normalizedName.includes(normalizedQuery) ||
                        normalizedCommune.includes(normalizedQuery);
             })
-            .slice(0, 20); // Limiter à 20 résultats
+            .slice(0, limit);
+    },
 
-        this.showResults(results);
+    /**
+     * Charge l'index de recherche pré-calculé (voir search_index.py), s'il existe
+     */
+    async loadIndex() {
+        let response;
+        try {
+            response = await fetch('etablissements_france.search.json');
+        } catch (error) {
+            return false;
+        }
+        if (!response.ok) return false;
+
+        const data = await response.json();
+        const byKey = new Map(this.etablissements.map(e => [`${e.uai}|${e.type}`, e]));
+
+        this.index = {
+            docs: data.uai.map((uai, i) => byKey.get(`${uai}|${data.type[i]}`)),
+            strings: data.strings,
+            nom: data.nom,
+            commune: data.commune,
+            grams: data.grams,
+            gramKeys: Object.keys(data.grams).sort(),
+            decoded: new Map()
+        };
+        return true;
+    },
+
+    /**
+     * Décode une liste encodée par différences
+     */
+    deltaDecode(values) {
+        let total = 0;
+        return values.map(value => (total += value));
+    },
+
+    /**
+     * Retourne les chaînes (noms, communes) contenant un trigramme
+     */
+    postings(gram) {
+        const index = this.index;
+        if (!index.decoded.has(gram)) {
+            index.decoded.set(gram, this.deltaDecode(index.grams[gram] || []));
+        }
+        return index.decoded.get(gram);
+    },
+
+    /**
+     * Recherche via l'index de trigrammes (même classement que search_index.py)
+     */
+    findWithIndex(query, limit) {
+        const index = this.index;
+        let sids;
+
+        if (query.length < 3) {
+            // Tous les trigrammes commençant par la requête (y compris « xy$ »)
+            const keys = index.gramKeys;
+            let lo = 0;
+            let hi = keys.length;
+            while (lo < hi) {
+                const mid = (lo + hi) >> 1;
+                if (keys[mid] < query) lo = mid + 1; else hi = mid;
+            }
+            const candidates = new Set();
+            for (let i = lo; i < keys.length && keys[i].startsWith(query); i++) {
+                this.postings(keys[i]).forEach(sid => candidates.add(sid));
+            }
+            sids = [...candidates];
+        } else {
+            const grams = new Set();
+            for (let i = 0; i + 3 <= query.length; i++) {
+                grams.add(query.slice(i, i + 3));
+            }
+            const lists = [...grams].map(gram => this.postings(gram)).sort((a, b) => a.length - b.length);
+            let candidates = new Set(lists[0]);
+            for (const list of lists.slice(1)) {
+                const next = new Set(list);
+                candidates = new Set([...candidates].filter(sid => next.has(sid)));
+                if (candidates.size === 0) return [];
+            }
+            sids = [...candidates].filter(sid => index.strings[sid].includes(query));
+        }
+
+        // Classement : début de mot dans le nom, puis nom, puis commune
+        const ranked = [];
+        sids.forEach(sid => {
+            const text = index.strings[sid];
+            const position = text.indexOf(query);
+            const wordStart = position === 0 || !/[a-z0-9]/.test(text[position - 1]);
+            this.deltaDecode(index.nom[sid]).forEach(doc => ranked.push([wordStart ? 0 : 1, doc]));
+            this.deltaDecode(index.commune[sid]).forEach(doc => ranked.push([2, doc]));
+        });
+        ranked.sort((a, b) => a[0] - b[0] || a[1] - b[1]);
+
+        const results = [];
+        const seen = new Set();
+        for (const [, doc] of ranked) {
+            if (seen.has(doc) || !index.docs[doc]) continue;
+            seen.add(doc);
+            results.push(index.docs[doc]);
+            if (results.length >= limit) break;
+        }
+        return results;
     },
 
     /**
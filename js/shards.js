@@ -0,0 +1,94 @@
+/**
+ * Chargement des établissements par département (voir shards.py)
+ *
+ * Seuls les départements visibles sur la carte (à partir de MIN_ZOOM) ou
+ * sélectionnés dans les filtres sont chargés.
+ */
+
+const Shards = {
+    // Zoom à partir duquel les départements visibles sont chargés
+    MIN_ZOOM: 9,
+
+    manifest: null,
+    loaded: new Map(),
+    onShard: null,
+
+    /**
+     * Charge le manifeste. Retourne false si le découpage n'est pas disponible.
+     */
+    async init() {
+        let response;
+        try {
+            response = await fetch('shards/index.json');
+        } catch (error) {
+            return false;
+        }
+        if (!response.ok) return false;
+
+        this.manifest = await response.json();
+        return true;
+    },
+
+    /**
+     * Retourne une entrée par département (région, nom, code), pour peupler les filtres
+     */
+    summaryEntries() {
+        return Object.values(this.manifest.shards).map(entry => ({
+            region: entry.region,
+            departement: entry.departement,
+            code_departement: entry.code
+        }));
+    },
+
+    /**
+     * Charge un département (une seule fois) et le transmet à `onShard`
+     */
+    load(name) {
+        if (!this.loaded.has(name)) {
+            const entry = this.manifest.shards[name];
+            this.loaded.set(name, fetch(`shards/${entry.file}`)
+                .then(response => response.ok ? response.json() : null)
+                .then(shard => {
+                    if (shard && this.onShard) this.onShard(shard);
+                    return shard;
+                })
+                .catch(() => null));
+        }
+        return this.loaded.get(name);
+    },
+
+    /**
+     * Charge les départements dont l'emprise intersecte la vue courante
+     */
+    loadVisible(map) {
+        if (map.getZoom() < this.MIN_ZOOM) return Promise.resolve([]);
+
+        const bounds = map.getBounds();
+        const names = Object.entries(this.manifest.shards)
+            .filter(([, entry]) => entry.bbox &&
+                entry.bbox[0] <= bounds.getNorth() && entry.bbox[2] >= bounds.getSouth() &&
+                entry.bbox[1] <= bounds.getEast() && entry.bbox[3] >= bounds.getWest())
+            .map(([name]) => name);
+
+        return Promise.all(names.map(name => this.load(name)));
+    },
+
+    /**
+     * Charge les départements portant un nom donné (filtre département)
+     */
+    loadDepartement(nom) {
+        const names = Object.entries(this.manifest.shards)
+            .filter(([, entry]) => entry.departement === nom)
+            .map(([name]) => name);
+        return Promise.all(names.map(name => this.load(name)));
+    },
+
+    /**
+     * Charge les départements au fil des déplacements de la carte
+     */
+    watch(map, onShard) {
+        this.onShard = onShard;
+        map.on('moveend', () => this.loadVisible(map));
+        return this.loadVisible(map);
+    }
+};
@@ -0,0 +1,107 @@
+/**
+ * Index spatial des établissements (arbres k-d produits par spatial_index.py)
+ */
+
+const SpatialIndex = {
+    EARTH_RADIUS_KM: 6371.0088,
+
+    etablissements: null,
+    coords: null,
+    trees: null,
+
+    /**
+     * Charge l'index sérialisé et le relie aux établissements chargés.
+     * Retourne false si l'index n'est pas disponible.
+     */
+    async load(etablissements) {
+        let response;
+        try {
+            response = await fetch('etablissements_france.spatial.json');
+        } catch (error) {
+            return false;
+        }
+        if (!response.ok) return false;
+
+        const data = await response.json();
+        const byKey = new Map(etablissements.map(e => [`${e.uai}|${e.type}`, e]));
+
+        this.etablissements = data.uai.map((uai, i) => byKey.get(`${uai}|${data.type[i]}`));
+        this.coords = data.latitude.map((lat, i) => this.toXyz(lat, data.longitude[i]));
+        this.trees = {};
+        Object.entries(data.trees).forEach(([name, tree]) => {
+            this.trees[name] = {
+                order: tree.order,
+                axis: tree.axis,
+                coords: tree.order.map(i => this.coords[i])
+            };
+        });
+        return true;
+    },
+
+    /**
+     * Projette une position sur la sphère unité
+     */
+    toXyz(lat, lon) {
+        const phi = lat * Math.PI / 180;
+        const lambda = lon * Math.PI / 180;
+        return [Math.cos(phi) * Math.cos(lambda), Math.cos(phi) * Math.sin(lambda), Math.sin(phi)];
+    },
+
+    /**
+     * Recherche les k plus proches voisins dans un arbre : [[corde², indice]]
+     */
+    searchTree(tree, target, k) {
+        const best = [];
+
+        const visit = (lo, hi) => {
+            if (lo >= hi) return;
+            const mid = (lo + hi) >> 1;
+            const point = tree.coords[mid];
+            const dist2 = (point[0] - target[0]) ** 2 + (point[1] - target[1]) ** 2 + (point[2] - target[2]) ** 2;
+
+            if (best.length < k || dist2 < best[best.length - 1][0]) {
+                best.push([dist2, tree.order[mid]]);
+                best.sort((a, b) => a[0] - b[0]);
+                if (best.length > k) best.pop();
+            }
+
+            const axis = tree.axis[mid];
+            const diff = target[axis] - point[axis];
+            if (diff < 0) {
+                visit(lo, mid);
+                if (best.length < k || diff * diff < best[best.length - 1][0]) visit(mid + 1, hi);
+            } else {
+                visit(mid + 1, hi);
+                if (best.length < k || diff * diff < best[best.length - 1][0]) visit(lo, mid);
+            }
+        };
+
+        visit(0, tree.coords.length);
+        return best;
+    },
+
+    /**
+     * Retourne les k établissements les plus proches : [{ distance (km), etablissement }]
+     */
+    nearest(lat, lon, k = 10, type = null, secteur = null) {
+        if (!this.trees) return [];
+
+        const names = (type === null && secteur === null)
+            ? ['all']
+            : Object.keys(this.trees).filter(name => {
+                if (name === 'all') return false;
+                const [t, s] = name.split('/');
+                return (type === null || t === type) && (secteur === null || s === secteur);
+            });
+
+        const target = this.toXyz(lat, lon);
+        return names
+            .flatMap(name => this.searchTree(this.trees[name], target, k))
+            .sort((a, b) => a[0] - b[0])
+            .slice(0, k)
+            .map(([dist2, i]) => ({
+                distance: 2 * this.EARTH_RADIUS_KM * Math.asin(Math.min(Math.sqrt(dist2) / 2, 1)),
+                etablissement: this.etablissements[i]
+            }));
+    }
+};
@@ -0,0 +1,166 @@
+/**
+ * Affichage progressif de la carte à partir des tuiles pré-calculées (voir tiles.py)
+ *
+ * Seules les tuiles visibles sont chargées : agrégats par cellule aux zooms
+ * faibles, établissements au zoom maximal. Permet un premier affichage sans
+ * attendre le chargement du jeu de données complet.
+ */
+
+const Tiles = {
+    map: null,
+    manifest: null,
+    layer: null,
+    available: null,
+    cache: new Map(),
+    onMoveEnd: null,
+    // Zoom à partir duquel les tuiles sont masquées (les établissements prennent le relais)
+    hideFromZoom: null,
+
+    /**
+     * Charge le manifeste et affiche les tuiles visibles.
+     * Retourne false si aucune tuile n'est disponible.
+     */
+    async init(map) {
+        let response;
+        try {
+            response = await fetch('tiles/index.json');
+        } catch (error) {
+            return false;
+        }
+        if (!response.ok) return false;
+
+        this.map = map;
+        this.manifest = await response.json();
+
+        // Tuiles existantes par niveau, pour ne demander que des tuiles non vides
+        this.available = new Map();
+        Object.entries(this.manifest.tiles).forEach(([zoom, keys]) => {
+            this.available.set(Number(zoom), new Set(keys));
+        });
+
+        this.layer = L.layerGroup().addTo(map);
+        this.onMoveEnd = () => this.refresh();
+        map.on('moveend', this.onMoveEnd);
+
+        await this.refresh();
+        return true;
+    },
+
+    /**
+     * Convertit une position en indices de tuile au zoom donné
+     */
+    tileOf(lat, lon, zoom) {
+        const n = 2 ** zoom;
+        const latRad = lat * Math.PI / 180;
+        const x = Math.floor((lon + 180) / 360 * n);
+        const y = Math.floor((1 - Math.log(Math.tan(latRad) + 1 / Math.cos(latRad)) / Math.PI) / 2 * n);
+        return [Math.min(Math.max(x, 0), n - 1), Math.min(Math.max(y, 0), n - 1)];
+    },
+
+    /**
+     * Charge une tuile (avec cache)
+     */
+    loadTile(zoom, x, y) {
+        const key = `${zoom}/${x}/${y}`;
+        if (!this.cache.has(key)) {
+            this.cache.set(key, fetch(`tiles/${key}.json`)
+                .then(response => response.ok ? response.json() : null)
+                .catch(() => null));
+        }
+        return this.cache.get(key);
+    },
+
+    /**
+     * Affiche les tuiles couvrant la vue courante
+     */
+    async refresh() {
+        if (!this.map || !this.manifest) return;
+
+        if (this.hideFromZoom !== null && this.map.getZoom() >= this.hideFromZoom) {
+            this.layer.clearLayers();
+            return;
+        }
+
+        const { min_zoom: minZoom, max_zoom: maxZoom } = this.manifest;
+        const zoom = Math.min(Math.max(Math.round(this.map.getZoom()), minZoom), maxZoom);
+        const bounds = this.map.getBounds();
+        const [xMin, yMin] = this.tileOf(bounds.getNorth(), bounds.getWest(), zoom);
+        const [xMax, yMax] = this.tileOf(bounds.getSouth(), bounds.getEast(), zoom);
+        const available = this.available.get(zoom) || new Set();
+
+        const requests = [];
+        for (let x = xMin; x <= xMax; x++) {
+            for (let y = yMin; y <= yMax; y++) {
+                if (available.has(`${x}/${y}`)) {
+                    requests.push(this.loadTile(zoom, x, y));
+                }
+            }
+        }
+
+        const tiles = await Promise.all(requests);
+
+        // La vue a pu changer pendant le chargement
+        if (!this.layer) return;
+        if (this.hideFromZoom !== null && this.map.getZoom() >= this.hideFromZoom) return;
+        this.layer.clearLayers();
+        tiles.forEach(tile => {
+            if (!tile) return;
+            if (tile.clusters) {
+                tile.clusters.forEach(cluster => this.layer.addLayer(this.createClusterMarker(cluster)));
+            } else {
+                tile.etablissements.forEach(etab => {
+                    if (etab.latitude && etab.longitude) {
+                        this.layer.addLayer(this.createPointMarker(etab));
+                    }
+                });
+            }
+        });
+    },
+
+    /**
+     * Crée le marqueur d'un agrégat
+     */
+    createClusterMarker(cluster) {
+        const typeLabels = { ecole: 'Écoles', college: 'Collèges', lycee: 'Lycées' };
+        const details = Object.entries(cluster.types)
+            .map(([type, count]) => {
+                const score = cluster.scores[type];
+                return `${typeLabels[type] || type} : ${count}${score !== undefined ? ` (score moyen ${Utils.formatNumber(score)})` : ''}`;
+            })
+            .join('<br>');
+
+        return L.circleMarker([cluster.lat, cluster.lon], {
+            radius: Math.min(6 + Math.sqrt(cluster.count), 30),
+            color: '#ffffff',
+            weight: 2,
+            fillColor: '#3388ff',
+            fillOpacity: 0.7
+        }).bindTooltip(`<strong>${cluster.count.toLocaleString('fr-FR')} établissements</strong><br>${details}`);
+    },
+
+    /**
+     * Crée le marqueur d'un établissement
+     */
+    createPointMarker(etab) {
+        return L.circleMarker([etab.latitude, etab.longitude], {
+            radius: 6,
+            color: '#ffffff',
+            weight: 1,
+            fillColor: '#3388ff',
+            fillOpacity: 0.9
+        }).bindTooltip(`${etab.nom}<br>${etab.commune}`);
+    },
+
+    /**
+     * Retire les tuiles de la carte (une fois le jeu de données complet chargé)
+     */
+    destroy() {
+        if (!this.map) return;
+        this.map.off('moveend', this.onMoveEnd);
+        if (this.layer) {
+            this.map.removeLayer(this.layer);
+        }
+        this.layer = null;
+        this.cache.clear();
+    }
+};
@@ -39,8 +39,12 @@ const Utils = {
 
     /**
      * Classifie un établissement selon les percentiles de référence
+     * (lecture directe dans la table pré-calculée si elle est chargée)
      */
     classify(etablissement, references) {
+        const comparison = Comparisons.get(etablissement);
+        if (comparison) return comparison.bande;
+
         const score = this.getScore(etablissement);
         if (score === null || score === undefined) return null;
 
@@ -231,6 +235,50 @@ const Utils = {
             .sort((a, b) => a.nom.localeCompare(b.nom));
     },
 
+    /**
+     * Reconstruit le dataset à partir du format colonnaire (voir columnar.py)
+     */
+    decodeColumnar(data) {
+        if (data.format !== 'columnar' || data.version !== 2) {
+            throw new Error(`Format colonnaire non supporté : ${data.format} v${data.version}`);
+        }
+
+        const { columns, dictionaries, shapes } = data;
+
+        // Une colonne ne contient que les valeurs des établissements qui ont
+        // ce champ : un curseur par colonne donne la prochaine valeur à lire
+        const cursors = {};
+        Object.keys(columns).forEach(name => { cursors[name] = { column: columns[name], position: 0 }; });
+
+        // Pré-calculer, pour chaque forme, le chemin et la colonne de chaque champ
+        const paths = shapes.map(shape => shape.map(name => ({
+            keys: name.split('.'),
+            cursor: cursors[name],
+            dictionary: dictionaries[name] || null
+        })));
+
+        const shapeColumn = columns._shape;
+        const etablissements = new Array(shapeColumn.length);
+
+        for (let i = 0; i < shapeColumn.length; i++) {
+            const etab = {};
+            for (const { keys, cursor, dictionary } of paths[shapeColumn[i]]) {
+                let value = cursor.column[cursor.position++];
+                if (value !== null && dictionary) {
+                    value = dictionary[value];
+                }
+                let target = etab;
+                for (let k = 0; k < keys.length - 1; k++) {
+                    target = target[keys[k]] || (target[keys[k]] = {});
+                }
+                target[keys[keys.length - 1]] = value;
+            }
+            etablissements[i] = etab;
+        }
+
+        return { metadata: data.metadata, etablissements };
+    },
+
     /**
      * Debounce une fonction
      */
@@ -0,0 +1,253 @@
+#!/usr/bin/env python3
+"""
+Test de charge du service d'interrogation (server.py).
+
+Des clients concurrents (un thread et une connexion persistante chacun)
+envoient un mélange de requêtes tirées des données servies : emprises
+(bbox), recherches par nom, plus proches voisins et fiches détaillées.
+Chaque client renvoie l'ETag reçu lorsqu'il répète une requête (réponse
+304 attendue), comme le ferait un navigateur.
+
+Sont mesurés : débit, latences (médiane, p90, p99, max) par type de requête,
+statuts HTTP, volume transféré et erreurs.
+
+    python server.py --quiet &
+    python load_test.py --url http://127.0.0.1:8000 -c 16 -n 5000
+
+    # ou en démarrant un serveur dédié sur un port libre
+    python load_test.py --serve --dir . -c 16 -n 5000 -o load_test.json
+"""
+
+import argparse
+import http.client
+import json
+import random
+import subprocess
+import sys
+import threading
+import time
+from pathlib import Path
+from urllib.parse import quote, urlsplit
+
+# Répartition des requêtes : (nom, poids)
+MIX = [('bbox', 4), ('recherche', 3), ('proches', 2), ('fiche', 2)]
+
+# Nombre de requêtes distinctes de chaque type (les autres sont des répétitions)
+DISTINCT = 300
+
+# Établissements lus pour composer les requêtes
+SAMPLE_SIZE = 1000
+
+
+def fetch(connection, path, headers=None):
+    """Envoie une requête GET ; retourne (statut, en-têtes, corps)."""
+    connection.request('GET', path, headers=headers or {})
+    response = connection.getresponse()
+    return response.status, dict(response.getheaders()), response.read()
+
+
+def sample_etablissements(host, port):
+    """Retourne un échantillon d'établissements (avec coordonnées) lus sur le service."""
+    connection = http.client.HTTPConnection(host, port, timeout=30)
+    try:
+        status, _, body = fetch(connection, '/api/statut')
+        if status != 200:
+            raise RuntimeError(f"/api/statut : statut {status}")
+        total = json.loads(body)['etablissements']
+        per_page = 1000
+        pages = max(1, -(-total // per_page))
+        sample = []
+        for page in sorted(random.sample(range(1, pages + 1), min(pages, -(-SAMPLE_SIZE // per_page)))):
+            status, _, body = fetch(connection, f'/api/etablissements?page={page}&par_page={per_page}')
+            sample.extend(json.loads(body)['resultats'])
+    finally:
+        connection.close()
+    return [e for e in sample if e.get('latitude') is not None and e.get('longitude') is not None]
+
+
+def build_requests(sample, count):
+    """Compose `count` chemins de requêtes, tirés de DISTINCT requêtes par type."""
+    types = ['ecole', 'college', 'lycee']
+
+    def bbox():
+        e = random.choice(sample)
+        size = random.choice([0.05, 0.2, 0.5, 1.5])
+        filters = random.choice(['', '&type=ecole', '&type=college,lycee', '&secteur=public'])
+        return ('bbox', f"/api/etablissements?bbox={e['longitude'] - size:.4f},{e['latitude'] - size:.4f},"
+                        f"{e['longitude'] + size:.4f},{e['latitude'] + size:.4f}{filters}")
+
+    def recherche():
+        words = [w for w in (random.choice(sample).get('nom') or '').split() if len(w) >= 3]
+        word = random.choice(words) if words else 'ecole'
+        return ('recherche', f"/api/recherche?q={quote(word[:random.randint(3, max(3, len(word)))])}&par_page=20")
+
+    def proches():
+        e = random.choice(sample)
+        extra = random.choice(['&k=10', '&k=50', f'&k=10&type={random.choice(types)}', '&rayon=5'])
+        return ('proches', f"/api/proches?lat={e['latitude'] + random.uniform(-0.05, 0.05):.4f}"
+                           f"&lon={e['longitude'] + random.uniform(-0.05, 0.05):.4f}{extra}")
+
+    def fiche():
+        return ('fiche', f"/api/etablissements/{quote(random.choice(sample)['uai'])}")
+
+    makers = {'bbox': bbox, 'recherche': recherche, 'proches': proches, 'fiche': fiche}
+    pools = {name: [maker() for _ in range(DISTINCT)] for name, maker in makers.items()}
+    names = random.choices([name for name, _ in MIX], weights=[weight for _, weight in MIX], k=count)
+    return [random.choice(pools[name]) for name in names]
+
+
+def percentile(values, p):
+    """Percentile `p` (0-100) d'une liste triée, par rang le plus proche."""
+    if not values:
+        return None
+    return values[min(len(values) - 1, max(0, round(p / 100 * len(values)) - 1))]
+
+
+def run(host, port, requests, concurrency):
+    """Envoie les requêtes avec `concurrency` clients ; retourne les mesures brutes par requête."""
+    queue = list(reversed(requests))
+    lock = threading.Lock()
+    results = []
+
+    def client():
+        connection = http.client.HTTPConnection(host, port, timeout=30)
+        etags = {}
+        local = []
+        while True:
+            with lock:
+                if not queue:
+                    break
+                name, path = queue.pop()
+            headers = {'Accept-Encoding': 'gzip'}
+            if path in etags:
+                headers['If-None-Match'] = etags[path]
+            debut = time.perf_counter()
+            try:
+                status, response_headers, body = fetch(connection, path, headers)
+            except (OSError, http.client.HTTPException) as error:
+                local.append((name, None, time.perf_counter() - debut, 0, type(error).__name__))
+                connection.close()
+                connection = http.client.HTTPConnection(host, port, timeout=30)
+                continue
+            duree = time.perf_counter() - debut
+            if 'ETag' in response_headers:
+                etags[path] = response_headers['ETag']
+            local.append((name, status, duree, len(body), None))
+        connection.close()
+        with lock:
+            results.extend(local)
+
+    threads = [threading.Thread(target=client) for _ in range(concurrency)]
+    debut = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return results, time.perf_counter() - debut
+
+
+def summarize(results, duree):
+    """Agrège les mesures : débit, latences (ms) par type de requête, statuts et erreurs."""
+    def stats(rows):
+        latencies = sorted(row[2] * 1000 for row in rows if row[1] is not None)
+        return {
+            'requetes': len(rows),
+            'mediane_ms': round(percentile(latencies, 50), 2) if latencies else None,
+            'p90_ms': round(percentile(latencies, 90), 2) if latencies else None,
+            'p99_ms': round(percentile(latencies, 99), 2) if latencies else None,
+            'max_ms': round(latencies[-1], 2) if latencies else None,
+            'octets': sum(row[3] for row in rows)
+        }
+
+    statuts = {}
+    for row in results:
+        key = str(row[1]) if row[1] is not None else row[4]
+        statuts[key] = statuts.get(key, 0) + 1
+    return {
+        'requetes': len(results),
+        'duree': round(duree, 3),
+        'requetes_par_seconde': round(len(results) / duree, 1) if duree > 0 else None,
+        'statuts': dict(sorted(statuts.items())),
+        'erreurs': sum(1 for row in results if row[1] is None or row[1] >= 500),
+        'global': stats(results),
+        'par_requete': {name: stats([row for row in results if row[0] == name]) for name, _ in MIX}
+    }
+
+
+def start_server(directory, workers):
+    """Démarre server.py sur un port libre ; retourne (processus, port)."""
+    process = subprocess.Popen(
+        [sys.executable, str(Path(__file__).parent / 'server.py'), '--dir', str(directory), '--port', '0',
+         '--workers', str(workers), '--quiet'],
+        stdout=subprocess.PIPE, text=True)
+    for line in process.stdout:
+        if line.startswith('Service disponible sur '):
+            port = int(urlsplit(line.split()[3]).port)
+            return process, port
+    process.wait()
+    raise RuntimeError(f"le serveur n'a pas démarré (code {process.returncode})")
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Test de charge du service d'interrogation (server.py).")
+    parser.add_argument('--url', default='http://127.0.0.1:8000',
+                        help="adresse du service (défaut : http://127.0.0.1:8000)")
+    parser.add_argument('--serve', action='store_true',
+                        help="démarrer un serveur dédié sur un port libre (ignore --url)")
+    parser.add_argument('--dir', type=Path, default=Path(__file__).parent,
+                        help="avec --serve : répertoire des fichiers produits (défaut : celui du script)")
+    parser.add_argument('--workers', type=int, default=32,
+                        help="avec --serve : threads du serveur (défaut : 32)")
+    parser.add_argument('-c', '--concurrency', type=int, default=16,
+                        help="nombre de clients simultanés (défaut : 16)")
+    parser.add_argument('-n', '--requests', type=int, default=2000,
+                        help="nombre total de requêtes (défaut : 2000)")
+    parser.add_argument('--seed', type=int, default=0, help="graine du tirage des requêtes (défaut : 0)")
+    parser.add_argument('-o', '--output', type=Path, default=None, help="écrire les résultats en JSON")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    random.seed(args.seed)
+
+    process = None
+    if args.serve:
+        print(f"Démarrage du serveur ({args.dir})...")
+        process, port = start_server(args.dir, args.workers)
+        host = '127.0.0.1'
+    else:
+        url = urlsplit(args.url)
+        host, port = url.hostname, url.port or 80
+
+    try:
+        sample = sample_etablissements(host, port)
+        if not sample:
+            raise SystemExit("Aucun établissement géolocalisé servi : rien à tester")
+        requests = build_requests(sample, args.requests)
+        print(f"{len(requests)} requêtes, {args.concurrency} clients simultanés sur {host}:{port}...")
+        results, duree = run(host, port, requests, args.concurrency)
+    finally:
+        if process is not None:
+            process.terminate()
+            process.wait()
+
+    summary = summarize(results, duree)
+    print(f"  Débit: {summary['requetes_par_seconde']} requêtes/s ({summary['duree']} s)")
+    print(f"  Statuts: {', '.join(f'{status}: {n}' for status, n in summary['statuts'].items())}")
+    for name, stats in [('global', summary['global'])] + list(summary['par_requete'].items()):
+        if stats['requetes']:
+            print(f"  - {name:<10} {stats['requetes']:6d} requêtes  médiane {stats['mediane_ms']} ms  "
+                  f"p90 {stats['p90_ms']} ms  p99 {stats['p99_ms']} ms  max {stats['max_ms']} ms")
+
+    if args.output is not None:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(summary, f, ensure_ascii=False, indent=2)
+        print(f"\nRésultats enregistrés: {args.output}")
+
+    if summary['erreurs']:
+        raise SystemExit(f"{summary['erreurs']} requêtes en erreur")
+
+
+if __name__ == '__main__':
+    main()
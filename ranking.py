@@ -0,0 +1,156 @@
+"""
+Classement des établissements : rangs national, régional et départemental,
+et rang centile, pour chaque métrique.
+
+Pour une métrique, les établissements sont triés une seule fois (tableau
+d'indices trié par score décroissant) ; un parcours de ce tableau attribue
+ensuite les rangs de tous les niveaux à la fois, chaque groupe (la France,
+une région, un département) tenant son propre compteur.
+
+Les ex æquo partagent le même rang :
+- `competition` (par défaut) : 1, 2, 2, 4 ;
+- `dense` : 1, 2, 2, 3.
+
+Le rang centile est la part du groupe classée en dessous de l'établissement,
+les ex æquo comptant pour moitié (100 = meilleur, 50 = médiane).
+"""
+
+METHODS = ('competition', 'dense')
+
+# Métriques classées par type d'établissement : {type: [(métrique, champ)]}
+# La première métrique de chaque type donne `rang` et `total_type`.
+METRICS = {
+    'ecole': [
+        ('ips', 'scores.ips')
+    ],
+    'college': [
+        ('score_composite', 'scores.score_composite'),
+        ('taux_reussite_brevet', 'scores.taux_reussite_brevet'),
+        ('taux_mentions_tb', 'scores.taux_mentions_tb'),
+        ('note_ecrit', 'scores.note_ecrit')
+    ],
+    'lycee': [
+        ('score_composite', 'scores.score_composite'),
+        ('taux_reussite_bac', 'scores.taux_reussite_bac'),
+        ('taux_mentions_tb', 'scores.taux_mentions_tb'),
+        ('taux_acces_2nde_bac', 'scores.taux_acces_2nde_bac')
+    ]
+}
+
+
+def primary_metric(type_):
+    """Retourne la métrique principale d'un type (celle de `rang`) : (métrique, champ), ou None."""
+    metrics = METRICS.get(type_)
+    return metrics[0] if metrics else None
+
+
+# Niveaux de classement : {niveau: champ donnant le groupe (None : un seul groupe, la France)}
+LEVELS = {
+    'national': None,
+    'region': 'region',
+    'departement': 'departement'
+}
+
+
+def argsort_desc(values):
+    """Retourne les indices de `values` triés par valeur décroissante (tri stable)."""
+    return sorted(range(len(values)), key=values.__getitem__, reverse=True)
+
+
+def rank_values(values, groups, method='competition'):
+    """Classe des valeurs au sein de leurs groupes, en un seul tri.
+
+    `groups` donne, pour chaque valeur, la liste de ses groupes (un par
+    niveau, None si l'établissement n'appartient à aucun groupe du niveau).
+
+    Retourne, pour chaque valeur, la liste de ses classements par niveau :
+    (rang, effectif du groupe, rang centile), ou None.
+    """
+    if method not in METHODS:
+        raise ValueError(f"Méthode de classement inconnue: {method}")
+
+    nb_levels = len(groups[0]) if groups else 0
+    # groupe -> [vus, dernière valeur, rang, rang dense, {rang: nombre d'ex æquo}]
+    counters = [{} for _ in range(nb_levels)]
+    positions = [[None] * nb_levels for _ in values]  # (rang, rang dense, compteur du groupe)
+
+    for i in argsort_desc(values):
+        value = values[i]
+        for level, group in enumerate(groups[i]):
+            if group is None:
+                continue
+            counter = counters[level].get(group)
+            if counter is None:
+                counter = counters[level][group] = [0, None, 0, 0, {}]
+            counter[0] += 1
+            if counter[0] == 1 or value != counter[1]:
+                counter[1] = value
+                counter[2] = counter[0]
+                counter[3] += 1
+            counter[4][counter[2]] = counter[4].get(counter[2], 0) + 1
+            positions[i][level] = (counter[2], counter[3], counter)
+
+    ranks = []
+    for position in positions:
+        result = []
+        for entry in position:
+            if entry is None:
+                result.append(None)
+                continue
+            rank, dense, counter = entry
+            total = counter[0]
+            tied = counter[4][rank]
+            below = total - (rank - 1) - tied
+            percentile = round(100 * (below + tied / 2) / total, 1)
+            result.append((rank if method == 'competition' else dense, total, percentile))
+        ranks.append(result)
+    return ranks
+
+
+def rank_etablissements(etablissements, method='competition', metrics=METRICS, levels=LEVELS):
+    """Classe les établissements (une `records.RecordTable`) pour chaque métrique et chaque niveau.
+
+    Ajoute à chaque établissement `classements` :
+    {métrique: {niveau: {'rang', 'total', 'percentile'}}}, ainsi que `rang`
+    et `total_type` (classement national de la métrique principale). Les
+    valeurs et les groupes sont lus colonne par colonne.
+
+    Retourne {type: nombre d'établissements classés sur la métrique principale}.
+    """
+    by_type = {}
+    for i, type_ in enumerate(etablissements.column('type')):
+        by_type.setdefault(type_, []).append(i)
+
+    # Groupe de chaque établissement, par niveau (une chaîne vide ne forme pas de groupe)
+    level_groups = [etablissements.column(path) if path else None for path in levels.values()]
+    level_groups = [column if column is None else [group or None for group in column]
+                    for column in level_groups]
+
+    counts = {}
+    for type_, type_metrics in metrics.items():
+        members = by_type.get(type_, [])
+        for position, (metric, path) in enumerate(type_metrics):
+            column = etablissements.column(path)
+            scored = [i for i in members if column[i] is not None]
+            if position == 0:
+                counts[type_] = len(scored)
+            if not scored:
+                continue
+
+            groups = [['France' if groups_of is None else groups_of[i] for groups_of in level_groups]
+                      for i in scored]
+            ranks = rank_values([column[i] for i in scored], groups, method)
+
+            for i, etab_ranks in zip(scored, ranks):
+                fields = []
+                for level, entry in zip(levels, etab_ranks):
+                    if entry is None:
+                        continue
+                    if position == 0 and level == 'national':
+                        fields += [('rang', entry[0]), ('total_type', entry[1])]
+                    prefix = f'classements.{metric}.{level}.'
+                    fields += [(prefix + 'rang', entry[0]), (prefix + 'total', entry[1]),
+                               (prefix + 'percentile', entry[2])]
+                etablissements.set_fields(i, fields)
+
+    return counts
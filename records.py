@@ -0,0 +1,445 @@
+"""
+Représentation compacte des établissements pendant la construction.
+
+Un dictionnaire par établissement (avec `scores` et `mentions` imbriqués et une
+dizaine de chaînes répétées) occupe de l'ordre de 1 à 2 Ko. `RecordTable`
+range à la place les établissements par colonnes :
+
+- un tableau typé par champ (`array`) : flottants, entiers, ou codes des
+  champs catégoriels (type, secteur, région, département, commune...) dont
+  chaque valeur distincte n'est stockée qu'une fois ;
+- une « forme » par établissement (liste ordonnée de ses champs, partagée par
+  tous les établissements qui ont les mêmes champs), comme dans columnar.py.
+
+La table se parcourt comme une liste d'établissements : chaque accès
+reconstruit le dictionnaire d'origine (mêmes clés, même ordre, mêmes types),
+ce qui n'a lieu qu'à l'écriture des fichiers. Les étapes de calcul (jointure
+des coordonnées, classement) lisent et écrivent directement les colonnes
+(`column`, `value`, `set_fields`).
+"""
+
+from array import array
+from collections.abc import Sequence
+
+from columnar import DICTIONARY_COLUMNS, flatten, full_column
+
+# Champs très répétés, encodés par catégorie (les mêmes que dans columnar.py)
+CATEGORICAL_FIELDS = frozenset(DICTIONARY_COLUMNS)
+
+# Valeurs sentinelles des valeurs absentes (None)
+MISSING_CODE = 0xFFFFFFFF
+MISSING_INT = -2 ** 63
+
+
+def _split_fields(record):
+    """Retourne les champs aplatis d'un établissement (voir columnar.flatten) : (noms, valeurs)."""
+    names = []
+    values = []
+    for key, value in record.items():
+        if type(value) is dict:
+            for name, nested in flatten(value, f'{key}.'):
+                names.append(name)
+                values.append(nested)
+        else:
+            names.append(key)
+            values.append(value)
+    return tuple(names), values
+
+
+class Column:
+    """Valeurs d'un champ, stockées selon leur type.
+
+    Le type est fixé par la première valeur renseignée : catégorie (chaîne
+    d'un champ de CATEGORICAL_FIELDS), flottant, entier, ou objet (liste
+    Python) pour tout le reste. Une valeur d'un autre type convertit la
+    colonne en liste d'objets, sans perte. Les données sont complétées par
+    des valeurs absentes au fur et à mesure des écritures.
+    """
+
+    __slots__ = ('name', 'kind', 'data', 'missing', 'values', 'index')
+
+    def __init__(self, name):
+        self.name = name
+        self.kind = None
+        self.data = None
+        self.missing = None  # Valeur stockée pour une valeur absente
+        self.values = None
+        self.index = None
+
+    def get(self, i):
+        # Les positions au-delà des données (ou avant la première valeur) sont absentes
+        if self.data is None or i >= len(self.data):
+            return None
+        value = self.data[i]
+        kind = self.kind
+        if kind == 'category':
+            return None if value == MISSING_CODE else self.values[value]
+        if kind == 'float':
+            return None if value != value else value
+        if kind == 'int':
+            return None if value == MISSING_INT else value
+        return value
+
+    def _init_kind(self, value):
+        """Choisit le stockage d'après la première valeur renseignée."""
+        if type(value) is str and self.name in CATEGORICAL_FIELDS:
+            self.kind, self.data, self.missing = 'category', array('I'), MISSING_CODE
+            self.values, self.index = [], {}
+        elif type(value) is float:
+            self.kind, self.data, self.missing = 'float', array('d'), float('nan')
+        elif type(value) is int and MISSING_INT < value < 2 ** 63:
+            self.kind, self.data, self.missing = 'int', array('q'), MISSING_INT
+        else:
+            self.kind, self.data, self.missing = 'object', [], None
+
+    def _init_like(self, other):
+        """Adopte le stockage de la colonne `other` (colonne encore vide)."""
+        self.kind, self.missing = other.kind, other.missing
+        self.data = [] if other.kind == 'object' else array(other.data.typecode)
+        if other.kind == 'category':
+            self.values, self.index = [], {}
+
+    def _to_objects(self):
+        """Convertit la colonne en liste d'objets (valeur d'un type inattendu)."""
+        self.data = [self.get(i) for i in range(len(self.data))]
+        self.kind, self.missing, self.values, self.index = 'object', None, None, None
+
+    def _encode(self, value):
+        """Retourne la valeur stockée pour `value`, ou None si la colonne doit changer de type."""
+        if value is None:
+            return self.missing
+        kind = self.kind
+        if kind == 'float':
+            return value if type(value) is float and value == value else None
+        if kind == 'category':
+            if type(value) is not str:
+                return None
+            code = self.index.get(value)
+            if code is None:
+                code = self.index[value] = len(self.values)
+                self.values.append(value)
+            return code
+        if kind == 'int':
+            return value if type(value) is int and MISSING_INT < value < 2 ** 63 else None
+        return value
+
+    def set(self, i, value):
+        data = self.data
+        # Cas courant : ajout en fin d'une valeur absente ou du type de la colonne
+        if data is not None and i == len(data):
+            kind = self.kind
+            if kind == 'object':
+                data.append(value)
+                return
+            if value is None:
+                data.append(self.missing)
+                return
+            if kind == 'float':
+                if type(value) is float and value == value:
+                    data.append(value)
+                    return
+            elif kind == 'category':
+                code = self.index.get(value) if type(value) is str else None
+                if code is not None:
+                    data.append(code)
+                    return
+            elif type(value) is int and MISSING_INT < value < 2 ** 63:
+                data.append(value)
+                return
+        if self.kind is None:
+            if value is None:
+                return
+            self._init_kind(value)
+
+        stored = self._encode(value)
+        if stored is None and self.kind != 'object':
+            self._to_objects()
+            stored = value
+
+        if i < len(self.data):
+            self.data[i] = stored
+            return
+        self._pad(i)
+        self.data.append(stored)
+
+    def _pad(self, size):
+        """Complète les données par des valeurs absentes jusqu'à `size` positions."""
+        missing = size - len(self.data)
+        if missing > 0:
+            if self.kind == 'object':
+                self.data.extend([None] * missing)
+            else:
+                self.data.extend(array(self.data.typecode, [self.missing]) * missing)
+
+    def _encode_all(self, values):
+        """Retourne les valeurs stockées pour `values`, ou None si l'une d'elles ne convient pas à la colonne."""
+        kind = self.kind
+        missing = self.missing
+        if kind == 'object':
+            return values
+        if kind == 'float':
+            if all(value is None or (type(value) is float and value == value) for value in values):
+                return [missing if value is None else value for value in values]
+        elif kind == 'int':
+            if all(value is None or (type(value) is int and MISSING_INT < value < 2 ** 63) for value in values):
+                return [missing if value is None else value for value in values]
+        elif all(value is None or type(value) is str for value in values):
+            index = self.index
+            for value in dict.fromkeys(values):
+                if value is not None and value not in index:
+                    index[value] = len(self.values)
+                    self.values.append(value)
+            return [missing if value is None else index[value] for value in values]
+        return None
+
+    def extend(self, offset, values):
+        """Écrit `values` aux positions `offset`, `offset` + 1... (ajout en fin de colonne)."""
+        if self.kind is None:
+            first = next((value for value in values if value is not None), None)
+            if first is None:
+                return
+            self._init_kind(first)
+        if len(self.data) <= offset:
+            stored = self._encode_all(values)
+            if stored is not None:
+                self._pad(offset)
+                self.data.extend(stored)
+                return
+        for j, value in enumerate(values):
+            self.set(offset + j, value)
+
+    def extend_from(self, offset, other):
+        """Recopie les valeurs de la colonne `other` à partir de la position `offset`."""
+        if other.data is None:
+            return
+        if self.kind is None:
+            self._init_like(other)
+        if self.kind == other.kind and len(self.data) <= offset:
+            self._pad(offset)
+            if self.kind == 'category':
+                codes = [self._encode(value) for value in other.values]
+                self.data.extend(MISSING_CODE if code == MISSING_CODE else codes[code] for code in other.data)
+            else:
+                self.data.extend(other.data)
+            return
+        for j in range(len(other.data)):
+            value = other.get(j)
+            if value is not None:
+                self.set(offset + j, value)
+
+    def nbytes(self):
+        """Taille approximative des données de la colonne (octets, hors objets référencés)."""
+        if self.data is None:
+            return 0
+        if isinstance(self.data, array):
+            return self.data.itemsize * len(self.data)
+        return 8 * len(self.data)
+
+
+class RecordTable(Sequence):
+    """Établissements rangés par colonnes (voir le docstring du module)."""
+
+    def __init__(self, records=()):
+        self.columns = {}
+        self.shapes = []
+        self.shape_fields = []  # Champs de chaque forme (ensemble)
+        self.shape_index = {}
+        self.shape_of = array('H')
+        self._plans = []
+        self._transitions = {}
+        for record in records:
+            self.append(record)
+
+    def __len__(self):
+        return len(self.shape_of)
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return [self.record(j) for j in range(*i.indices(len(self)))]
+        if i < 0:
+            i += len(self)
+        if not 0 <= i < len(self):
+            raise IndexError(i)
+        return self.record(i)
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self.record(i)
+
+    def _shape_id(self, shape):
+        shape_id = self.shape_index.get(shape)
+        if shape_id is None:
+            shape_id = self.shape_index[shape] = len(self.shapes)
+            self.shapes.append(shape)
+            self.shape_fields.append(frozenset(shape))
+            self._plans.append(None)
+            for path in shape:
+                if path not in self.columns:
+                    self.columns[path] = Column(path)
+        return shape_id
+
+    def append(self, record):
+        """Ajoute un établissement (dictionnaire au format JSON)."""
+        names, values = _split_fields(record)
+        i = len(self.shape_of)
+        shape_id = self.shape_index.get(names)
+        if shape_id is None:
+            shape_id = self._shape_id(names)
+        self.shape_of.append(shape_id)
+        for column, value in zip(self._columns_of(shape_id), values):
+            column.set(i, value)
+
+    def extend(self, records):
+        for record in records:
+            self.append(record)
+
+    def extend_columns(self, paths, columns):
+        """Ajoute des établissements donnés par colonnes, tous de même forme.
+
+        `paths` : chemins des champs (`scores.ips`), dans l'ordre des clés ;
+        `columns` : les valeurs de chaque champ, une liste par chemin.
+        """
+        if not columns:
+            return
+        offset = len(self.shape_of)
+        paths = tuple(paths)
+        shape_id = self.shape_index.get(paths)
+        if shape_id is None:
+            shape_id = self._shape_id(paths)
+        self.shape_of.extend(array('H', [shape_id]) * len(columns[0]))
+        for column, values in zip(self._columns_of(shape_id), columns):
+            column.extend(offset, values)
+
+    def _columns_of(self, shape_id):
+        """Colonnes des champs d'une forme, dans l'ordre."""
+        return [self.columns[path] for path in self.shapes[shape_id]]
+
+    def _plan(self, shape_id):
+        """Prépare la reconstruction des établissements d'une forme.
+
+        Retourne la liste des étapes (parent, clé, colonne) : la valeur de la
+        colonne est placée sous `clé` dans le dictionnaire n° `parent`, ou, si
+        la colonne vaut None, un nouveau sous-dictionnaire y est créé.
+        """
+        plan = self._plans[shape_id]
+        if plan is None:
+            plan = self._plans[shape_id] = []
+            slots = {(): 0}
+            for path in self.shapes[shape_id]:
+                keys = tuple(path.split('.'))
+                for depth in range(1, len(keys)):
+                    if keys[:depth] not in slots:
+                        slots[keys[:depth]] = len(slots)
+                        plan.append((slots[keys[:depth - 1]], keys[depth - 1], None))
+                plan.append((slots[keys[:-1]], keys[-1], self.columns[path]))
+        return plan
+
+    def record(self, i):
+        """Reconstruit l'établissement `i` au format JSON (dictionnaire)."""
+        record = {}
+        slots = [record]
+        for parent, key, column in self._plan(self.shape_of[i]):
+            if column is None:
+                child = slots[parent][key] = {}
+                slots.append(child)
+            else:
+                slots[parent][key] = column.get(i)
+        return record
+
+    def value(self, i, path, default=None):
+        """Retourne la valeur du champ `path` (`scores.ips`) de l'établissement `i`."""
+        column = self.columns.get(path)
+        if column is None or path not in self.shape_fields[self.shape_of[i]]:
+            return default
+        return column.get(i)
+
+    def column(self, path):
+        """Retourne les valeurs d'un champ pour tous les établissements (None si absent)."""
+        column = self.columns.get(path)
+        if column is None:
+            return [None] * len(self)
+        present = [path in fields for fields in self.shape_fields]
+        return [column.get(i) if present[s] else None for i, s in enumerate(self.shape_of)]
+
+    def layout(self):
+        """Retourne les formes utilisées, dans l'ordre de leur première apparition, et la forme de chaque établissement.
+
+        Même disposition que le format colonnaire (`shapes` et colonne `_shape`,
+        voir columnar.encode).
+        """
+        order = {shape_id: index for index, shape_id in enumerate(dict.fromkeys(self.shape_of))}
+        return [list(self.shapes[shape_id]) for shape_id in order], [order[shape_id] for shape_id in self.shape_of]
+
+    def select(self, *paths):
+        """Retourne les établissements réduits aux champs `paths` : [{chemin: valeur}].
+
+        Pour les traitements qui n'ont besoin que de quelques champs (index
+        spatial, index de recherche) sans reconstruire les établissements complets.
+        """
+        columns = [self.column(path) for path in paths]
+        return [dict(zip(paths, values)) for values in zip(*columns)]
+
+    def set_fields(self, i, items):
+        """Ajoute ou remplace des champs de l'établissement `i` : [(chemin, valeur)].
+
+        Les champs nouveaux sont ajoutés à la fin, comme dans un dictionnaire.
+        """
+        paths = tuple(path for path, _ in items)
+        shape_id = self.shape_of[i]
+        key = (shape_id, paths)
+        new_id = self._transitions.get(key)
+        if new_id is None:
+            shape = self.shapes[shape_id]
+            existing = self.shape_fields[shape_id]
+            added = tuple(path for path in dict.fromkeys(paths) if path not in existing)
+            new_id = self._transitions[key] = self._shape_id(shape + added)
+        self.shape_of[i] = new_id
+        columns = self.columns
+        for path, value in items:
+            columns[path].set(i, value)
+
+    @classmethod
+    def from_columnar(cls, data, rows=None):
+        """Construit une table à partir d'un jeu de données au format colonnaire (voir columnar.py).
+
+        Les colonnes sont reprises telles quelles, sans reconstruire de
+        dictionnaire par établissement. Avec `rows`, seuls les établissements
+        de ces positions sont repris, dans l'ordre.
+        """
+        shape_column = data['columns']['_shape']
+        if rows is None:
+            rows = range(len(shape_column))
+
+        table = cls()
+        shape_ids = {}
+        for row in rows:
+            shape = shape_column[row]
+            shape_id = shape_ids.get(shape)
+            if shape_id is None:
+                shape_id = shape_ids[shape] = table._shape_id(tuple(data['shapes'][shape]))
+            table.shape_of.append(shape_id)
+
+        for path, column in table.columns.items():
+            values = full_column(data, path)
+            values = [values[row] for row in rows]
+            dictionary = data['dictionaries'].get(path)
+            if dictionary is not None:
+                values = [None if value is None else dictionary[value] for value in values]
+            column.extend(0, values)
+        return table
+
+    @classmethod
+    def concat(cls, tables):
+        """Rassemble plusieurs tables, dans l'ordre, colonne par colonne."""
+        result = cls()
+        for table in tables:
+            offset = len(result)
+            shape_ids = [result._shape_id(shape) for shape in table.shapes]
+            result.shape_of.extend(shape_ids[s] for s in table.shape_of)
+            for path, column in table.columns.items():
+                result.columns[path].extend_from(offset, column)
+        return result
+
+    def nbytes(self):
+        """Taille approximative des colonnes (octets, hors chaînes et objets référencés)."""
+        return self.shape_of.itemsize * len(self.shape_of) + sum(c.nbytes() for c in self.columns.values())
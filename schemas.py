@@ -0,0 +1,399 @@
+"""
+Schémas des fichiers sources (écoles, collèges, lycées).
+
+Chaque source est décrite une fois, de façon déclarative :
+
+- les colonnes lues : nom du champ, en-tête du CSV et type (texte, décimal,
+  entier, secteur...) ; les marqueurs de valeur absente (NULL_MARKERS : '',
+  'NS', 'ND') donnent None ;
+- les champs dérivés (taux de mentions TB, score composite...), calculés à
+  partir des champs lus ;
+- la période (année, session), le champ sans lequel une ligne est ignorée et
+  la forme de l'établissement produit (`record`).
+
+La conversion se fait par lots de lignes, colonne par colonne : chaque
+convertisseur reçoit toutes les valeurs d'une colonne et garde en mémoire les
+valeurs déjà converties (les mêmes chaînes reviennent d'une ligne à l'autre :
+années, codes, effectifs, taux arrondis), si bien que l'essentiel des cellules
+est converti par une simple lecture de dictionnaire. Les lots produits
+({champ: valeurs}) sont rangés tels quels, colonne par colonne, dans la table
+des établissements (voir create_dataset.keep_latest et
+records.RecordTable.extend_columns).
+
+Un fichier qui ne correspond plus au schéma est refusé dès la lecture de
+l'en-tête (colonne absente ou renommée) ou du premier lot (colonne numérique
+sans aucune valeur numérique) : `SchemaError`, plutôt qu'un champ
+silencieusement vide dans tout le jeu de données.
+"""
+
+import csv
+from itertools import islice
+from operator import itemgetter
+
+# Valeurs considérées comme absentes (non significatif, non disponible)
+NULL_MARKERS = frozenset(('', 'NS', 'ND'))
+
+# Nombre de lignes converties à la fois
+BATCH_SIZE = 4096
+
+# Nombre maximal de valeurs distinctes mémorisées par convertisseur
+MEMO_SIZE = 1 << 16
+
+
+class SchemaError(ValueError):
+    """Le fichier source ne correspond pas à son schéma."""
+
+
+def _decimal(value):
+    if value in NULL_MARKERS:
+        return None
+    try:
+        return float(value.replace(',', '.'))
+    except ValueError:
+        return None
+
+
+def _integer(value):
+    if value in NULL_MARKERS:
+        return None
+    try:
+        return int(float(value))
+    except ValueError:
+        return None
+
+
+def _raw(value):
+    return value or None
+
+
+def _secteur(value):
+    return 'public' if 'public' in value.lower() else 'prive'
+
+
+def _secteur_code(value):
+    return 'public' if value.strip() == 'PU' else 'prive'
+
+
+class _Memo(dict):
+    """Valeurs converties, indexées par la chaîne lue ; les nouvelles sont converties à la demande."""
+
+    __slots__ = ('convert',)
+
+    def __init__(self, convert):
+        super().__init__()
+        self.convert = convert
+
+    def __missing__(self, value):
+        if len(self) >= MEMO_SIZE:
+            self.clear()
+        converted = self[value] = self.convert(value)
+        return converted
+
+
+class Converter:
+    """Type d'une colonne : convertit les chaînes d'une colonne en liste de valeurs.
+
+    `numeric` indique une colonne dont au moins une valeur doit être
+    convertible (contrôle de dérive du schéma, voir `check`).
+    """
+
+    def __init__(self, name, convert, numeric=False):
+        self.name = name
+        self.convert = convert
+        self.numeric = numeric
+
+    def __repr__(self):
+        return f'<Converter {self.name}>'
+
+    def converter(self):
+        """Retourne une fonction de conversion de colonne, avec sa propre mémoire."""
+        memo = _Memo(self.convert)
+        lookup = memo.__getitem__
+
+        def convert(values):
+            return list(map(lookup, values))
+        convert.memo = memo
+        return convert
+
+    def check(self, memo, field, header, filename):
+        """Lève SchemaError si une colonne numérique ne contient que des valeurs non numériques."""
+        if not self.numeric:
+            return
+        invalid = [value for value, converted in memo.items()
+                   if converted is None and value not in NULL_MARKERS]
+        if invalid and all(converted is None for converted in memo.values()):
+            raise SchemaError(f"{filename} : colonne {header!r} ({field}) : aucune valeur de type {self.name} "
+                              f"(ex. {invalid[0]!r})")
+
+
+# Types de colonnes
+TEXT = Converter('texte', str.strip)
+RAW = Converter('brut', _raw)
+DECIMAL = Converter('décimal', _decimal, numeric=True)
+INTEGER = Converter('entier', _integer, numeric=True)
+# Secteur en toutes lettres (« Public », « Privé sous contrat ») ou en code (PU / PR)
+SECTEUR = Converter('secteur', _secteur)
+SECTEUR_CODE = Converter('secteur', _secteur_code)
+
+
+def taux_mentions_college(nb_mentions_tb, nb_candidats):
+    """Part des candidats reçus avec la mention TB (en %)."""
+    if nb_candidats and nb_candidats > 0 and nb_mentions_tb is not None:
+        return round((nb_mentions_tb / nb_candidats) * 100, 2)
+    return None
+
+
+def score_college(taux_reussite, note_ecrit):
+    """Score composite d'un collège : taux de réussite × note à l'écrit."""
+    if taux_reussite and note_ecrit:
+        return round(taux_reussite * note_ecrit, 2)
+    return None
+
+
+def taux_mentions_lycee(nb_tb_fel, nb_tb, nb_presents):
+    """Part des présents reçus avec la mention TB, avec ou sans félicitations (en %)."""
+    nb_mentions_tb_total = (nb_tb_fel or 0) + (nb_tb or 0)
+    if nb_presents and nb_presents > 0 and nb_mentions_tb_total > 0:
+        return round((nb_mentions_tb_total / nb_presents) * 100, 2)
+    return None
+
+
+def score_lycee(taux_reussite_toutes, taux_mentions_toutes):
+    """Score composite d'un lycée : taux de réussite × taux de mentions (toutes séries) / 100."""
+    if taux_reussite_toutes and taux_mentions_toutes:
+        return round((taux_reussite_toutes * taux_mentions_toutes) / 100, 2)
+    return None
+
+
+class SourceSchema:
+    """Schéma d'un fichier source.
+
+    - `columns` : liste de (champ, en-tête, type) ;
+    - `derived` : liste de (champ, champs utilisés, fonction) ;
+    - `constants` : {champ: valeur} ;
+    - `periode` : champ de la période (les lignes sans période sont ignorées) ;
+    - `required` : champ sans lequel la ligne ne produit pas d'établissement ;
+    - `record` : forme de l'établissement, liste de champs ou de
+      (clé, liste de champs) pour les dictionnaires imbriqués.
+
+    `read` produit des lots de lignes converties, {champ: valeurs}, que
+    create_dataset.keep_latest range directement par colonnes (`paths`,
+    `record_fields`) ; `build` reconstruit au besoin un établissement.
+    """
+
+    def __init__(self, name, columns, record, periode, required, derived=(), constants=None, delimiter=';'):
+        self.name = name
+        self.columns = list(columns)
+        self.derived = list(derived)
+        self.constants = dict(constants or {})
+        self.periode = periode
+        self.required = required
+        self.delimiter = delimiter
+
+        fields = ([field for field, _, _ in self.columns] + [field for field, _, _ in self.derived]
+                  + list(self.constants))
+        if len(set(fields)) != len(fields):
+            raise ValueError(f"Schéma {name} : champ défini plusieurs fois")
+        known = set(fields)
+        used = [periode, required] + [input_ for _, inputs, _ in self.derived for input_ in inputs]
+        for entry in record:
+            used.extend(entry[1] if isinstance(entry, tuple) else [entry])
+        unknown = [field for field in used if field not in known]
+        if unknown:
+            raise ValueError(f"Schéma {name} : champs inconnus {unknown}")
+        self.fields = fields
+
+        # Forme de l'établissement : clés de premier niveau et dictionnaires imbriqués,
+        # et chemins des champs aplatis (`scores.ips`, voir columnar.flatten)
+        self.record = [(entry[0], tuple(entry[1])) if isinstance(entry, tuple) else entry
+                       for entry in record]
+        self.paths = []
+        self.record_fields = []
+        for entry in self.record:
+            if isinstance(entry, tuple):
+                key, nested = entry
+                self.paths.extend(f'{key}.{field}' for field in nested)
+                self.record_fields.extend(nested)
+            else:
+                self.paths.append(entry)
+                self.record_fields.append(entry)
+        self.paths = tuple(self.paths)
+
+    @property
+    def headers(self):
+        """En-têtes de colonnes attendus, dans l'ordre du schéma (sans doublons)."""
+        return list(dict.fromkeys(header for _, header, _ in self.columns))
+
+    def resolve(self, header, filename=None):
+        """Retourne la position de chaque colonne du schéma dans `header` ; SchemaError si l'une manque."""
+        header = [name.strip() for name in header]
+        positions = {}
+        for i, name in enumerate(header):
+            positions.setdefault(name, i)
+        missing = [name for name in self.headers if name not in positions]
+        if missing:
+            raise SchemaError(f"{filename or self.name} : colonne(s) absente(s) ou renommée(s) : "
+                              f"{', '.join(map(repr, missing))}")
+        return [positions[header_] for _, header_, _ in self.columns]
+
+    def read(self, filepath, batch_size=BATCH_SIZE):
+        """Lit un fichier en flux et produit ses lignes converties, par lots de `batch_size` : {champ: valeurs}."""
+        with open(filepath, 'r', encoding='utf-8-sig', newline='') as f:
+            reader = csv.reader(f, delimiter=self.delimiter)
+            header = next(reader, None)
+            if header is None:
+                raise SchemaError(f"{filepath} : fichier vide")
+            indices = self.resolve(header, filepath)
+            yield from self.convert(reader, indices, batch_size, filepath)
+
+    def convert(self, rows, indices, batch_size=BATCH_SIZE, filename=None):
+        """Convertit des lignes brutes (listes de chaînes) par lots, colonne par colonne.
+
+        `indices` donne la position de chaque colonne du schéma dans les lignes (voir `resolve`).
+        """
+        converters = [type_.converter() for _, _, type_ in self.columns]
+        getters = [itemgetter(i) for i in indices]
+        width = max(indices) + 1
+        first = True
+        rows = iter(rows)
+
+        while True:
+            lines = list(islice(rows, batch_size))
+            if not lines:
+                return
+            try:
+                values = [convert(map(get, lines)) for convert, get in zip(converters, getters)]
+            except IndexError:
+                # Lignes incomplètes : les cellules manquantes sont vides
+                lines = [line + [''] * (width - len(line)) for line in lines]
+                values = [convert(map(get, lines)) for convert, get in zip(converters, getters)]
+
+            if first:
+                for (field, header, type_), convert in zip(self.columns, converters):
+                    type_.check(convert.memo, field, header, filename or self.name)
+                first = False
+
+            batch = {field: column for (field, _, _), column in zip(self.columns, values)}
+            for field, inputs, function in self.derived:
+                batch[field] = list(map(function, *(batch[input_] for input_ in inputs)))
+            for field, value in self.constants.items():
+                batch[field] = [value] * len(lines)
+            yield batch
+
+    def build(self, batch, i):
+        """Construit l'établissement de la ligne `i` d'un lot (dictionnaire au format JSON)."""
+        record = {}
+        for entry in self.record:
+            if isinstance(entry, tuple):
+                key, nested = entry
+                record[key] = {field: batch[field][i] for field in nested}
+            else:
+                record[entry] = batch[entry][i]
+        return record
+
+
+# Colonnes de localisation communes aux trois formes d'établissement
+LOCATION = ['code_region', 'region', 'code_departement', 'departement', 'code_insee', 'commune', 'annee']
+
+ECOLES = SourceSchema(
+    'ecoles',
+    columns=[
+        ('uai', 'UAI', TEXT),
+        ('nom', "Nom de l'établissement", TEXT),
+        ('secteur', 'Secteur', SECTEUR),
+        ('code_region', 'Code région', TEXT),
+        ('region', 'Région', TEXT),
+        ('code_departement', 'Code du département', TEXT),
+        ('departement', 'Département', TEXT),
+        ('code_insee', 'Code INSEE de la commune', TEXT),
+        ('commune', 'Nom de la commune', TEXT),
+        ('rentree', 'Rentrée scolaire', RAW),
+        ('annee', 'Rentrée scolaire', TEXT),
+        ('ips', 'IPS', DECIMAL),
+        ('ips_national', 'IPS national', DECIMAL),
+        ('ips_academique', 'IPS académique', DECIMAL),
+        ('ips_departemental', 'IPS départemental', DECIMAL),
+    ],
+    constants={'type': 'ecole'},
+    periode='rentree',
+    required='ips',
+    record=['uai', 'nom', 'type', 'secteur', *LOCATION,
+            ('scores', ['ips', 'ips_national', 'ips_academique', 'ips_departemental'])]
+)
+
+COLLEGES = SourceSchema(
+    'colleges',
+    columns=[
+        ('uai', 'UAI', TEXT),
+        ('nom', "Nom de l'établissement", TEXT),
+        ('secteur', 'Secteur', SECTEUR_CODE),
+        ('code_region', 'Code région académique', TEXT),
+        ('region', 'Région académique', TEXT),
+        ('code_departement', 'Code département', TEXT),
+        ('departement', 'Département', TEXT),
+        ('commune', 'Commune', TEXT),
+        ('session', 'Session', INTEGER),
+        ('taux_reussite_brevet', 'Taux de réussite G', DECIMAL),
+        ('nb_candidats', 'Nb candidats G', INTEGER),
+        ('note_ecrit', "Note à l'écrit G", DECIMAL),
+        ('nb_mentions_ab', 'Nb mentions AB G', INTEGER),
+        ('nb_mentions_b', 'Nb mentions B G', INTEGER),
+        ('nb_mentions_tb', 'Nb mentions TB G', INTEGER),
+        ('nb_mentions_total', 'Nb mentions global G', INTEGER),
+    ],
+    derived=[
+        ('annee', ['session'], str),
+        ('taux_mentions_tb', ['nb_mentions_tb', 'nb_candidats'], taux_mentions_college),
+        ('score_composite', ['taux_reussite_brevet', 'note_ecrit'], score_college),
+    ],
+    # Code INSEE non disponible dans ce fichier
+    constants={'type': 'college', 'code_insee': ''},
+    periode='session',
+    required='taux_reussite_brevet',
+    record=['uai', 'nom', 'type', 'secteur', *LOCATION,
+            ('scores', ['taux_reussite_brevet', 'taux_mentions_tb', 'score_composite',
+                        'nb_candidats', 'note_ecrit']),
+            ('mentions', ['nb_mentions_ab', 'nb_mentions_b', 'nb_mentions_tb', 'nb_mentions_total'])]
+)
+
+LYCEES = SourceSchema(
+    'lycees',
+    columns=[
+        ('uai', 'UAI', TEXT),
+        ('nom', 'Etablissement', TEXT),
+        ('secteur', 'Secteur', SECTEUR),
+        ('code_region', 'Code région', TEXT),
+        ('region', 'Region', TEXT),
+        ('code_departement', 'Code departement', TEXT),
+        ('departement', 'Département', TEXT),
+        ('code_insee', 'Code commune', TEXT),
+        ('commune', 'Commune', TEXT),
+        ('session', 'Année', INTEGER),
+        # Bac général uniquement
+        ('taux_reussite_bac', 'Taux de réussite - Gnle', DECIMAL),
+        ('taux_acces_2nde_bac', "Taux d'accès 2nde-bac", DECIMAL),
+        ('nb_presents', 'Présents - Gnle', INTEGER),
+        ('taux_mentions', 'Taux de mentions - Gnle', DECIMAL),
+        ('nb_mentions_tb_fel', 'Nombre de mentions TB avec félicitations - G', INTEGER),
+        ('nb_mentions_tb', 'Nombre de mentions TB sans félicitations - G', INTEGER),
+        ('nb_mentions_b', 'Nombre de mentions B - G', INTEGER),
+        ('nb_mentions_ab', 'Nombre de mentions AB - G', INTEGER),
+        ('taux_reussite_toutes', 'Taux de réussite - Toutes séries', DECIMAL),
+        ('taux_mentions_toutes', 'Taux de mentions - Toutes séries', DECIMAL),
+    ],
+    derived=[
+        ('annee', ['session'], str),
+        ('taux_mentions_tb', ['nb_mentions_tb_fel', 'nb_mentions_tb', 'nb_presents'], taux_mentions_lycee),
+        ('score_composite', ['taux_reussite_toutes', 'taux_mentions_toutes'], score_lycee),
+    ],
+    constants={'type': 'lycee'},
+    periode='session',
+    required='taux_reussite_bac',
+    record=['uai', 'nom', 'type', 'secteur', *LOCATION,
+            ('scores', ['taux_reussite_bac', 'taux_mentions_tb', 'score_composite',
+                        'taux_acces_2nde_bac', 'nb_presents']),
+            ('mentions', ['taux_mentions', 'nb_mentions_tb_fel', 'nb_mentions_tb',
+                          'nb_mentions_b', 'nb_mentions_ab'])]
+)
+
+SCHEMAS = {schema.name: schema for schema in (ECOLES, COLLEGES, LYCEES)}
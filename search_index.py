@@ -0,0 +1,243 @@
+#!/usr/bin/env python3
+"""
+Index de recherche des établissements par nom et par commune.
+
+La recherche reproduit celle du front-end (js/search.js) : une requête, sans
+accents ni majuscules, doit apparaître dans le nom ou la commune. Au lieu de
+parcourir tous les établissements, on utilise un index de trigrammes :
+
+- `strings` : les noms et communes distincts, normalisés ;
+- `grams` : pour chaque trigramme, les identifiants des chaînes qui le
+  contiennent (listes triées, encodées par différences) ;
+- `nom` / `commune` : pour chaque chaîne, les établissements qui la portent.
+
+Une chaîne est complétée par le marqueur de fin `$`, de sorte qu'une requête de
+deux caractères se résout par les trigrammes qui commencent par elle. Le coût
+d'une recherche dépend des listes de trigrammes de la requête et du nombre de
+résultats, pas de la taille du jeu de données.
+"""
+
+import argparse
+import json
+import unicodedata
+from bisect import bisect_left
+from pathlib import Path
+
+import columnar
+import serialization
+
+END = '$'
+MIN_QUERY_LENGTH = 2
+
+FORMAT_VERSION = 1
+
+# Index écrit par create_dataset.py --search-index, à côté du jeu de données
+INDEX_FILE = 'etablissements_france.search.json'
+
+
+def normalize(text):
+    """Normalise une chaîne comme `Search.normalizeString` (minuscules, sans accents)."""
+    if not text:
+        return ''
+    decomposed = unicodedata.normalize('NFD', text.lower())
+    return ''.join(c for c in decomposed if not '\u0300' <= c <= '\u036f')
+
+
+def trigrams(text):
+    """Retourne les trigrammes distincts d'une chaîne normalisée, marqueur de fin compris."""
+    text = text + END
+    return {text[i:i + 3] for i in range(len(text) - 2)}
+
+
+def delta_encode(values):
+    """Encode une liste triée d'entiers par différences successives."""
+    previous = 0
+    encoded = []
+    for value in values:
+        encoded.append(value - previous)
+        previous = value
+    return encoded
+
+
+def delta_decode(values):
+    """Décode une liste encodée par `delta_encode`."""
+    total = 0
+    decoded = []
+    for value in values:
+        total += value
+        decoded.append(total)
+    return decoded
+
+
+def build_index(etablissements):
+    """Construit l'index de recherche (dictionnaire sérialisable en JSON)."""
+    string_ids = {}
+    strings = []
+    nom_docs = []
+    commune_docs = []
+
+    def string_id(text):
+        sid = string_ids.get(text)
+        if sid is None:
+            sid = string_ids[text] = len(strings)
+            strings.append(text)
+            nom_docs.append([])
+            commune_docs.append([])
+        return sid
+
+    for doc, etab in enumerate(etablissements):
+        nom = normalize(etab.get('nom'))
+        if nom:
+            nom_docs[string_id(nom)].append(doc)
+        commune = normalize(etab.get('commune'))
+        if commune:
+            commune_docs[string_id(commune)].append(doc)
+
+    grams = {}
+    for sid, text in enumerate(strings):
+        for gram in trigrams(text):
+            grams.setdefault(gram, []).append(sid)
+
+    return {
+        'version': FORMAT_VERSION,
+        'uai': [e['uai'] for e in etablissements],
+        'type': [e['type'] for e in etablissements],
+        'strings': strings,
+        'nom': [delta_encode(docs) for docs in nom_docs],
+        'commune': [delta_encode(docs) for docs in commune_docs],
+        'grams': {gram: delta_encode(sids) for gram, sids in sorted(grams.items())}
+    }
+
+
+class SearchIndex:
+    """Recherche dans un index produit par `build_index`."""
+
+    def __init__(self, data, etablissements):
+        by_key = {(e['uai'], e['type']): e for e in etablissements}
+        self.docs = [by_key.get(key) for key in zip(data['uai'], data['type'])]
+        self.strings = data['strings']
+        self.nom = data['nom']
+        self.commune = data['commune']
+        self.grams = data['grams']
+        self.gram_keys = sorted(self.grams)
+        self._decoded = {}
+
+    def _postings(self, gram):
+        """Retourne les chaînes contenant un trigramme (décodées à la demande)."""
+        postings = self._decoded.get(gram)
+        if postings is None:
+            postings = self._decoded[gram] = delta_decode(self.grams.get(gram, []))
+        return postings
+
+    def matching_strings(self, query):
+        """Retourne les identifiants des chaînes contenant la requête normalisée."""
+        if len(query) < 3:
+            # Tous les trigrammes commençant par la requête (y compris « xy$ »)
+            start = bisect_left(self.gram_keys, query)
+            candidates = set()
+            for gram in self.gram_keys[start:]:
+                if not gram.startswith(query):
+                    break
+                candidates.update(self._postings(gram))
+            return sorted(candidates)
+
+        # Intersection des listes, de la plus courte à la plus longue
+        postings = sorted((self._postings(gram) for gram in {query[i:i + 3] for i in range(len(query) - 2)}),
+                          key=len)
+        candidates = set(postings[0])
+        for other in postings[1:]:
+            candidates.intersection_update(other)
+            if not candidates:
+                return []
+        # Les trigrammes ne garantissent pas l'ordre : vérifier la sous-chaîne
+        return sorted(sid for sid in candidates if query in self.strings[sid])
+
+    def search(self, query, limit=20):
+        """Retourne les établissements dont le nom ou la commune contient `query`.
+
+        Classement : nom commençant par la requête (ou un de ses mots), puis
+        nom contenant la requête, puis commune contenant la requête.
+        """
+        query = normalize(query.strip())
+        if len(query) < MIN_QUERY_LENGTH:
+            return []
+
+        ranked = []
+        for sid in self.matching_strings(query):
+            text = self.strings[sid]
+            position = text.find(query)
+            word_start = position == 0 or not text[position - 1].isalnum()
+            for doc in delta_decode(self.nom[sid]):
+                ranked.append((0 if word_start else 1, doc))
+            for doc in delta_decode(self.commune[sid]):
+                ranked.append((2, doc))
+
+        ranked.sort()
+        results = []
+        seen = set()
+        for _, doc in ranked:
+            if doc in seen or self.docs[doc] is None:
+                continue
+            seen.add(doc)
+            results.append(self.docs[doc])
+            if limit and len(results) >= limit:
+                break
+        return results
+
+
+def write_index(index, filepath, compress=()):
+    """Écrit l'index de recherche (JSON compact, voir serialization.write_json)."""
+    return serialization.write_json(index, filepath, compress=compress)
+
+
+def read_index(filepath, etablissements):
+    """Lit un index écrit par `write_index`.
+
+    ValueError si l'index ne correspond pas aux établissements (version du
+    format, établissement absent du jeu de données).
+    """
+    with open(filepath, 'r', encoding='utf-8') as f:
+        data = json.load(f)
+    if data.get('version') != FORMAT_VERSION:
+        raise ValueError(f"Version d'index de recherche non supportée: {data.get('version')}")
+    index = SearchIndex(data, etablissements)
+    missing = [f'{type_} {uai}' for (uai, type_), doc in zip(zip(data['uai'], data['type']), index.docs)
+               if doc is None]
+    if missing:
+        raise ValueError(f"Index de recherche périmé : {len(missing)} établissements absents du jeu de données "
+                         f"({', '.join(missing[:3])}...)")
+    return index
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Recherche d'établissements par nom ou commune.")
+    parser.add_argument('query')
+    parser.add_argument('-n', '--limit', type=int, default=20, help="nombre de résultats (défaut : 20)")
+    parser.add_argument('--dataset', type=Path,
+                        default=Path(__file__).parent / 'etablissements_france.json',
+                        help="jeu de données (à défaut, sa version colonnaire .columns.json)")
+    parser.add_argument('--index', type=Path, default=None,
+                        help=f"index sérialisé (défaut : {INDEX_FILE} à côté du jeu de données)")
+    parser.add_argument('--rebuild', action='store_true',
+                        help="reconstruire l'index à partir du jeu de données au lieu de lire le fichier")
+    args = parser.parse_args(argv)
+
+    etablissements = columnar.read_dataset(args.dataset)['etablissements']
+    if args.rebuild:
+        index = SearchIndex(build_index(etablissements), etablissements)
+    else:
+        index_path = args.index or args.dataset.parent / INDEX_FILE
+        if not index_path.exists():
+            raise SystemExit(f"{index_path} introuvable (lancer create_dataset.py --search-index, "
+                             "ou utiliser --rebuild)")
+        try:
+            index = read_index(index_path, etablissements)
+        except (ValueError, KeyError) as error:
+            raise SystemExit(f"{index_path} illisible : {error}")
+
+    for etab in index.search(args.query, args.limit):
+        print(f"{etab['uai']}  {etab['type']:<8} {etab['nom']} ({etab['commune']}, {etab['departement']})")
+
+
+if __name__ == '__main__':
+    main()
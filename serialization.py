@@ -0,0 +1,139 @@
+"""
+Écriture des fichiers JSON produits (jeu de données, références, index...).
+
+- Mode compact par défaut (sans indentation ni espaces), `indent=2` pour un
+  fichier lisible.
+- En mode compact, une liste volumineuse (`stream_key`, par exemple
+  `etablissements`) est encodée élément par élément, par lots : le document
+  encodé n'est jamais entièrement en mémoire.
+- Des copies pré-compressées (`.json.gz`, `.json.br`) peuvent être écrites
+  dans la même passe, pour un serveur qui les sert telles quelles.
+
+orjson est utilisé s'il est installé, sinon le module json de la bibliothèque
+standard (encodeur C en mode compact). brotli est facultatif également ; les
+modules de compression ne sont importés qu'à l'écriture d'une copie compressée.
+"""
+
+import json
+from collections.abc import Sequence
+from importlib.util import find_spec
+from itertools import islice
+from pathlib import Path
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# brotli installé (importé par `_BrotliWriter`)
+HAS_BROTLI = find_spec('brotli') is not None
+
+COMPRESSIONS = ('gz', 'br')
+
+# Nombre d'éléments encodés ensemble par le mode flux
+BATCH_SIZE = 512
+
+GZIP_LEVEL = 9
+BROTLI_QUALITY = 11
+
+
+def _default(obj):
+    """Encode les séquences autres que les listes (par exemple une `records.RecordTable`)."""
+    if isinstance(obj, Sequence) and not isinstance(obj, (str, bytes)):
+        return list(obj)
+    raise TypeError(f"Type non sérialisable en JSON: {type(obj).__name__}")
+
+
+def encode(obj, indent=None):
+    """Encode un objet en JSON (UTF-8, caractères non ASCII conservés)."""
+    if orjson is not None:
+        return orjson.dumps(obj, default=_default, option=orjson.OPT_INDENT_2 if indent else 0)
+    if indent:
+        return json.dumps(obj, ensure_ascii=False, indent=indent, default=_default).encode('utf-8')
+    return json.dumps(obj, ensure_ascii=False, separators=(',', ':'), default=_default).encode('utf-8')
+
+
+def iter_chunks(obj, stream_key=None):
+    """Encode un objet en mode compact, morceau par morceau.
+
+    La séquence `obj[stream_key]` (liste ou `records.RecordTable`) est encodée
+    par lots de BATCH_SIZE éléments.
+    """
+    items = obj.get(stream_key) if stream_key is not None else None
+    if not isinstance(items, Sequence) or isinstance(items, (str, bytes)):
+        yield encode(obj)
+        return
+
+    yield b'{'
+    for position, (key, value) in enumerate(obj.items()):
+        yield (b',' if position else b'') + encode(key) + b':'
+        if key != stream_key:
+            yield encode(value)
+            continue
+        yield b'['
+        iterator = iter(value)
+        separator = b''
+        while True:
+            batch = b','.join(encode(item) for item in islice(iterator, BATCH_SIZE))
+            if not batch:
+                break
+            yield separator + batch
+            separator = b','
+        yield b']'
+    yield b'}'
+
+
+class _BrotliWriter:
+    """Fichier .br alimenté au fil de l'eau."""
+
+    def __init__(self, filepath):
+        import brotli
+        self.file = open(filepath, 'wb')
+        self.compressor = brotli.Compressor(quality=BROTLI_QUALITY)
+
+    def write(self, data):
+        self.file.write(self.compressor.process(data))
+
+    def close(self):
+        self.file.write(self.compressor.finish())
+        self.file.close()
+
+
+def _open_companion(filepath, compression):
+    """Ouvre la copie compressée `compression` d'un fichier."""
+    if compression == 'gz':
+        import gzip
+        # mtime fixe : deux constructions identiques donnent le même fichier
+        return gzip.GzipFile(f'{filepath}.gz', 'wb', compresslevel=GZIP_LEVEL, mtime=0)
+    return _BrotliWriter(f'{filepath}.br')
+
+
+def write_json(obj, filepath, indent=None, stream_key=None, compress=()):
+    """Écrit `obj` en JSON dans `filepath`, et ses copies compressées `compress` ('gz', 'br').
+
+    Sans `indent`, l'écriture se fait en flux (voir `iter_chunks`). Une
+    compression indisponible (brotli non installé) est ignorée.
+
+    Retourne la liste des fichiers écrits.
+    """
+    filepath = Path(filepath)
+    compress = [c for c in compress if c != 'br' or HAS_BROTLI]
+    chunks = [encode(obj, indent)] if indent else iter_chunks(obj, stream_key)
+
+    companions = [_open_companion(filepath, c) for c in compress]
+    try:
+        with open(filepath, 'wb') as f:
+            for chunk in chunks:
+                f.write(chunk)
+                for companion in companions:
+                    companion.write(chunk)
+    finally:
+        for companion in companions:
+            companion.close()
+
+    return [filepath] + [Path(f'{filepath}.{c}') for c in compress]
+
+
+def missing_compressions(compress):
+    """Retourne les compressions demandées mais indisponibles (module manquant)."""
+    return [c for c in compress if c == 'br' and not HAS_BROTLI]
@@ -0,0 +1,526 @@
+#!/usr/bin/env python3
+"""
+Service local d'interrogation du jeu de données.
+
+Charge une fois les fichiers produits par create_dataset.py et
+create_references.py (`etablissements_france.json`, `references.json`,
+`references.comparaisons.json`) dans des structures indexées en mémoire, et
+répond en JSON :
+
+- `GET /api/etablissements?bbox=ouest,sud,est,nord&type=ecole,college&secteur=public`
+  établissements d'une emprise, filtrés par type et secteur ;
+- `GET /api/recherche?q=...` : recherche par nom ou commune (voir search_index.py) ;
+- `GET /api/proches?lat=...&lon=...&k=10` (ou `&rayon=5`, en km) : plus proches
+  voisins (voir spatial_index.py), avec les mêmes filtres `type` et `secteur` ;
+- `GET /api/etablissements/<uai>` : fiche détaillée, avec les références
+  (national, région, département) et la position dans chaque groupe ;
+- `GET /api/statut` : effectifs et métadonnées.
+
+Les listes sont paginées (`page`, de 1 à la dernière page, et `par_page`).
+Chaque réponse porte un ETag (empreinte du contenu, requête conditionnelle
+If-None-Match -> 304) et est compressée en gzip si le client l'accepte ; les
+réponses récentes sont gardées en mémoire. Une erreur imprévue donne une
+réponse 500 en JSON. Les requêtes sont servies par un pool de threads, les
+index n'étant plus modifiés après le chargement.
+
+Les autres chemins servent les fichiers du répertoire (front-end compris) :
+
+    python server.py --port 8000
+    # puis http://127.0.0.1:8000/ et http://127.0.0.1:8000/api/statut
+"""
+
+import argparse
+import gzip
+import hashlib
+import json
+import math
+import threading
+import time
+import traceback
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from http import HTTPStatus
+from http.server import HTTPServer, SimpleHTTPRequestHandler
+from pathlib import Path
+from urllib.parse import parse_qs, unquote, urlsplit
+
+import academies
+import columnar
+import search_index
+import serialization
+import spatial_index
+
+DATASET = 'etablissements_france.json'
+DATASET_COLUMNAR = 'etablissements_france.columns.json'
+REFERENCES = 'references.json'
+COMPARISONS = 'references.comparaisons.json'
+
+TYPES = ('ecole', 'college', 'lycee')
+SECTEURS = ('public', 'prive')
+
+# Pagination
+DEFAULT_PER_PAGE = 100
+MAX_PER_PAGE = 1000
+
+# Plus proches voisins
+DEFAULT_NEIGHBOURS = 10
+MAX_NEIGHBOURS = 200
+MAX_RADIUS_KM = 100
+
+# Taille des cellules de la grille des emprises (degrés)
+GRID_CELL = 0.25
+
+# Réponses plus petites que ce seuil envoyées sans compression (octets)
+GZIP_MIN_SIZE = 1024
+GZIP_LEVEL = 5
+
+# Nombre de réponses gardées en mémoire
+RESPONSE_CACHE_SIZE = 2048
+
+# Threads servant les requêtes ; délai d'inactivité d'une connexion persistante (s)
+DEFAULT_WORKERS = 32
+KEEP_ALIVE_TIMEOUT = 15
+
+
+class QueryError(ValueError):
+    """Requête invalide (réponse 400) ou ressource inconnue (`status` 404)."""
+
+    def __init__(self, message, status=HTTPStatus.BAD_REQUEST):
+        super().__init__(message)
+        self.status = status
+
+
+def load_json(filepath):
+    with open(filepath, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+class Dataset:
+    """Établissements, références et index en mémoire.
+
+    - `by_uai` : positions des établissements de chaque UAI (un collège et un
+      lycée peuvent partager le leur) ;
+    - `grid` : pour chaque (type, secteur), positions par cellule de
+      GRID_CELL degrés, pour les requêtes par emprise ;
+    - `spatial` et `search` : index des plus proches voisins et de recherche.
+    """
+
+    def __init__(self, etablissements, metadata=None, references=None, comparaisons=None):
+        self.etablissements = etablissements
+        self.metadata = metadata or {}
+        self.references = references
+        self.comparaisons = comparaisons
+
+        self.by_uai = {}
+        self.categories = {}
+        self.grid = {}
+        for position, etab in enumerate(etablissements):
+            self.by_uai.setdefault(etab.get('uai'), []).append(position)
+            category = (etab.get('type'), etab.get('secteur'))
+            self.categories.setdefault(category, []).append(position)
+            lat, lon = etab.get('latitude'), etab.get('longitude')
+            if lat is not None and lon is not None:
+                cells = self.grid.setdefault(category, {})
+                cells.setdefault((math.floor(lat / GRID_CELL), math.floor(lon / GRID_CELL)), []).append(position)
+
+        self.spatial = spatial_index.SpatialIndex(etablissements)
+        self.search = search_index.SearchIndex(search_index.build_index(etablissements), etablissements)
+
+        # Références départementales indexées par nom (comme create_references.calculate_comparisons)
+        self.departements = {}
+        if references is not None:
+            for ref in references['par_departement'].values():
+                self.departements[ref['nom']] = ref
+
+    @classmethod
+    def load(cls, directory):
+        """Charge les fichiers du répertoire ; le format colonnaire sert à défaut du JSON."""
+        directory = Path(directory)
+        if (directory / DATASET).exists():
+            dataset = load_json(directory / DATASET)
+        elif (directory / DATASET_COLUMNAR).exists():
+            dataset = columnar.read(directory / DATASET_COLUMNAR)
+        else:
+            raise FileNotFoundError(f"{directory / DATASET} introuvable (lancer create_dataset.py)")
+        references = None
+        if (directory / REFERENCES).exists():
+            references = load_json(directory / REFERENCES)['references']
+        comparaisons = None
+        if (directory / COMPARISONS).exists():
+            comparaisons = load_json(directory / COMPARISONS)
+        return cls(dataset['etablissements'], dataset.get('metadata'), references, comparaisons)
+
+    def _categories(self, types, secteurs):
+        return [(type_, secteur) for type_, secteur in self.categories
+                if (types is None or type_ in types) and (secteurs is None or secteur in secteurs)]
+
+    def filter(self, bbox=None, types=None, secteurs=None):
+        """Retourne les positions (ordre du jeu de données) des établissements d'une emprise et des filtres.
+
+        `bbox` : (ouest, sud, est, nord) en degrés, ou None pour ne pas filtrer
+        par position (les établissements sans coordonnées sont alors inclus).
+        """
+        categories = self._categories(types, secteurs)
+        if bbox is None:
+            return sorted(p for category in categories for p in self.categories[category])
+
+        west, south, east, north = bbox
+        rows = range(math.floor(south / GRID_CELL), math.floor(north / GRID_CELL) + 1)
+        cols = range(math.floor(west / GRID_CELL), math.floor(east / GRID_CELL) + 1)
+        etablissements = self.etablissements
+        found = []
+        for category in categories:
+            cells = self.grid.get(category, {})
+            # Emprise plus grande que la grille occupée : parcourir les cellules occupées
+            if len(rows) * len(cols) > len(cells):
+                keys = [key for key in cells if key[0] in rows and key[1] in cols]
+            else:
+                keys = [(row, col) for row in rows for col in cols if (row, col) in cells]
+            for key in keys:
+                for position in cells[key]:
+                    etab = etablissements[position]
+                    if south <= etab['latitude'] <= north and west <= etab['longitude'] <= east:
+                        found.append(position)
+        found.sort()
+        return found
+
+    def search_names(self, query, types=None, secteurs=None):
+        """Recherche par nom ou commune (ordre de pertinence de search_index)."""
+        return [etab for etab in self.search.search(query, limit=0)
+                if (types is None or etab['type'] in types) and (secteurs is None or etab['secteur'] in secteurs)]
+
+    def nearest(self, lat, lon, k=DEFAULT_NEIGHBOURS, radius_km=None, types=None, secteurs=None):
+        """Retourne [(distance_km, établissement)] : les `k` plus proches, ou tous ceux à moins de `radius_km`."""
+        # Un arbre par (type, secteur) : chaque combinaison filtrée est interrogée directement
+        hits = []
+        for type_ in types or (None,):
+            for secteur in secteurs or (None,):
+                if radius_km is not None:
+                    hits.extend(self.spatial.within(lat, lon, radius_km, type_, secteur))
+                else:
+                    hits.extend(self.spatial.nearest(lat, lon, k, type_, secteur))
+        hits.sort(key=lambda hit: hit[0])
+        return hits if radius_km is not None else hits[:k]
+
+    def references_of(self, etab):
+        """Références des groupes d'un établissement (national, région, académie, département) pour son type."""
+        if self.references is None:
+            return None
+        key = f"{etab['type']}s"
+        region = self.references['par_region'].get(etab.get('region') or '')
+        academie = self.references.get('par_academie', {}).get(academies.academie_of(etab.get('code_departement')))
+        departement = self.departements.get(etab.get('departement') or '')
+        return {
+            'national': self.references['national'].get(key),
+            'region': region.get(key) if region else None,
+            'academie': academie.get(key) if academie else None,
+            'departement': departement.get(key) if departement else None
+        }
+
+    def comparisons_of(self, etab):
+        """Position de l'établissement dans ses groupes : {niveau: {percentile, z, bande}} (voir js/comparisons.js)."""
+        if self.comparaisons is None:
+            return None
+        row = self.comparaisons['par_type'].get(etab['type'], {}).get(etab['uai'])
+        if row is None:
+            return None
+        width = len(self.comparaisons['champs'])
+        result = {}
+        for index, level in enumerate(self.comparaisons['niveaux']):
+            percentile, z, band = row[index * width:(index + 1) * width]
+            result[level] = None if band is None else {
+                'percentile': percentile, 'z': z, 'bande': self.comparaisons['bandes'][band]}
+        return result
+
+    def detail(self, uai):
+        """Fiches des établissements d'un UAI, avec références et positions."""
+        return [{**self.etablissements[position],
+                 'references': self.references_of(self.etablissements[position]),
+                 'comparaisons': self.comparisons_of(self.etablissements[position])}
+                for position in self.by_uai.get(uai, [])]
+
+
+def _single(query, name, default=None):
+    values = query.get(name)
+    return values[-1] if values else default
+
+
+def _choices(query, name, allowed):
+    """Valeurs d'un filtre à choix multiples (`type=ecole,college`), None si absent."""
+    value = _single(query, name)
+    if value is None or value == '':
+        return None
+    values = [v.strip() for v in value.split(',') if v.strip()]
+    unknown = [v for v in values if v not in allowed]
+    if unknown:
+        raise QueryError(f"{name} inconnu : {', '.join(unknown)} (attendu : {', '.join(allowed)})")
+    return tuple(dict.fromkeys(values))
+
+
+def _number(query, name, type_=float, default=None, minimum=None, maximum=None):
+    value = _single(query, name)
+    if value is None or value == '':
+        if default is None:
+            raise QueryError(f"paramètre {name} requis")
+        return default
+    try:
+        number = type_(value)
+    except ValueError:
+        raise QueryError(f"{name} invalide : {value!r}") from None
+    if isinstance(number, float) and not math.isfinite(number):
+        raise QueryError(f"{name} invalide : {value!r}")
+    if (minimum is not None and number < minimum) or (maximum is not None and number > maximum):
+        raise QueryError(f"{name} hors limites : {value} (de {minimum} à {maximum})")
+    return number
+
+
+def _bbox(query):
+    value = _single(query, 'bbox')
+    if not value:
+        return None
+    try:
+        west, south, east, north = (float(v) for v in value.split(','))
+    except ValueError:
+        raise QueryError(f"bbox invalide : {value!r} (attendu : ouest,sud,est,nord)") from None
+    if not (-180 <= west <= east <= 180 and -90 <= south <= north <= 90):
+        raise QueryError(f"bbox invalide : {value!r} (attendu : ouest,sud,est,nord, ouest <= est, sud <= nord)")
+    return west, south, east, north
+
+
+def paginate(items, query):
+    """Découpe une liste selon `page` et `par_page` ; retourne l'enveloppe de la réponse."""
+    per_page = _number(query, 'par_page', int, DEFAULT_PER_PAGE, minimum=1, maximum=MAX_PER_PAGE)
+    pages = max(1, math.ceil(len(items) / per_page))
+    page = _number(query, 'page', int, 1, minimum=1, maximum=pages)
+    start = (page - 1) * per_page
+    return {
+        'total': len(items),
+        'page': page,
+        'par_page': per_page,
+        'pages': pages,
+        'resultats': items[start:start + per_page]
+    }
+
+
+class QueryService:
+    """Traduit les requêtes de l'API en appels à `Dataset` et met en cache les réponses encodées."""
+
+    def __init__(self, dataset):
+        self.dataset = dataset
+        self._cache = OrderedDict()
+        self._lock = threading.Lock()
+
+    def route(self, path, query):
+        """Retourne la réponse (objet JSON) d'un chemin de l'API ; QueryError si la requête est invalide."""
+        dataset = self.dataset
+        if path == '/api/statut':
+            par_type = {}
+            for etab in dataset.etablissements:
+                par_type[etab['type']] = par_type.get(etab['type'], 0) + 1
+            return {
+                'etablissements': len(dataset.etablissements),
+                'par_type': par_type,
+                'references': dataset.references is not None,
+                'comparaisons': dataset.comparaisons is not None,
+                'metadata': dataset.metadata
+            }
+
+        types = _choices(query, 'type', TYPES)
+        secteurs = _choices(query, 'secteur', SECTEURS)
+
+        if path == '/api/etablissements':
+            positions = dataset.filter(_bbox(query), types, secteurs)
+            page = paginate(positions, query)
+            page['resultats'] = [dataset.etablissements[p] for p in page['resultats']]
+            return page
+
+        if path.startswith('/api/etablissements/'):
+            uai = unquote(path[len('/api/etablissements/'):]).strip().upper()
+            fiches = dataset.detail(uai)
+            if not fiches:
+                raise QueryError(f"établissement inconnu : {uai}", HTTPStatus.NOT_FOUND)
+            return {'uai': uai, 'etablissements': fiches}
+
+        if path == '/api/recherche':
+            text = (_single(query, 'q') or '').strip()
+            if len(search_index.normalize(text)) < search_index.MIN_QUERY_LENGTH:
+                raise QueryError(f"q : au moins {search_index.MIN_QUERY_LENGTH} caractères")
+            return paginate(dataset.search_names(text, types, secteurs), query)
+
+        if path == '/api/proches':
+            lat = _number(query, 'lat', minimum=-90, maximum=90)
+            lon = _number(query, 'lon', minimum=-180, maximum=180)
+            radius = None
+            if _single(query, 'rayon'):
+                radius = _number(query, 'rayon', minimum=0, maximum=MAX_RADIUS_KM)
+            k = _number(query, 'k', int, DEFAULT_NEIGHBOURS, minimum=1, maximum=MAX_NEIGHBOURS)
+            hits = dataset.nearest(lat, lon, k, radius, types, secteurs)
+            return paginate([{**etab, 'distance_km': round(distance, 3)} for distance, etab in hits], query)
+
+        raise QueryError(f"chemin inconnu : {path}", HTTPStatus.NOT_FOUND)
+
+    def respond(self, path, query_string):
+        """Retourne (statut, corps JSON, ETag) d'une requête, depuis le cache si possible."""
+        query = parse_qs(query_string, keep_blank_values=True)
+        key = (path, tuple(sorted((name, tuple(values)) for name, values in query.items())))
+        with self._lock:
+            cached = self._cache.get(key)
+            if cached is not None:
+                self._cache.move_to_end(key)
+                return cached
+
+        try:
+            status, body = HTTPStatus.OK, serialization.encode(self.route(path, query))
+        except QueryError as error:
+            status, body = error.status, serialization.encode({'erreur': str(error)})
+        except Exception:
+            # Erreur imprévue : réponse 500 (non mise en cache) plutôt qu'une connexion coupée
+            traceback.print_exc()
+            body = serialization.encode({'erreur': 'erreur interne du serveur'})
+            return HTTPStatus.INTERNAL_SERVER_ERROR, body, f'"{hashlib.blake2b(body, digest_size=16).hexdigest()}"'
+        response = (status, body, f'"{hashlib.blake2b(body, digest_size=16).hexdigest()}"')
+
+        with self._lock:
+            self._cache[key] = response
+            if len(self._cache) > RESPONSE_CACHE_SIZE:
+                self._cache.popitem(last=False)
+        return response
+
+
+class QueryHandler(SimpleHTTPRequestHandler):
+    """Requêtes de l'API (`/api/...`) ; les autres chemins servent les fichiers du répertoire."""
+
+    protocol_version = 'HTTP/1.1'
+    server_version = 'EtablissementsHTTP/1'
+    timeout = KEEP_ALIVE_TIMEOUT
+    # En-têtes et corps sont écrits séparément : sans TCP_NODELAY, l'algorithme
+    # de Nagle retarde chaque réponse d'une connexion persistante (~40 ms)
+    disable_nagle_algorithm = True
+
+    def do_GET(self):
+        url = urlsplit(self.path)
+        if url.path == '/api' or url.path.startswith('/api/'):
+            self.send_api(url.path.rstrip('/'), url.query)
+        else:
+            super().do_GET()
+
+    def send_api(self, path, query_string):
+        status, body, etag = self.server.service.respond(path, query_string)
+
+        if status == HTTPStatus.OK and etag in self.headers.get('If-None-Match', ''):
+            self.send_response(HTTPStatus.NOT_MODIFIED)
+            self.send_header('ETag', etag)
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+            return
+
+        encoding = None
+        if len(body) >= GZIP_MIN_SIZE and 'gzip' in self.headers.get('Accept-Encoding', ''):
+            body = self.server.service_gzip(etag, body)
+            encoding = 'gzip'
+
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.send_header('ETag', etag)
+        self.send_header('Cache-Control', 'no-cache')
+        self.send_header('Vary', 'Accept-Encoding')
+        self.send_header('Access-Control-Allow-Origin', '*')
+        if encoding:
+            self.send_header('Content-Encoding', encoding)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        if not self.server.quiet:
+            super().log_message(format, *args)
+
+
+class QueryServer(HTTPServer):
+    """Serveur HTTP dont les connexions sont servies par un pool de threads."""
+
+    # File d'attente des connexions : la valeur par défaut (5) fait attendre les
+    # clients simultanés au-delà (nouvelle tentative de connexion après 1 s)
+    request_queue_size = 128
+
+    def __init__(self, address, handler, service, workers=DEFAULT_WORKERS, quiet=False):
+        super().__init__(address, handler)
+        self.service = service
+        self.quiet = quiet
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='requete')
+        self._gzipped = OrderedDict()
+        self._gzip_lock = threading.Lock()
+
+    def process_request(self, request, client_address):
+        self.executor.submit(self._process_request, request, client_address)
+
+    def _process_request(self, request, client_address):
+        try:
+            self.finish_request(request, client_address)
+        except Exception:
+            self.handle_error(request, client_address)
+        finally:
+            self.shutdown_request(request)
+
+    def service_gzip(self, etag, body):
+        """Retourne le corps compressé d'une réponse (gardé en mémoire, indexé par ETag)."""
+        with self._gzip_lock:
+            compressed = self._gzipped.get(etag)
+            if compressed is not None:
+                self._gzipped.move_to_end(etag)
+                return compressed
+        compressed = gzip.compress(body, compresslevel=GZIP_LEVEL, mtime=0)
+        with self._gzip_lock:
+            self._gzipped[etag] = compressed
+            if len(self._gzipped) > RESPONSE_CACHE_SIZE:
+                self._gzipped.popitem(last=False)
+        return compressed
+
+    def server_close(self):
+        super().server_close()
+        self.executor.shutdown(wait=False, cancel_futures=True)
+
+
+def make_server(directory, host='127.0.0.1', port=8000, workers=DEFAULT_WORKERS, quiet=False):
+    """Charge le jeu de données de `directory` et retourne le serveur prêt à démarrer."""
+    dataset = Dataset.load(directory)
+    handler = partial(QueryHandler, directory=str(directory))
+    return QueryServer((host, port), handler, QueryService(dataset), workers, quiet)
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Service local d'interrogation du jeu de données.")
+    parser.add_argument('--host', default='127.0.0.1', help="adresse d'écoute (défaut : 127.0.0.1)")
+    parser.add_argument('--port', type=int, default=8000, help="port (défaut : 8000, 0 : port libre)")
+    parser.add_argument('--dir', type=Path, default=Path(__file__).parent,
+                        help="répertoire des fichiers produits (défaut : celui du script)")
+    parser.add_argument('--workers', type=int, default=DEFAULT_WORKERS,
+                        help=f"nombre de threads servant les requêtes (défaut : {DEFAULT_WORKERS})")
+    parser.add_argument('--quiet', action='store_true', help="ne pas journaliser chaque requête")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+
+    print(f"Chargement des données de {args.dir}...")
+    debut = time.perf_counter()
+    server = make_server(args.dir, args.host, args.port, args.workers, args.quiet)
+    dataset = server.service.dataset
+    print(f"  - {len(dataset.etablissements)} établissements indexés en {time.perf_counter() - debut:.2f} s"
+          f" (références : {'oui' if dataset.references is not None else 'non'},"
+          f" comparaisons : {'oui' if dataset.comparaisons is not None else 'non'})")
+
+    host, port = server.server_address[:2]
+    print(f"Service disponible sur http://{host}:{port}/api/statut ({args.workers} threads)", flush=True)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        print("\nArrêt du service")
+    finally:
+        server.server_close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,166 @@
+"""
+Découpage du jeu de données en un fichier par département.
+
+create_dataset.py écrit `shards/<code_departement>.json` (les établissements
+du département) et le manifeste `shards/index.json` (nom, région, effectifs
+et emprise géographique de chaque département). create_references.py ajoute
+ensuite à chaque fichier les références `par_departement` correspondantes.
+
+Le front-end ne charge ainsi que les départements visibles sur la carte. Les
+fichiers sont écrits par serialization.write_json, avec leurs copies
+compressées éventuelles.
+"""
+
+import json
+import re
+import shutil
+from pathlib import Path
+
+import academies
+import serialization
+
+MANIFEST = 'index.json'
+
+# Fichier des établissements sans code département
+UNKNOWN_CODE = 'inconnu'
+
+# Champs lus pour répartir les établissements et construire le manifeste
+MANIFEST_FIELDS = ('code_departement', 'departement', 'region', 'type', 'latitude', 'longitude')
+
+
+def shard_name(code):
+    """Retourne le nom de fichier (sans extension) du département `code`.
+
+    Le code est normalisé (voir academies.normalize_code) : « 01 » et « 001 »
+    désignent le même fichier.
+    """
+    code = academies.normalize_code(code)
+    if not code:
+        return UNKNOWN_CODE
+    return re.sub(r'[^0-9A-Za-z_-]', '_', code)
+
+
+def build_shards(etablissements):
+    """Répartit les établissements par département, en un seul parcours.
+
+    `etablissements` ne contient que les champs MANIFEST_FIELDS (voir
+    `records.RecordTable.select`) ; un champ absent vaut None.
+
+    Retourne {nom de fichier: {'manifest': entrée du manifeste, 'positions': [...]}},
+    `positions` donnant les indices des établissements du département.
+    """
+    shards = {}
+
+    for position, etab in enumerate(etablissements):
+        name = shard_name(etab.get('code_departement'))
+        shard = shards.get(name)
+        if shard is None:
+            shard = shards[name] = {
+                'manifest': {
+                    'file': f'{name}.json',
+                    'code': etab['code_departement'] or '',
+                    'departement': etab['departement'] or '',
+                    'region': etab['region'] or '',
+                    'count': 0,
+                    'par_type': {},
+                    'bbox': None
+                },
+                'positions': []
+            }
+        shard['positions'].append(position)
+
+        entry = shard['manifest']
+        entry['count'] += 1
+        entry['par_type'][etab['type']] = entry['par_type'].get(etab['type'], 0) + 1
+
+        lat, lon = etab['latitude'], etab['longitude']
+        if lat is not None and lon is not None:
+            bbox = entry['bbox']
+            if bbox is None:
+                entry['bbox'] = [lat, lon, lat, lon]  # sud, ouest, nord, est
+            else:
+                bbox[0] = min(bbox[0], lat)
+                bbox[1] = min(bbox[1], lon)
+                bbox[2] = max(bbox[2], lat)
+                bbox[3] = max(bbox[3], lon)
+
+    return shards
+
+
+def write_shards(etablissements, output_dir, metadata=None, compress=()):
+    """Écrit un fichier par département et le manifeste. Retourne le nombre de fichiers.
+
+    `etablissements` est une séquence (liste ou `records.RecordTable`) : la
+    répartition ne lit que les champs du manifeste, et chaque établissement
+    n'est reconstruit qu'une fois, au moment d'écrire le fichier de son
+    département. Un répertoire existant (reconnu à son manifeste) est remplacé.
+    `compress` : copies compressées de chaque fichier (voir serialization.write_json).
+    """
+    output_dir = Path(output_dir)
+    if (output_dir / MANIFEST).exists():
+        shutil.rmtree(output_dir)
+    output_dir.mkdir(parents=True, exist_ok=True)
+
+    if hasattr(etablissements, 'select'):
+        fields = etablissements.select(*MANIFEST_FIELDS)
+    else:
+        fields = [{path: etab.get(path) for path in MANIFEST_FIELDS} for etab in etablissements]
+    shards = build_shards(fields)
+    del fields
+    for name, shard in sorted(shards.items()):
+        serialization.write_json({'departement': shard['manifest'],
+                                  'etablissements': [etablissements[i] for i in shard['positions']]},
+                                 output_dir / shard['manifest']['file'], stream_key='etablissements',
+                                 compress=compress)
+
+    manifest = {
+        'version': 1,
+        'metadata': metadata or {},
+        'shards': {name: shard['manifest'] for name, shard in sorted(shards.items())}
+    }
+    serialization.write_json(manifest, output_dir / MANIFEST, compress=compress)
+
+    return len(shards)
+
+
+def add_references(output_dir, par_departement, comparaisons=None, compress=()):
+    """Ajoute à chaque fichier de département ses références `par_departement`.
+
+    Avec `comparaisons` (table {type: {uai: ligne}} de create_references.py),
+    chaque fichier reçoit aussi les lignes de ses établissements.
+
+    Les copies compressées `compress` sont écrites, ainsi que celles déjà
+    présentes (écrites par create_dataset.py), qui resteraient sinon périmées.
+
+    Retourne le nombre de fichiers mis à jour (0 si aucun découpage n'existe).
+    """
+    output_dir = Path(output_dir)
+    manifest_path = output_dir / MANIFEST
+    if not manifest_path.exists():
+        return 0
+
+    with open(manifest_path, 'r', encoding='utf-8') as f:
+        manifest = json.load(f)
+
+    # Regrouper les références par fichier de département
+    by_shard = {}
+    for key, reference in par_departement.items():
+        by_shard.setdefault(shard_name(reference.get('code')), {})[key] = reference
+
+    for name, entry in manifest['shards'].items():
+        shard_path = output_dir / entry['file']
+        with open(shard_path, 'r', encoding='utf-8') as f:
+            shard = json.load(f)
+        shard['references'] = by_shard.get(name, {})
+        if comparaisons is not None:
+            rows = {}
+            for etab in shard['etablissements']:
+                row = comparaisons.get(etab['type'], {}).get(etab['uai'])
+                if row is not None:
+                    rows.setdefault(etab['type'], {})[etab['uai']] = row
+            shard['comparaisons'] = rows
+        existing = [c for c in serialization.COMPRESSIONS if Path(f'{shard_path}.{c}').exists()]
+        serialization.write_json(shard, shard_path, stream_key='etablissements',
+                                 compress=list(dict.fromkeys([*compress, *existing])))
+
+    return len(manifest['shards'])
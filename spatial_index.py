@@ -0,0 +1,277 @@
+#!/usr/bin/env python3
+"""
+Index spatial des établissements : plus proches voisins et recherche par rayon.
+
+Les positions sont projetées sur la sphère unité (x, y, z) et rangées dans des
+arbres k-d équilibrés implicites : les points sont réordonnés de sorte que le
+nœud d'un intervalle [début, fin) soit son milieu, l'axe de découpe étant
+stocké pour chaque position. La distance entre deux points sur la sphère
+(corde) croît avec la distance à vol d'oiseau, ce qui rend les requêtes
+exactes partout, outre-mer compris.
+
+L'index se sérialise en JSON (positions, ordre et axes de chaque arbre) pour être
+réutilisé tel quel par le front-end (js/spatial.js).
+"""
+
+import argparse
+import heapq
+import json
+import math
+from pathlib import Path
+
+import columnar
+import serialization
+
+EARTH_RADIUS_KM = 6371.0088
+
+FORMAT_VERSION = 1
+
+# Index écrit par create_dataset.py --spatial-index, à côté du jeu de données
+INDEX_FILE = 'etablissements_france.spatial.json'
+
+
+def to_xyz(lat, lon):
+    """Projette une position (degrés) sur la sphère unité."""
+    phi = math.radians(lat)
+    lam = math.radians(lon)
+    cos_phi = math.cos(phi)
+    return (cos_phi * math.cos(lam), cos_phi * math.sin(lam), math.sin(phi))
+
+
+def chord_to_km(chord):
+    """Convertit une distance en corde (sphère unité) en kilomètres."""
+    return 2 * EARTH_RADIUS_KM * math.asin(min(chord / 2, 1.0))
+
+
+def km_to_chord(km):
+    """Convertit une distance en kilomètres en corde sur la sphère unité."""
+    return 2 * math.sin(min(km / (2 * EARTH_RADIUS_KM), math.pi / 2))
+
+
+class KDTree:
+    """Arbre k-d implicite sur un ensemble de points de la sphère unité."""
+
+    def __init__(self, coords, order=None, axes=None):
+        """Construit l'arbre sur `coords`, ou reprend un ordre et des axes déjà calculés.
+
+        `order` donne, pour chaque position de l'arbre, l'indice du point dans `coords`.
+        """
+        if order is None:
+            order = list(range(len(coords)))
+            axes = [0] * len(coords)
+            self._build(order, axes, coords, 0, len(coords))
+        self.order = order
+        self.axes = axes
+        self.coords = [coords[i] for i in order]
+
+    @staticmethod
+    def _build(order, axes, coords, lo, hi):
+        """Range récursivement order[lo:hi] autour de son milieu, sur l'axe de plus grande étendue."""
+        if hi - lo <= 1:
+            return
+        spans = []
+        for axis in range(3):
+            values = [coords[i][axis] for i in order[lo:hi]]
+            spans.append(max(values) - min(values))
+        axis = spans.index(max(spans))
+
+        order[lo:hi] = sorted(order[lo:hi], key=lambda i: coords[i][axis])
+        mid = (lo + hi) // 2
+        axes[mid] = axis
+        KDTree._build(order, axes, coords, lo, mid)
+        KDTree._build(order, axes, coords, mid + 1, hi)
+
+    def nearest(self, target, k):
+        """Retourne les k points les plus proches de `target` : [(corde², indice)], triés."""
+        coords, axes = self.coords, self.axes
+        heap = []  # (-corde², position), les k meilleurs
+
+        def search(lo, hi):
+            if lo >= hi:
+                return
+            mid = (lo + hi) // 2
+            point = coords[mid]
+            dist2 = ((point[0] - target[0]) ** 2 + (point[1] - target[1]) ** 2
+                     + (point[2] - target[2]) ** 2)
+            if len(heap) < k:
+                heapq.heappush(heap, (-dist2, mid))
+            elif dist2 < -heap[0][0]:
+                heapq.heapreplace(heap, (-dist2, mid))
+
+            diff = target[axes[mid]] - point[axes[mid]]
+            near, far = ((lo, mid), (mid + 1, hi)) if diff < 0 else ((mid + 1, hi), (lo, mid))
+            search(*near)
+            if len(heap) < k or diff * diff < -heap[0][0]:
+                search(*far)
+
+        search(0, len(coords))
+        return sorted((-d, self.order[i]) for d, i in heap)
+
+    def within(self, target, radius2):
+        """Retourne les points à une corde² inférieure à `radius2` : [(corde², indice)], non triés."""
+        coords, axes = self.coords, self.axes
+        found = []
+        stack = [(0, len(coords))]
+
+        while stack:
+            lo, hi = stack.pop()
+            if lo >= hi:
+                continue
+            mid = (lo + hi) // 2
+            point = coords[mid]
+            dist2 = ((point[0] - target[0]) ** 2 + (point[1] - target[1]) ** 2
+                     + (point[2] - target[2]) ** 2)
+            if dist2 <= radius2:
+                found.append((dist2, self.order[mid]))
+
+            diff = target[axes[mid]] - point[axes[mid]]
+            if diff < 0 or diff * diff <= radius2:
+                stack.append((lo, mid))
+            if diff >= 0 or diff * diff <= radius2:
+                stack.append((mid + 1, hi))
+
+        return found
+
+
+class SpatialIndex:
+    """Index spatial des établissements géolocalisés.
+
+    Un arbre couvre tous les établissements, et un arbre par couple
+    (type, secteur) sert les requêtes filtrées : un filtre n'oblige jamais à
+    parcourir les établissements qui ne le satisfont pas.
+    """
+
+    def __init__(self, etablissements, trees=None):
+        """Construit l'index, ou reprend des arbres sérialisés (voir `from_dict`)."""
+        self.etablissements = [e for e in etablissements
+                               if e.get('latitude') is not None and e.get('longitude') is not None]
+        self.coords = [to_xyz(e['latitude'], e['longitude']) for e in self.etablissements]
+
+        if trees is None:
+            categories = {}
+            for i, e in enumerate(self.etablissements):
+                categories.setdefault((e['type'], e['secteur']), []).append(i)
+            trees = {'all': (None, None)}
+            for category, members in sorted(categories.items()):
+                tree = KDTree([self.coords[i] for i in members])
+                trees['/'.join(category)] = ([members[i] for i in tree.order], tree.axes)
+
+        self.trees = {}
+        for name, (order, axes) in trees.items():
+            if order is None:
+                self.trees[name] = KDTree(self.coords)
+            else:
+                self.trees[name] = KDTree(self.coords, order, axes)
+
+    def __len__(self):
+        return len(self.etablissements)
+
+    def _trees_for(self, type=None, secteur=None):
+        """Retourne les arbres à interroger pour un filtre sur le type et le secteur."""
+        if type is None and secteur is None:
+            return [self.trees['all']]
+        return [tree for name, tree in self.trees.items()
+                if name != 'all' and (type is None or name.split('/')[0] == type)
+                and (secteur is None or name.split('/')[1] == secteur)]
+
+    def nearest(self, lat, lon, k=10, type=None, secteur=None):
+        """Retourne les `k` établissements les plus proches, triés : [(distance_km, établissement)]."""
+        if k <= 0:
+            return []
+        target = to_xyz(lat, lon)
+        found = [hit for tree in self._trees_for(type, secteur) for hit in tree.nearest(target, k)]
+        return [(chord_to_km(math.sqrt(d)), self.etablissements[i]) for d, i in heapq.nsmallest(k, found)]
+
+    def within(self, lat, lon, radius_km, type=None, secteur=None):
+        """Retourne les établissements à moins de `radius_km`, triés : [(distance_km, établissement)]."""
+        target = to_xyz(lat, lon)
+        radius2 = km_to_chord(radius_km) ** 2
+        found = [hit for tree in self._trees_for(type, secteur) for hit in tree.within(target, radius2)]
+        found.sort()
+        return [(chord_to_km(math.sqrt(d)), self.etablissements[i]) for d, i in found]
+
+    def to_dict(self):
+        """Sérialise l'index : positions des établissements, puis ordre et axes de chaque arbre."""
+        return {
+            'version': FORMAT_VERSION,
+            'uai': [e['uai'] for e in self.etablissements],
+            'type': [e['type'] for e in self.etablissements],
+            'secteur': [e['secteur'] for e in self.etablissements],
+            'latitude': [e['latitude'] for e in self.etablissements],
+            'longitude': [e['longitude'] for e in self.etablissements],
+            'trees': {name: {'order': tree.order, 'axis': tree.axes} for name, tree in self.trees.items()}
+        }
+
+    @classmethod
+    def from_dict(cls, data, etablissements):
+        """Reconstruit un index sérialisé, sans nouveau tri, à partir des établissements.
+
+        ValueError si l'index ne correspond pas aux établissements (version du
+        format, établissement absent ou déplacé) : les arbres seraient faux.
+        """
+        if data.get('version') != FORMAT_VERSION:
+            raise ValueError(f"Version d'index spatial non supportée: {data.get('version')}")
+        by_key = {(e['uai'], e['type']): e for e in etablissements}
+        ordered = []
+        for key, lat, lon in zip(zip(data['uai'], data['type']), data['latitude'], data['longitude']):
+            etab = by_key.get(key)
+            if etab is None or (etab.get('latitude'), etab.get('longitude')) != (lat, lon):
+                raise ValueError(f"Index spatial périmé : {key[1]} {key[0]} absent ou déplacé dans le jeu de données")
+            ordered.append(etab)
+        trees = {name: (tree['order'], tree['axis']) for name, tree in data['trees'].items()}
+        return cls(ordered, trees)
+
+
+def write_index(index, filepath, compress=()):
+    """Écrit l'index sérialisé (JSON compact, voir serialization.write_json)."""
+    return serialization.write_json(index.to_dict(), filepath, compress=compress)
+
+
+def read_index(filepath, etablissements):
+    """Lit un index sérialisé par `write_index`."""
+    with open(filepath, 'r', encoding='utf-8') as f:
+        return SpatialIndex.from_dict(json.load(f), etablissements)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Recherche des établissements les plus proches d'un point.")
+    parser.add_argument('latitude', type=float)
+    parser.add_argument('longitude', type=float)
+    parser.add_argument('-k', type=int, default=10, help="nombre d'établissements (défaut : 10)")
+    parser.add_argument('--rayon', type=float, default=None,
+                        help="rechercher tous les établissements à moins de RAYON km au lieu des k plus proches")
+    parser.add_argument('--type', choices=['ecole', 'college', 'lycee'], default=None)
+    parser.add_argument('--secteur', choices=['public', 'prive'], default=None)
+    parser.add_argument('--dataset', type=Path,
+                        default=Path(__file__).parent / 'etablissements_france.json',
+                        help="jeu de données (à défaut, sa version colonnaire .columns.json)")
+    parser.add_argument('--index', type=Path, default=None,
+                        help=f"index sérialisé (défaut : {INDEX_FILE} à côté du jeu de données)")
+    parser.add_argument('--rebuild', action='store_true',
+                        help="reconstruire l'index à partir du jeu de données au lieu de lire le fichier")
+    args = parser.parse_args(argv)
+
+    etablissements = columnar.read_dataset(args.dataset)['etablissements']
+    if args.rebuild:
+        index = SpatialIndex(etablissements)
+    else:
+        index_path = args.index or args.dataset.parent / INDEX_FILE
+        if not index_path.exists():
+            raise SystemExit(f"{index_path} introuvable (lancer create_dataset.py --spatial-index, "
+                             "ou utiliser --rebuild)")
+        try:
+            index = read_index(index_path, etablissements)
+        except (ValueError, KeyError) as error:
+            raise SystemExit(f"{index_path} illisible : {error}")
+
+    if args.rayon is not None:
+        results = index.within(args.latitude, args.longitude, args.rayon, args.type, args.secteur)
+    else:
+        results = index.nearest(args.latitude, args.longitude, args.k, args.type, args.secteur)
+
+    for distance, etab in results:
+        print(f"{distance:7.2f} km  {etab['uai']}  {etab['type']:<8} {etab['nom']} ({etab['commune']})")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,41 @@
+"""Chaîne de construction complète sur des sources synthétiques (voir bench.generate_sources)."""
+
+import contextlib
+import io
+import json
+import tempfile
+import unittest
+from pathlib import Path
+
+import bench
+import create_dataset
+import create_references
+
+# Facteur d'échelle des sources synthétiques (quelques centaines d'établissements)
+SCALE = 0.01
+
+
+def run(main, *argv):
+    """Lance le `main` d'un script, sa sortie étant ignorée."""
+    with contextlib.redirect_stdout(io.StringIO()):
+        main([str(arg) for arg in argv])
+
+
+class ColumnarPipelineTest(unittest.TestCase):
+
+    def test_references_from_columnar_build(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            directory = Path(tmp)
+            bench.generate_sources(directory, SCALE)
+            run(create_dataset.main, '--sources', directory, '--dir', directory, '--format', 'columnar', '--no-cache')
+            self.assertFalse((directory / create_dataset.OUTPUT_JSON).exists())
+            self.assertTrue((directory / create_dataset.OUTPUT_COLUMNAR).exists())
+
+            run(create_references.main, '--dir', directory, '--no-cache')
+            with open(directory / 'references.json', 'r', encoding='utf-8') as f:
+                references = json.load(f)
+            self.assertTrue(references['references']['par_departement'])
+
+
+if __name__ == '__main__':
+    unittest.main()
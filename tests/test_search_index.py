@@ -0,0 +1,65 @@
+"""Index de recherche (search_index.py) : requêtes et aller-retour par le fichier sérialisé."""
+
+import contextlib
+import io
+import json
+import tempfile
+import unittest
+from pathlib import Path
+
+import search_index
+
+ETABLISSEMENTS = [
+    {'uai': '0750001A', 'type': 'lycee', 'nom': 'Lycée Victor Hugo', 'commune': 'Paris', 'departement': 'Paris'},
+    {'uai': '0750001A', 'type': 'college', 'nom': 'Collège Victor Hugo', 'commune': 'Paris',
+     'departement': 'Paris'},
+    {'uai': '0690002B', 'type': 'ecole', 'nom': 'École Jules Ferry', 'commune': 'Lyon', 'departement': 'Rhône'},
+    {'uai': '0130003C', 'type': 'ecole', 'nom': 'École du Port', 'commune': 'Marseille',
+     'departement': 'Bouches-du-Rhône'},
+]
+
+
+class SearchIndexFileTest(unittest.TestCase):
+
+    def setUp(self):
+        self.etablissements = [dict(etab) for etab in ETABLISSEMENTS]
+        self.tmp = tempfile.TemporaryDirectory()
+        self.directory = Path(self.tmp.name)
+        self.index_path = self.directory / search_index.INDEX_FILE
+        search_index.write_index(search_index.build_index(self.etablissements), self.index_path)
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_round_trip_answers_like_a_fresh_index(self):
+        fresh = search_index.SearchIndex(search_index.build_index(self.etablissements), self.etablissements)
+        loaded = search_index.read_index(self.index_path, self.etablissements)
+        for query in ('victor', 'hugo', 'ly', 'marseille', 'ecole', 'zzz'):
+            self.assertEqual(loaded.search(query), fresh.search(query))
+        self.assertCountEqual([etab['type'] for etab in loaded.search('victor hugo')], ['college', 'lycee'])
+
+    def test_stale_index_is_rejected(self):
+        del self.etablissements[2]
+        with self.assertRaises(ValueError):
+            search_index.read_index(self.index_path, self.etablissements)
+
+    def test_cli_reads_the_index_file(self):
+        dataset_path = self.directory / 'etablissements_france.json'
+        with open(dataset_path, 'w', encoding='utf-8') as f:
+            json.dump({'metadata': {}, 'etablissements': self.etablissements}, f)
+
+        def run(*argv):
+            output = io.StringIO()
+            with contextlib.redirect_stdout(output):
+                search_index.main(['hugo', '--dataset', str(dataset_path), *argv])
+            return output.getvalue()
+
+        self.assertIn('0750001A', run())
+        self.assertEqual(run(), run('--rebuild'))
+        self.index_path.unlink()
+        with self.assertRaises(SystemExit):
+            run()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,38 @@
+"""Découpage par département (shards.py)."""
+
+import json
+import tempfile
+import unittest
+from pathlib import Path
+
+import shards
+
+
+def etablissement(uai, code_departement):
+    return {'uai': uai, 'type': 'ecole', 'nom': f'École {uai}', 'code_departement': code_departement,
+            'departement': 'Ain', 'region': 'Auvergne-Rhône-Alpes', 'latitude': 46.2, 'longitude': 5.2}
+
+
+class ShardsTest(unittest.TestCase):
+
+    def test_mixed_departement_codes_share_one_shard(self):
+        etablissements = [etablissement('0010001A', '01'), etablissement('0010002B', '001'),
+                          etablissement('02A0001C', '02A')]
+        with tempfile.TemporaryDirectory() as tmp:
+            output_dir = Path(tmp)
+            self.assertEqual(shards.write_shards(etablissements, output_dir), 2)
+            with open(output_dir / shards.MANIFEST, 'r', encoding='utf-8') as f:
+                manifest = json.load(f)
+            self.assertEqual(sorted(manifest['shards']), ['01', '2A'])
+            self.assertEqual(manifest['shards']['01']['count'], 2)
+
+            reference = {'code': '001', 'nom': 'Ain'}
+            self.assertEqual(shards.add_references(output_dir, {'Ain': reference}), 2)
+            with open(output_dir / '01.json', 'r', encoding='utf-8') as f:
+                shard = json.load(f)
+            self.assertEqual(shard['references'], {'Ain': reference})
+            self.assertEqual([etab['uai'] for etab in shard['etablissements']], ['0010001A', '0010002B'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,66 @@
+"""Index spatial (spatial_index.py) : requêtes et aller-retour par le fichier sérialisé."""
+
+import contextlib
+import io
+import json
+import random
+import tempfile
+import unittest
+from pathlib import Path
+
+import spatial_index
+
+
+def etablissements(count=300, seed=0):
+    rng = random.Random(seed)
+    return [{'uai': f'{i:07d}X', 'type': rng.choice(['ecole', 'college', 'lycee']),
+             'secteur': rng.choice(['public', 'prive']), 'nom': f'Établissement {i}', 'commune': 'Commune',
+             'latitude': round(rng.uniform(42, 51), 5), 'longitude': round(rng.uniform(-4.5, 8), 5)}
+            for i in range(count)]
+
+
+class SpatialIndexFileTest(unittest.TestCase):
+
+    def setUp(self):
+        self.etablissements = etablissements()
+        self.tmp = tempfile.TemporaryDirectory()
+        self.directory = Path(self.tmp.name)
+        self.index_path = self.directory / spatial_index.INDEX_FILE
+        spatial_index.write_index(spatial_index.SpatialIndex(self.etablissements), self.index_path)
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_round_trip_answers_like_a_fresh_index(self):
+        fresh = spatial_index.SpatialIndex(self.etablissements)
+        loaded = spatial_index.read_index(self.index_path, self.etablissements)
+        for lat, lon in ((48.85, 2.35), (43.3, 5.4), (45.0, -1.0)):
+            self.assertEqual(loaded.nearest(lat, lon, 5), fresh.nearest(lat, lon, 5))
+            self.assertEqual(loaded.nearest(lat, lon, 5, type='lycee', secteur='prive'),
+                             fresh.nearest(lat, lon, 5, type='lycee', secteur='prive'))
+            self.assertEqual(loaded.within(lat, lon, 50), fresh.within(lat, lon, 50))
+
+    def test_stale_index_is_rejected(self):
+        self.etablissements[10]['latitude'] += 1
+        with self.assertRaises(ValueError):
+            spatial_index.read_index(self.index_path, self.etablissements)
+
+    def test_cli_reads_the_index_file(self):
+        dataset_path = self.directory / 'etablissements_france.json'
+        with open(dataset_path, 'w', encoding='utf-8') as f:
+            json.dump({'metadata': {}, 'etablissements': self.etablissements}, f)
+
+        def run(*argv):
+            output = io.StringIO()
+            with contextlib.redirect_stdout(output):
+                spatial_index.main(['48.85', '2.35', '-k', '3', '--dataset', str(dataset_path), *argv])
+            return output.getvalue()
+
+        self.assertEqual(run(), run('--rebuild'))
+        self.index_path.write_text('{', encoding='utf-8')
+        with self.assertRaises(SystemExit):
+            run()
+
+
+if __name__ == '__main__':
+    unittest.main()
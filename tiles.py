@@ -0,0 +1,163 @@
+"""
+Découpage du jeu de données en tuiles z/x/y pour la carte.
+
+Aux niveaux de zoom faibles, chaque tuile contient des agrégats pré-calculés
+(nombre d'établissements par type et score moyen par type, position moyenne),
+sur une grille de CLUSTER_GRID × CLUSTER_GRID cellules par tuile. Au niveau
+de zoom maximal, chaque tuile contient les établissements eux-mêmes.
+
+Les tuiles suivent le schéma de tuilage Web Mercator (celui d'OpenStreetMap).
+Le manifeste `index.json` liste les tuiles existantes de chaque niveau, pour
+que le client ne demande que des tuiles non vides. Les fichiers sont écrits
+par serialization.write_json, avec leurs copies compressées éventuelles.
+"""
+
+import math
+import shutil
+from pathlib import Path
+
+import ranking
+import serialization
+
+# Nombre de cellules d'agrégation par côté de tuile (puissance de 2)
+CLUSTER_GRID = 8
+CLUSTER_GRID_BITS = 3
+
+DEFAULT_MIN_ZOOM = 5
+DEFAULT_MAX_ZOOM = 12
+
+# Latitude maximale représentable en Web Mercator
+MAX_LATITUDE = 85.05112878
+
+
+def main_score(etab):
+    """Retourne le score principal d'un établissement (métrique principale de ranking.METRICS), ou None."""
+    metric = ranking.primary_metric(etab['type'])
+    if metric is None:
+        return None
+    value = etab
+    for key in metric[1].split('.'):
+        value = value.get(key) if value else None
+    return value
+
+
+def mercator(lat, lon):
+    """Projette une position en coordonnées Web Mercator normalisées (x, y) dans [0, 1)."""
+    lat = max(-MAX_LATITUDE, min(MAX_LATITUDE, lat))
+    x = (lon + 180.0) / 360.0
+    sin_lat = math.sin(math.radians(lat))
+    y = 0.5 - math.log((1 + sin_lat) / (1 - sin_lat)) / (4 * math.pi)
+    return min(max(x, 0.0), 1 - 1e-12), min(max(y, 0.0), 1 - 1e-12)
+
+
+def tile_of(lat, lon, zoom):
+    """Retourne la tuile (x, y) contenant une position au niveau de zoom donné."""
+    x, y = mercator(lat, lon)
+    n = 1 << zoom
+    return int(x * n), int(y * n)
+
+
+def build_tiles(etablissements, min_zoom=DEFAULT_MIN_ZOOM, max_zoom=DEFAULT_MAX_ZOOM):
+    """Répartit les établissements géolocalisés en tuiles.
+
+    Chaque établissement est projeté une seule fois ; son rattachement à une
+    cellule de chaque niveau se déduit ensuite par décalage binaire.
+
+    Retourne {zoom: {(x, y): tuile}} où une tuile est soit une liste
+    d'agrégats (zoom < max_zoom), soit une liste d'établissements.
+    """
+    if not min_zoom <= max_zoom:
+        raise ValueError(f"Plage de zoom invalide: {min_zoom}-{max_zoom}")
+
+    tiles = {zoom: {} for zoom in range(min_zoom, max_zoom + 1)}
+    # Cellules d'agrégation : {zoom: {(cx, cy): agrégat en cours}}
+    cells = {zoom: {} for zoom in range(min_zoom, max_zoom)}
+
+    # Résolution de la grille la plus fine (cellules du niveau max_zoom - 1)
+    bits = max_zoom - 1 + CLUSTER_GRID_BITS
+    resolution = 1 << max(bits, 0)
+
+    for etab in etablissements:
+        lat, lon = etab.get('latitude'), etab.get('longitude')
+        if lat is None or lon is None:
+            continue
+
+        x, y = mercator(lat, lon)
+
+        # Tuile de détail
+        n = 1 << max_zoom
+        tiles[max_zoom].setdefault((int(x * n), int(y * n)), []).append(etab)
+
+        # Agrégats des niveaux inférieurs
+        gx, gy = int(x * resolution), int(y * resolution)
+        score = main_score(etab)
+        for zoom in range(min_zoom, max_zoom):
+            shift = bits - (zoom + CLUSTER_GRID_BITS)
+            cell = cells[zoom].get((gx >> shift, gy >> shift))
+            if cell is None:
+                cell = cells[zoom][(gx >> shift, gy >> shift)] = {
+                    'count': 0, 'lat': 0.0, 'lon': 0.0, 'types': {}, 'scores': {}
+                }
+            cell['count'] += 1
+            cell['lat'] += lat
+            cell['lon'] += lon
+            cell['types'][etab['type']] = cell['types'].get(etab['type'], 0) + 1
+            if score is not None:
+                total, count = cell['scores'].get(etab['type'], (0.0, 0))
+                cell['scores'][etab['type']] = (total + score, count + 1)
+
+    for zoom, zoom_cells in cells.items():
+        for (cx, cy), cell in sorted(zoom_cells.items()):
+            tile = (cx >> CLUSTER_GRID_BITS, cy >> CLUSTER_GRID_BITS)
+            tiles[zoom].setdefault(tile, []).append({
+                'lat': round(cell['lat'] / cell['count'], 5),
+                'lon': round(cell['lon'] / cell['count'], 5),
+                'count': cell['count'],
+                'types': cell['types'],
+                'scores': {t: round(total / count, 2) for t, (total, count) in cell['scores'].items()}
+            })
+
+    return tiles
+
+
+def write_tiles(tiles, output_dir, min_zoom, max_zoom, compress=()):
+    """Écrit les tuiles (`<z>/<x>/<y>.json`) et le manifeste `index.json`.
+
+    Un répertoire de tuiles existant (reconnu à son manifeste) est remplacé.
+    `compress` : copies compressées de chaque fichier (voir serialization.write_json).
+    """
+    output_dir = Path(output_dir)
+    if (output_dir / 'index.json').exists():
+        shutil.rmtree(output_dir)
+    output_dir.mkdir(parents=True, exist_ok=True)
+
+    manifest = {
+        'min_zoom': min_zoom,
+        'max_zoom': max_zoom,
+        'cluster_grid': CLUSTER_GRID,
+        'tiles': {}
+    }
+
+    for zoom, zoom_tiles in tiles.items():
+        manifest['tiles'][str(zoom)] = []
+        for (x, y), content in sorted(zoom_tiles.items()):
+            tile_path = output_dir / str(zoom) / str(x) / f'{y}.json'
+            tile_path.parent.mkdir(parents=True, exist_ok=True)
+            key = 'etablissements' if zoom == max_zoom else 'clusters'
+            serialization.write_json({'z': zoom, 'x': x, 'y': y, key: content}, tile_path, compress=compress)
+            manifest['tiles'][str(zoom)].append(f'{x}/{y}')
+
+    serialization.write_json(manifest, output_dir / 'index.json', compress=compress)
+
+    return sum(len(zoom_tiles) for zoom_tiles in tiles.values())
+
+
+def parse_zoom_range(value):
+    """Convertit une plage de zoom « min-max » en couple d'entiers."""
+    try:
+        min_zoom, max_zoom = (int(part) for part in value.split('-'))
+    except ValueError:
+        raise ValueError(f"Plage de zoom invalide: {value!r} (attendu: min-max, ex. 5-12)")
+    if not 0 <= min_zoom <= max_zoom <= 22:
+        raise ValueError(f"Plage de zoom invalide: {value!r}")
+    return min_zoom, max_zoom